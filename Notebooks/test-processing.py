@@ -23,6 +23,7 @@ sys.path.append(os.path.abspath("../src"))
 
 import preprocess
 import config
+from collections import OrderedDict
 from tqdm import tqdm
 # -
 
@@ -35,9 +36,25 @@ with open("../data/corpus.pkl","rb") as f:
 
 # Preprocessing corpus :
 
+# The build preprocesses one document at a time (see preprocess.process_documents), each step is applied here to the whole corpus to count its effect :
+
 # +
-corpus_without_stp = preprocess.remove_stop_words_collection(corpus,"../data/stop_words.txt")
-corpus_lemmatized = preprocess.lemmatize_collection(corpus_without_stp)
+def remove_stop_words(corpus, stop_words_path):
+    stop_words = set(preprocess.load_stop_words(stop_words_path))
+    return OrderedDict((key, preprocess.remove_stop_words_from_document(corpus[key], stop_words)) for key in tqdm(corpus))
+
+def filter_tokens(corpus):
+    return OrderedDict((key, [token for token in corpus[key] if not preprocess.filter_function(token)]) for key in tqdm(corpus))
+
+def lemmatize(corpus, pos=True):
+    # by batches, like the build, so that the documents of a batch are POS tagged together
+    lemmatized = OrderedDict()
+    for keys in preprocess.batches(tqdm(corpus), 256):
+        lemmatized.update(zip(keys, preprocess.lemmatize_documents([corpus[key] for key in keys], pos)))
+    return lemmatized
+
+corpus_without_stp = remove_stop_words(corpus,"../data/stop_words.txt")
+corpus_lemmatized = lemmatize(corpus_without_stp)
 
 with open("../data/corpus_without_stp", "wb") as f:
     pkl.dump(corpus_without_stp, f)
@@ -147,10 +164,10 @@ plt.title('Most Common Tokens in our Corpus')
 
 # We apply these additional treatments and obtain the following results :
 
-corpus_without_stp = preprocess.remove_stop_words_collection(corpus,"../data/stop_words_extended.txt")
-corpus_filtered = preprocess.filter_collection(corpus_without_stp)
-corpus_lemmatized = preprocess.lemmatize_collection(corpus_filtered)
-final_corpus = preprocess.remove_stop_words_collection(corpus_lemmatized,"../data/stop_words_extended.txt")
+corpus_without_stp = remove_stop_words(corpus,"../data/stop_words_extended.txt")
+corpus_filtered = filter_tokens(corpus_without_stp)
+corpus_lemmatized = lemmatize(corpus_filtered)
+final_corpus = remove_stop_words(corpus_lemmatized,"../data/stop_words_extended.txt")
 
 # +
 most_frequents = get_frequencies(final_corpus).most_common(50)
@@ -194,10 +211,10 @@ print("vocabulary size : \n" +
 
 # In our first version of the program, we used Part-Of-Speach tagging to find the proper lemmatization for each token. However, this is really time consuming, as the lemmatization process is the slowest in our preprocessing chain. For faster preprocessing, we used the snowball stemmer alone which has remarkable results in itself. The results use that stemmer : 
 
-corpus_without_stp = preprocess.remove_stop_words_collection(corpus,"../data/stop_words_extended.txt")
-corpus_filtered = preprocess.filter_collection(corpus_without_stp)
-corpus_lemmatized_2 = preprocess.lemmatize_collection(corpus_filtered, pos=False)
-final_corpus_2 = preprocess.remove_stop_words_collection(corpus_lemmatized_2,"../data/stop_words_extended.txt")
+corpus_without_stp = remove_stop_words(corpus,"../data/stop_words_extended.txt")
+corpus_filtered = filter_tokens(corpus_without_stp)
+corpus_lemmatized_2 = lemmatize(corpus_filtered, pos=False)
+final_corpus_2 = remove_stop_words(corpus_lemmatized_2,"../data/stop_words_extended.txt")
 
 # +
 most_frequents = get_frequencies(final_corpus_2).most_common(50)
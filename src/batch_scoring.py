@@ -0,0 +1,180 @@
+"""
+Batch scoring of vectorial queries as a sparse matrix product.
+
+The frequency index is turned once into a CSR term-document matrix, whose rows are the terms and whose
+columns are the documents, holding the precomputed weights divided by the norms of the documents
+(see vectorial_query.DocumentWeights). A batch of queries becomes a CSR query-term matrix holding the
+weights of the query terms divided by the norms of the queries, so that the product of both matrices
+gives the cosine similarity of every query with every document, computed by scipy in compiled code.
+The k best documents of each query are then selected in its row of the product.
+
+Scores are the same as vectorial_query.get_scores up to rounding (the additions are done in another
+order), and only the documents with a non zero score are ranked.
+"""
+import argparse
+import time
+
+from dataclasses import dataclass
+from typing import List, Tuple, Dict
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import vectorial_query as vq
+from vectorial_numpy import get_dense_weights
+from preprocess import InvertedIndex, load_index
+
+from config import PATH_INDEX, POS, TOKENIZER, WEIGHT_DOCUMENT, WEIGHT_QUERY
+
+@dataclass
+class TermDocumentMatrix:
+    """
+    Normalized weights of an index for a weighting scheme
+
+    'self.terms' maps a term to its row in 'self.matrix'
+    'self.matrix' is the CSR matrix of the weight of each term in each document (columns being the document ids),
+    divided by the norm of the document
+    """
+    terms: Dict[str, int]
+    matrix: csr_matrix
+
+# term-document matrices of the indexes queried, by index version and weighting scheme
+TERM_DOCUMENT_MATRICES: Dict[Tuple[str, str], TermDocumentMatrix] = {}
+
+def build_term_document_matrix(inverted_index: InvertedIndex, wd: str) -> TermDocumentMatrix:
+    """
+    build the term-document matrix of a frequency index
+
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+        wd {str} -- weighting scheme for the document
+
+    Returns:
+        TermDocumentMatrix -- normalized weights
+    """
+    assert inverted_index.itype == 2, f"need a frequency index (type 2) for a vectorial query, got index of type {inverted_index.itype}"
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    norms = get_dense_weights(inverted_index, document_weights).norms
+    terms = {}
+    indptr = [0]
+    indices = []
+    data = []
+    for term, postings in inverted_index.index.items():
+        terms[term] = len(terms)
+        doc_ids = np.fromiter(postings, dtype=np.int64, count=len(postings))
+        weights = np.frombuffer(document_weights.impacts[term], dtype=np.float64)
+        doc_norms = norms[doc_ids]
+        normalized = np.zeros(len(doc_ids))
+        np.divide(weights, doc_norms, out=normalized, where=doc_norms > 0)
+        indices.append(doc_ids)
+        data.append(normalized)
+        indptr.append(indptr[-1] + len(doc_ids))
+    matrix = csr_matrix(
+        (np.concatenate(data) if data else np.zeros(0), np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64), np.array(indptr)),
+        shape=(len(terms), len(norms))
+    )
+    return TermDocumentMatrix(terms, matrix)
+
+def get_term_document_matrix(inverted_index: InvertedIndex, wd: str) -> TermDocumentMatrix:
+    """term-document matrix of an index, built the first time it is needed (see build_term_document_matrix)"""
+    key = (inverted_index.version, vq.get_document_weights(inverted_index, wd).wd)
+    if key not in TERM_DOCUMENT_MATRICES:
+        TERM_DOCUMENT_MATRICES[key] = build_term_document_matrix(inverted_index, wd)
+    return TERM_DOCUMENT_MATRICES[key]
+
+def build_query_matrix(queries: List[List[str]], term_document_matrix: TermDocumentMatrix, document_weights: vq.DocumentWeights, wq: str) -> csr_matrix:
+    """
+    build the query-term matrix of a batch of queries
+
+    Arguments:
+        queries {List[List[str]]} -- preprocessed queries
+        term_document_matrix {TermDocumentMatrix} -- normalized weights of the documents
+        document_weights {vq.DocumentWeights} -- weights of the documents
+        wq {str} -- weighting scheme for the query
+
+    Returns:
+        csr_matrix -- weight of each term in each query, divided by the norm of the query
+    """
+    indptr = [0]
+    indices = []
+    data = []
+    for query in queries:
+        terms, query_norm = vq.get_query_weights(query, document_weights, wq)
+        for term, weight_query in terms:
+            indices.append(term_document_matrix.terms[term])
+            data.append(weight_query / query_norm)
+        indptr.append(len(indices))
+    return csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr)), shape=(len(queries), len(term_document_matrix.terms)))
+
+def batch_top_k(
+    queries: List[List[str]],
+    inverted_index: InvertedIndex,
+    k: int,
+    wq: str,
+    wd: str,
+    batch_size: int = 1024
+    ) -> List[List[Tuple[int, float]]]:
+    """
+    k best documents of each query of a batch, ties being broken by ascending document id
+
+    Arguments:
+        queries {List[List[str]]} -- preprocessed queries
+        inverted_index {InvertedIndex} -- frequency index
+        k {int} -- number of documents per query
+        wq {str} -- weighting scheme for the query
+        wd {str} -- weighting scheme for the document
+
+    Keyword Arguments:
+        batch_size {int} -- number of queries multiplied at once, bounding the size of the product (default: {1024})
+
+    Returns:
+        List[List[Tuple[int, float]]] -- ids and scores of the k best documents of each query, by descending score
+    """
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    term_document_matrix = get_term_document_matrix(inverted_index, wd)
+    results = []
+    for start in range(0, len(queries), batch_size):
+        query_matrix = build_query_matrix(queries[start:start + batch_size], term_document_matrix, document_weights, wq)
+        scores = (query_matrix @ term_document_matrix.matrix).tocsr()
+        for row in range(scores.shape[0]):
+            doc_ids = scores.indices[scores.indptr[row]:scores.indptr[row + 1]]
+            row_scores = scores.data[scores.indptr[row]:scores.indptr[row + 1]]
+            nonzero = row_scores > 0
+            doc_ids, row_scores = doc_ids[nonzero], row_scores[nonzero]
+            if k <= 0 or len(doc_ids) == 0:
+                results.append([])
+                continue
+            if k < len(doc_ids):
+                # every document scoring at least the k-th score, so that ties at the boundary are broken by id
+                kth_score = -np.partition(-row_scores, k - 1)[k - 1]
+                selected = row_scores >= kth_score
+                doc_ids, row_scores = doc_ids[selected], row_scores[selected]
+            best = np.lexsort((doc_ids, -row_scores))[:k]
+            results.append(list(zip(doc_ids[best].tolist(), row_scores[best].tolist())))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries", help="file with one query per line")
+    parser.add_argument("--path-index", default=PATH_INDEX, help="path of a frequency index")
+    parser.add_argument("--number", "-n", type=int, default=10, help="number of documents per query (default=10)")
+    parser.add_argument("--weight-document", default=WEIGHT_DOCUMENT, help="weighting scheme for the document")
+    parser.add_argument("--weight-query", default=WEIGHT_QUERY, help="weighting scheme for the query")
+    parser.add_argument("--pos", type=bool, default=POS, help="<True|False> wether to use pos lemmatization or not")
+    parser.add_argument("--tokenizer", default=TOKENIZER, help=f"tokenizer used on the queries (defaults to {TOKENIZER})")
+    args = parser.parse_args()
+
+    inverted_index = load_index(args.path_index)
+    with open(args.queries) as f:
+        queries = [vq.lemmatize_query(line, pos=args.pos, tokenizer=args.tokenizer) for line in f if line.strip()]
+
+    start = time.perf_counter()
+    get_term_document_matrix(inverted_index, args.weight_document)
+    print(f"term-document matrix built in {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    for query in queries:
+        vq.rank_scores(vq.get_scores(query, inverted_index, args.weight_query, args.weight_document), args.number)
+    print(f"one query at a time : {len(queries) / (time.perf_counter() - start):.0f} queries/s")
+    start = time.perf_counter()
+    batch_top_k(queries, inverted_index, args.number, args.weight_query, args.weight_document)
+    print(f"batch : {len(queries) / (time.perf_counter() - start):.0f} queries/s")
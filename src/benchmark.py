@@ -0,0 +1,365 @@
+"""
+Stage-level benchmark of the index construction and of both query models, on a fixed sample of the corpus.
+
+The stages are the functions build_inverted_index runs, each on the output of the previous one :
+    corpus loading, preparation (prepare_document : tokenization, stop words and filtering of each document),
+    preprocessing (process_documents : the preparation again, the lemmatization by batches and the stop words
+    on the lemmas, ie the whole preprocessing of the build), index (index_documents : postings and statistics)
+followed by the precomputation of the document weights (frequency index only), and by a fixed set of
+boolean and vectorial queries drawn from the sample. For each stage, the wall time (best of several runs), the throughput
+(documents or queries per second, tokens or postings per second) and the peak of the memory allocated
+(measured with tracemalloc, in a separate run of the stage so that tracing does not slow the timed runs)
+are written as JSON. A run can then be compared to a stored baseline :
+    python src/benchmark.py --sample 1000 --output data/benchmark.json --baseline data/benchmark_baseline.json --save-baseline
+    python src/benchmark.py --sample 1000 --output data/benchmark.json --baseline data/benchmark_baseline.json
+the second run exits with an error if a stage is slower, or allocates more memory, than the baseline
+beyond the threshold.
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Callable, Optional, Tuple, OrderedDict as OrdDict
+
+import vectorial_query as vq
+from interface import bool_query_to_postfix, retrieve_docs_from_bool_query, retrieve_docs_from_vectorial_query
+from query_analyzer import get_query_analyzer
+from preprocess import (
+    InvertedIndex, LEMMA_CACHE, load_corpus_from_binary, load_stop_words, prepare_document, lemmatize_documents,
+    process_documents, index_documents
+)
+
+from config import PATH_DATA, PATH_DATA_BIN, PATH_STOP_WORDS, POS, TOKENIZER, WEIGHT_DOCUMENT, WEIGHT_QUERY
+
+# stages in the order they run
+STAGES = ("corpus_loading", "preparation", "preprocessing", "index", "weights", "boolean_queries", "vectorial_queries")
+# stages run again as part of a later stage, left out of the total
+NESTED_STAGES = ("preparation",)
+# a stage slower, or allocating more memory, than the baseline by more than this ratio is a regression
+REGRESSION_THRESHOLD = 0.3
+# stages faster than this (in seconds) are too noisy to be compared
+MIN_SECONDS = 0.05
+
+@dataclass
+class StageResult:
+    """
+    Measures of a stage
+
+    'self.stage' is the name of the stage (see STAGES)
+    'self.seconds' is the wall time of the stage
+    'self.items' is the number of documents or queries processed, 'self.unit' tells which
+    'self.postings' is the number of tokens (preprocessing stages) or postings (index, weights and queries) processed
+    'self.peak_bytes' is the peak of the memory allocated during the stage, None if not measured
+    """
+    stage: str
+    seconds: float
+    items: int
+    unit: str
+    postings: int
+    peak_bytes: Optional[int] = None
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.
+
+    @property
+    def postings_per_second(self) -> float:
+        return self.postings / self.seconds if self.seconds > 0 else 0.
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "items_per_second": self.items_per_second, "postings_per_second": self.postings_per_second}
+
+def measure_stage(stage: str, run: Callable[[], Any], items: int, unit: str, postings: Callable[[Any], int], memory: bool = True, repeat: int = 3) -> Tuple[StageResult, Any]:
+    """
+    time a stage, keeping the best of several runs with the garbage collector disabled (like timeit),
+    then run it again under tracemalloc for its peak of memory
+
+    Arguments:
+        stage {str} -- name of the stage
+        run {Callable[[], Any]} -- stage, giving the same output each time it runs
+        items {int} -- number of documents or queries processed
+        unit {str} -- "documents" or "queries"
+        postings {Callable[[Any], int]} -- number of tokens or postings processed, from the output of the stage
+
+    Keyword Arguments:
+        memory {bool} -- measure the peak of memory (default: {True})
+        repeat {int} -- number of timed runs (default: {3})
+
+    Returns:
+        Tuple[StageResult, Any] -- measures and output of the stage
+    """
+    seconds = math.inf
+    for _ in range(max(repeat, 1)):
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            output = run()
+            seconds = min(seconds, time.perf_counter() - start)
+        finally:
+            if gc_enabled:
+                gc.enable()
+    peak_bytes = None
+    if memory:
+        tracemalloc.start()
+        run()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return StageResult(stage, seconds, items, unit, postings(output), peak_bytes), output
+
+def load_sample(path: str, sample: int) -> OrdDict[str, str]:
+    """
+    first documents of the corpus, read from the collection folder or from its binary
+
+    Arguments:
+        path {str} -- collection folder (a folder of files per block) or binary of the corpus
+        sample {int} -- number of documents
+
+    Returns:
+        OrdDict[str, str] -- sample of the corpus
+    """
+    if not os.path.isdir(path):
+        corpus = load_corpus_from_binary(path)
+        return OrderedDict((key, corpus[key]) for key in sorted(corpus)[:sample])
+    # like create_corpus_from_files in DEV mode, the same number of files is read in each block,
+    # but in sorted order so that the sample is always the same
+    blocks = sorted(os.listdir(path))
+    files_per_block = math.ceil(sample / max(len(blocks), 1))
+    corpus = OrderedDict()
+    for block in blocks:
+        for filename in sorted(os.listdir(os.path.join(path, block)))[:files_per_block]:
+            with open(os.path.join(path, block, filename), "r") as f:
+                corpus[os.path.join(block, filename)] = f.read()
+    return OrderedDict((key, corpus[key]) for key in list(corpus)[:sample])
+
+def draw_queries(documents: List[List[str]], nb_queries: int, seed: int = 0) -> Tuple[List[str], List[str]]:
+    """
+    fixed boolean and vectorial queries, made of words of the documents
+
+    Arguments:
+        documents {List[List[str]]} -- tokens of the documents, without stop words
+        nb_queries {int} -- number of queries of each model
+
+    Keyword Arguments:
+        seed {int} -- seed of the draw (default: {0})
+
+    Returns:
+        Tuple[List[str], List[str]] -- boolean and vectorial queries
+    """
+    rng = random.Random(seed)
+    documents = [tokens for tokens in documents if len(tokens) > 0]
+    if len(documents) == 0:
+        return [], []
+    patterns = ("{} {}", "{} or {}", "{} and not {}", "( {} or {} ) and {}")
+    boolean_queries, vectorial_queries = [], []
+    for idx in range(nb_queries):
+        words = [rng.choice(rng.choice(documents)) for _ in range(3)]
+        pattern = patterns[idx % len(patterns)]
+        boolean_queries.append(pattern.format(*words[:pattern.count("{}")]))
+        vectorial_queries.append(" ".join(words[:rng.randint(1, 3)]))
+    return boolean_queries, vectorial_queries
+
+def parses(query: str, pos: bool, tokenizer: str) -> bool:
+    """whether a boolean query can be parsed"""
+    try:
+        bool_query_to_postfix(query, pos, tokenizer)
+    except Exception:
+        return False
+    return True
+
+def query_postings(queries: List[List[str]], inverted_index: InvertedIndex) -> int:
+    """number of postings of the terms of processed queries"""
+    return sum(len(inverted_index.index[term]) for query in queries for term in query if term in inverted_index.index)
+
+def benchmark_stages(
+    collection: Optional[OrdDict[str, str]] = None,
+    corpus_path: str = PATH_DATA_BIN,
+    sample: int = 1000,
+    type_index: int = 2,
+    pos: bool = POS,
+    tokenizer: str = TOKENIZER,
+    nb_queries: int = 100,
+    seed: int = 0,
+    memory: bool = True,
+    repeat: int = 5,
+    batch_size: int = 256
+    ) -> List[StageResult]:
+    """
+    run and measure each stage of the index construction, and both query models
+
+    Keyword Arguments:
+        collection {Optional[OrdDict[str, str]]} -- corpus to index, None to load a sample of the corpus (default: {None})
+        corpus_path {str} -- collection folder or binary of the corpus, if no collection is given (default: {PATH_DATA_BIN})
+        sample {int} -- number of documents of the sample (default: {1000})
+        type_index {int} -- type of index : document(1) frequency(2) position(3) (default: {2})
+        pos {bool} -- use pos tagging for lemmatization (default: {POS})
+        tokenizer {str} -- tokenizer to use (default: {TOKENIZER})
+        nb_queries {int} -- number of queries of each model (default: {100})
+        seed {int} -- seed of the draw of the queries (default: {0})
+        memory {bool} -- measure the peak of memory of each stage (default: {True})
+        repeat {int} -- number of timed runs of each stage, the best one being kept (default: {5})
+        batch_size {int} -- number of documents lemmatized at once (default: {256})
+
+    Returns:
+        List[StageResult] -- measures of the stages, the corpus loading only if no collection is given,
+                             the weights and the vectorial queries only for a frequency index
+    """
+    results = []
+    def stage(name: str, run: Callable[[], Any], items: int, unit: str, postings: Callable[[Any], int]) -> Any:
+        result, output = measure_stage(name, run, items, unit, postings, memory, repeat)
+        results.append(result)
+        return output
+
+    if collection is None:
+        collection = stage("corpus_loading", lambda: load_sample(corpus_path, sample), sample, "documents", lambda corpus: 0)
+        results[-1].items = len(collection)
+    keys = list(collection)
+    nb_documents = len(keys)
+    count_tokens = lambda documents: sum(len(tokens) for tokens in documents)
+
+    # the functions run by build_inverted_index, so that the stages follow the pipeline
+    stop_words = set(load_stop_words(PATH_STOP_WORDS))
+    prepared = stage("preparation", lambda: [prepare_document(collection[key], stop_words, tokenizer) for key in keys], nb_documents, "documents", count_tokens)
+    # the lemmatizer or the stemmer is loaded beforehand, importing nltk is not part of the stage
+    lemmatize_documents([["loading"]], pos)
+    def preprocess() -> List[Tuple[str, List[str]]]:
+        # the shared lemma cache is emptied for each run, so that the lemmas are computed each time
+        LEMMA_CACHE.lemmas.clear()
+        LEMMA_CACHE.stems.clear()
+        return list(process_documents(collection, PATH_STOP_WORDS, pos, batch_size, tokenizer))
+    processed_documents = stage("preprocessing", preprocess, nb_documents, "documents", lambda documents: count_tokens(terms for _, terms in documents))
+    count_postings = lambda inverted_index: sum(len(postings) for postings in inverted_index.index.values())
+    inverted_index = stage("index", lambda: index_documents(processed_documents, type_index, nb_documents=nb_documents), nb_documents, "documents", count_postings)
+    postings = count_postings(inverted_index)
+    if type_index == 2:
+        inverted_index.weights = stage("weights", lambda: vq.precompute_weights(inverted_index, [WEIGHT_DOCUMENT]), nb_documents, "documents", lambda _: postings)
+
+    analyzer = get_query_analyzer()
+    def run_queries(retrieve: Callable[[str], List[str]], queries: List[str]) -> List[List[str]]:
+        # the analysis of the queries is part of the stage, each run starts with an empty analysis cache
+        analyzer.cache.clear()
+        return [retrieve(query) for query in queries]
+    def postings_of(queries: List[str]) -> Callable[[Any], int]:
+        return lambda _: query_postings([vq.lemmatize_query(query, pos=pos, tokenizer=tokenizer) for query in queries], inverted_index)
+
+    boolean_queries, vectorial_queries = draw_queries(prepared, nb_queries, seed)
+    # the boolean parser rejects some operands (eg python keywords), such queries are left out
+    boolean_queries = [query for query in boolean_queries if parses(query, pos, tokenizer)]
+    stage("boolean_queries", lambda: run_queries(
+        lambda query: retrieve_docs_from_bool_query(query, inverted_index, pos, tokenizer), boolean_queries
+    ), len(boolean_queries), "queries", postings_of(boolean_queries))
+    if type_index == 2:
+        stage("vectorial_queries", lambda: run_queries(
+            lambda query: retrieve_docs_from_vectorial_query(query, inverted_index, 10, pos, WEIGHT_QUERY, WEIGHT_DOCUMENT, tokenizer), vectorial_queries
+        ), len(vectorial_queries), "queries", postings_of(vectorial_queries))
+    return results
+
+def results_to_json(results: List[StageResult], **meta: Any) -> Dict[str, Any]:
+    """machine-readable results, with the options of the run and the machine"""
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"), **meta},
+        "stages": [result.to_dict() for result in results],
+    }
+
+def compare_to_baseline(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    threshold: float = REGRESSION_THRESHOLD,
+    min_seconds: float = MIN_SECONDS
+    ) -> List[Dict[str, Any]]:
+    """
+    stages of a run slower, or allocating more memory, than in a baseline
+
+    Arguments:
+        results {Dict[str, Any]} -- results of the run (see results_to_json)
+        baseline {Dict[str, Any]} -- results of the baseline
+
+    Keyword Arguments:
+        threshold {float} -- tolerated increase, as a ratio of the baseline (default: {REGRESSION_THRESHOLD})
+        min_seconds {float} -- stages faster than this in the run are not compared on time (default: {MIN_SECONDS})
+
+    Returns:
+        List[Dict[str, Any]] -- regressions : the stage, the metric ("seconds" or "peak_bytes"),
+                                its value in the baseline and in the run, and their ratio
+    """
+    baseline_stages = {stage["stage"]: stage for stage in baseline["stages"]}
+    regressions = []
+    for stage in results["stages"]:
+        reference = baseline_stages.get(stage["stage"])
+        if reference is None:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            value, reference_value = stage.get(metric), reference.get(metric)
+            if value is None or not reference_value:
+                continue
+            if metric == "seconds" and value < min_seconds:
+                continue
+            if value > reference_value * (1 + threshold):
+                regressions.append({"stage": stage["stage"], "metric": metric, "baseline": reference_value, "value": value, "ratio": value / reference_value})
+    return regressions
+
+def format_table(results: List[StageResult]) -> str:
+    """table of the stages, like the timing tables of the README"""
+    total = sum(result.seconds for result in results if result.stage not in NESTED_STAGES)
+    lines = [f"{'stage':>18} {'time (s)':>9} {'%':>7} {'items/s':>10} {'postings/s':>11} {'peak (MB)':>10}"]
+    for result in results:
+        share = 100 * result.seconds / total if total > 0 else 0.
+        peak = f"{result.peak_bytes / 2**20:.1f}" if result.peak_bytes is not None else "-"
+        lines.append(f"{result.stage:>18} {result.seconds:>9.3f} {share:>6.2f}% {result.items_per_second:>10.1f} {result.postings_per_second:>11.0f} {peak:>10}")
+    lines.append(f"{'total':>18} {total:>9.3f}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    if os.environ.get("PYTHONHASHSEED") is None:
+        # the hashes of the strings change the order of the sets and dicts of terms, and the time of the queries
+        # by up to 50% from a run to the other : they are fixed, so that runs can be compared
+        os.execve(sys.executable, [sys.executable] + sys.argv, {**os.environ, "PYTHONHASHSEED": "0"})
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=PATH_DATA_BIN if os.path.exists(PATH_DATA_BIN) else PATH_DATA, help="collection folder or binary of the corpus (defaults to the binary if it exists)")
+    parser.add_argument("--sample", type=int, default=1000, help="number of documents of the sample (default=1000)")
+    parser.add_argument("--index-type", type=int, default=2, help="type of the index to build (default=2)")
+    parser.add_argument("--pos", type=bool, default=POS, help="use the the Part-Of-Speech (pos) lemmatization, or simple stemmer (default=True)")
+    parser.add_argument("--tokenizer", default=TOKENIZER, help=f"tokenizer used on the documents and the queries (default={TOKENIZER})")
+    parser.add_argument("--queries", type=int, default=100, help="number of queries of each model (default=100)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the draw of the queries (default=0)")
+    parser.add_argument("--batch-size", type=int, default=256, help="number of documents lemmatized at once (default=256)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs of each stage, the best one being kept (default=5)")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure the peak of memory of the stages")
+    parser.add_argument("--output", default=None, help="path of the JSON results")
+    parser.add_argument("--baseline", default=None, help="JSON results of a previous run to compare to")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the baseline instead of comparing them")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help=f"tolerated increase over the baseline (default={REGRESSION_THRESHOLD})")
+    args = parser.parse_args()
+
+    results = benchmark_stages(None, args.corpus, args.sample, args.index_type, args.pos, args.tokenizer, args.queries, args.seed, not args.no_memory, args.repeat, args.batch_size)
+    print(format_table(results))
+    json_results = results_to_json(results, corpus=args.corpus, sample=args.sample, index_type=args.index_type, pos=args.pos,
+        tokenizer=args.tokenizer, queries=args.queries, seed=args.seed, repeat=args.repeat, batch_size=args.batch_size, hash_seed=os.environ["PYTHONHASHSEED"])
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(json_results, f, indent=2)
+    if args.baseline is not None:
+        if args.save_baseline:
+            with open(args.baseline, "w") as f:
+                json.dump(json_results, f, indent=2)
+        else:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            options = [option for option in ("corpus", "sample", "index_type", "pos", "tokenizer", "batch_size", "queries", "seed", "hash_seed")
+                if baseline["meta"].get(option) != json_results["meta"][option]]
+            if len(options) > 0:
+                print(f"warning : the baseline was run with other options ({', '.join(options)})")
+            regressions = compare_to_baseline(json_results, baseline, args.threshold)
+            for regression in regressions:
+                print(f"regression of {regression['stage']} : {regression['metric']} {regression['baseline']:.3g} -> {regression['value']:.3g} (x{regression['ratio']:.2f})")
+            if len(regressions) > 0:
+                sys.exit(1)
@@ -0,0 +1,164 @@
+"""
+Bitmap postings for dense terms.
+
+A term appearing in more than BITMAP_DENSITY of the documents takes less memory as a bitmap
+over all the document ids (one bit per document) than as an array of 32 bits ids : the compact postings
+of such a term store the bitmap instead of the array (see compact_index.Postings). The threshold is the
+one of the containers of Roaring bitmaps, but the bitmaps themselves are plain and uncompressed : one
+bit for each document up to the last one of the term, without Roaring's chunks nor run containers.
+Bitmaps are python ints, so AND, OR and AND NOT between two bitmaps are single bitwise operations
+running word by word. Between a bitmap and a sorted list, the list is either filtered with membership
+tests in the bitmap, or turned into a bitmap.
+"""
+from array import array
+from typing import List, Tuple, Union, Iterable, Iterator, Sequence
+
+# minimum share of the documents a term must appear in to get a bitmap : 32 bits per document id
+BITMAP_DENSITY = 1 / 32
+
+# bytes of the bitmap covered by each precomputed rank (see Bitmap.rank)
+RANK_BLOCK = 64
+
+# positions of the set bits of each byte value
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+class Bitmap:
+    """
+    Set of document ids, the bit i of 'bits' being set if the document i is in the set.
+    Iterating gives the document ids in ascending order, like a postings list.
+    """
+    __slots__ = ("bits", "_bytes", "_len", "_ranks")
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+        self._bytes = None
+        self._len = None
+        self._ranks = None
+
+    @staticmethod
+    def from_doc_ids(doc_ids: Iterable[int]) -> "Bitmap":
+        """build the bitmap of document ids
+
+        Arguments:
+            doc_ids {Iterable[int]} -- document ids
+
+        Returns:
+            Bitmap -- bitmap of the document ids
+        """
+        buffer = bytearray()
+        for doc_id in doc_ids:
+            byte = doc_id >> 3
+            if byte >= len(buffer):
+                buffer.extend(bytes(byte + 1 - len(buffer)))
+            buffer[byte] |= 1 << (doc_id & 7)
+        return Bitmap(int.from_bytes(buffer, "little"))
+
+    def to_bytes(self) -> bytes:
+        """little-endian bytes of the bitmap, kept for membership tests"""
+        if self._bytes is None:
+            self._bytes = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+        return self._bytes
+
+    def __contains__(self, doc_id: int) -> bool:
+        buffer = self.to_bytes()
+        byte = doc_id >> 3
+        return 0 <= byte < len(buffer) and buffer[byte] >> (doc_id & 7) & 1 == 1
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = bin(self.bits).count("1")
+        return self._len
+
+    def rank(self, doc_id: int) -> int:
+        """number of documents of the set lower than doc_id, ie the index of doc_id in the sorted ids.
+        The number of documents before each block of RANK_BLOCK bytes is computed on the first call,
+        so that a call only counts the bits of a block."""
+        buffer = self.to_bytes()
+        if self._ranks is None:
+            self._ranks = array("I", [0])
+            for start in range(0, len(buffer), RANK_BLOCK):
+                self._ranks.append(self._ranks[-1] + bin(int.from_bytes(buffer[start:start + RANK_BLOCK], "little")).count("1"))
+        byte = doc_id >> 3
+        if byte >= len(buffer):
+            return len(self)
+        block = byte // RANK_BLOCK
+        rank = self._ranks[block] + bin(int.from_bytes(buffer[block * RANK_BLOCK:byte], "little")).count("1")
+        return rank + bin(buffer[byte] & ((1 << (doc_id & 7)) - 1)).count("1")
+
+    def __iter__(self) -> Iterator[int]:
+        for byte, value in enumerate(self.to_bytes()):
+            if value:
+                start = byte << 3
+                for bit in _BYTE_BITS[value]:
+                    yield start + bit
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap(self.bits & other.bits)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap(self.bits | other.bits)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap(self.bits & ~other.bits)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Bitmap) and self.bits == other.bits
+
+    def __getstate__(self) -> Tuple[int]:
+        return (self.bits,)
+
+    def __setstate__(self, state: Tuple[int]):
+        self.__init__(*state)
+
+    def __repr__(self) -> str:
+        return f"Bitmap({list(self)})"
+
+def use_bitmap(df: int, nb_docs: int, density: float = BITMAP_DENSITY) -> bool:
+    """check if the postings of a term are dense enough to be stored as a bitmap
+
+    Arguments:
+        df {int} -- document frequency of the term
+        nb_docs {int} -- number of documents of the collection
+
+    Keyword Arguments:
+        density {float} -- minimum share of the documents (default: {BITMAP_DENSITY})
+
+    Returns:
+        bool -- True if the term should have a bitmap
+    """
+    return nb_docs > 0 and df >= density * nb_docs
+
+def bitmap_and(a: Union[Bitmap, Sequence[int]], b: Union[Bitmap, Sequence[int]]) -> Union[Bitmap, List[int]]:
+    """a AND b, one of them at least being a bitmap
+
+    Returns:
+        Union[Bitmap, List[int]] -- a bitmap if both are bitmaps, else the list filtered by the bitmap
+    """
+    if isinstance(a, Bitmap) and isinstance(b, Bitmap):
+        return a & b
+    doc_ids, bitmap = (b, a) if isinstance(a, Bitmap) else (a, b)
+    return [doc_id for doc_id in doc_ids if doc_id in bitmap]
+
+def bitmap_or(a: Union[Bitmap, Sequence[int]], b: Union[Bitmap, Sequence[int]]) -> Bitmap:
+    """a OR b, one of them at least being a bitmap
+
+    Returns:
+        Bitmap -- union
+    """
+    if not isinstance(a, Bitmap):
+        a = Bitmap.from_doc_ids(a)
+    if not isinstance(b, Bitmap):
+        b = Bitmap.from_doc_ids(b)
+    return a | b
+
+def bitmap_andnot(a: Union[Bitmap, Sequence[int]], b: Union[Bitmap, Sequence[int]]) -> Union[Bitmap, List[int]]:
+    """a AND (NOT b), one of them at least being a bitmap
+
+    Returns:
+        Union[Bitmap, List[int]] -- a bitmap if a is a bitmap, else a filtered by b
+    """
+    if not isinstance(a, Bitmap):
+        return [doc_id for doc_id in a if doc_id not in b]
+    if not isinstance(b, Bitmap):
+        b = Bitmap.from_doc_ids(b)
+    return a - b
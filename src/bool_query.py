@@ -1,47 +1,45 @@
-import tt
-
-from typing import List, Any, OrderedDict as OrdDict
+from bisect import bisect_left
+from typing import List, Any, Tuple, Iterable, Sequence, OrderedDict as OrdDict
 from enum import Enum
 
-from config import PATH_STOP_WORDS
-from preprocess import tokenize_document, remove_stop_words_from_document, load_stop_words, lemmatize_document, Union
+from preprocess import LemmaCache, Optional, Union
+from query_analyzer import get_query_analyzer
+from compact_index import Postings
+from bitmap import Bitmap, bitmap_and, bitmap_or, bitmap_andnot
+
+# above this ratio between the lengths of two postings, AND and NAND gallop through the longer one
+GALLOP_RATIO = 8
 
 class LOGICAL_TOKENS(Enum):
     AND = "and"
     OR = "or"
     NAND = "nand"
-    # NOT = "not"
+    NOT = "not"
 
 LOGICAL_TOKENS_VALUES = [x.value for x in LOGICAL_TOKENS]
+BINARY_TOKENS_VALUES = [x.value for x in LOGICAL_TOKENS if x != LOGICAL_TOKENS.NOT]
 
+# intermediate result of a query : sorted document ids, and whether the result is
+# all the documents but these ones (complemented) or these ones
+Result = Tuple[Sequence[int], bool]
 
-def lemmatize_query(query: str, pos=True) -> List[str]:
+
+def lemmatize_query(query: str, pos=True, cache: Optional[LemmaCache] = None, tokenizer: str = "nltk") -> List[str]:
     """lemmatize a single boolean query
     
     Arguments:
         query {str} -- base query string, as input by the user
     
+    Keyword Arguments:
+        pos {bool} -- use pos tagging for lemmatization
+        cache {Optional[LemmaCache]} -- lemma cache, defaults to the shared one (see preprocess.preload_lemma_cache)
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use (default: {"nltk"})
+    
     Returns:
         List[str] -- processed query, after lemmatization and removing stop words
     """
     
-    tokens = tokenize_document(query)
-    stop_words = load_stop_words(PATH_STOP_WORDS)
-
-    # first pass
-    tokens = remove_stop_words_from_document(tokens, stop_words, LOGICAL_TOKENS_VALUES)
-
-    lemmatized_query = lemmatize_document(tokens, pos=pos)
-
-    assert len(lemmatized_query) == len(tokens), Exception("lemmatization should not remove tokens")
-
-    # put back logical operator in case they have been changed with lemmatization
-    for idx, tok in enumerate(tokens):
-        if tok in LOGICAL_TOKENS_VALUES:
-            lemmatized_query[idx] = tok
-       
-    # second pass
-    return remove_stop_words_from_document(lemmatized_query, stop_words, LOGICAL_TOKENS_VALUES)
+    return get_query_analyzer().analyze_boolean(query, LOGICAL_TOKENS_VALUES, pos=pos, tokenizer=tokenizer, lemma_cache=cache)
 
 def query_to_postfix(query: List[str]) -> List[str]:
     """transform a query into its postfix form
@@ -52,6 +50,8 @@ def query_to_postfix(query: List[str]) -> List[str]:
     Returns:
         List[str] -- postfix query
     """    
+    # tt is only imported by boolean queries, so that vectorial queries do not pay it
+    import tt
     return tt.BooleanExpression(" ".join(query)).postfix_tokens
 
 def merge_or(a: List[int], b: List[int]) -> List[int]:
@@ -62,8 +62,10 @@ def merge_or(a: List[int], b: List[int]) -> List[int]:
         b {List[int]} -- right list
     
     Returns:
-        List[int] -- left OR right
+        List[int] -- left OR right (a Bitmap if one of them is a Bitmap)
     """
+    if isinstance(a, Bitmap) or isinstance(b, Bitmap):
+        return bitmap_or(a, b)
 
     res = []
     n = len(a)
@@ -92,19 +94,54 @@ def merge_or(a: List[int], b: List[int]) -> List[int]:
     
     return res
 
+def gallop(a: Sequence[int], target: int, low: int) -> int:
+    """exponential search : first index, from low, of a sorted list whose value is >= target.
+    Costs O(log(distance)) instead of O(distance) for a linear walk.
+    
+    Arguments:
+        a {Sequence[int]} -- sorted list
+        target {int} -- value to search
+        low {int} -- index where the search starts
+    
+    Returns:
+        int -- index of the first value >= target, len(a) if there is none
+    """
+    n = len(a)
+    bound = 1
+    while low + bound < n and a[low + bound] < target:
+        bound *= 2
+    return bisect_left(a, target, low, min(low + bound + 1, n))
+
 def merge_and(a: List[int], b: List[int]) -> List[int]:
     """Merge two list with an AND operation, which are sorted !
+    When one list is much shorter, its values are searched in the other one by galloping.
     
     Arguments:
         a {List[int]} -- left list
         b {List[int]} -- right list
     
     Returns:
-        List[int] -- left AND right
+        List[int] -- left AND right (a Bitmap if both are Bitmaps)
     """
+    if isinstance(a, Bitmap) or isinstance(b, Bitmap):
+        return bitmap_and(a, b)
+
     res = []
     n = len(a)
     m = len(b)
+    if n > m:
+        a, b, n, m = b, a, m, n
+    if n * GALLOP_RATIO < m:
+        j = 0
+        for value in a:
+            j = gallop(b, value, j)
+            if j == m:
+                break
+            if b[j] == value:
+                res.append(value)
+                j += 1
+        return res
+
     i, j = 0, 0
     while i < n and j < m:
         if a[i] == b[j]:
@@ -120,17 +157,39 @@ def merge_and(a: List[int], b: List[int]) -> List[int]:
 
 def merge_nand(a: List[int], b: List[int]) -> List[int]:
     """Merge two list with an NAND operation, which are sorted !
+    When one list is much shorter, the other one is skipped through by galloping.
     
     Arguments:
         a {List[int]} -- left list
         b {List[int]} -- right list
     
     Returns:
-        List[int] -- left NAND right (left AND (NOT right))
+        List[int] -- left NAND right (left AND (NOT right)) (a Bitmap if left is a Bitmap)
     """
+    if isinstance(a, Bitmap) or isinstance(b, Bitmap):
+        return bitmap_andnot(a, b)
+
     res = []
     n = len(a)
     m = len(b)
+    if n * GALLOP_RATIO < m:
+        # few values to keep or drop : search each of them in right
+        j = 0
+        for value in a:
+            j = gallop(b, value, j)
+            if j == m or b[j] != value:
+                res.append(value)
+        return res
+    if m * GALLOP_RATIO < n:
+        # few values to drop : copy the runs of left between them
+        i = 0
+        for value in b:
+            k = gallop(a, value, i)
+            res.extend(a[i:k])
+            i = k + 1 if k < n and a[k] == value else k
+        res.extend(a[i:])
+        return res
+
     i, j = 0, 0
     while i < n and j < m:
         if a[i] == b[j]:
@@ -173,30 +232,143 @@ def boolean_operator_merge(boolOperator: str, posting_term1: List[int], posting_
         elif logicalOperator == LOGICAL_TOKENS.NAND:
             return merge_nand(posting_term1, posting_term2)
     except ValueError:
-        raise Exception(f"unsupported BoolOperator: {boolOperator}")
+        pass
+    raise Exception(f"unsupported BoolOperator: {boolOperator}")
+
+def and_results(a: Result, b: Result) -> Result:
+    """a AND b, without materializing complemented results :
+        - a AND (NOT b) is a NAND
+        - (NOT a) AND (NOT b) is NOT (a OR b)
+    
+    Arguments:
+        a {Result} -- left result
+        b {Result} -- right result
     
+    Returns:
+        Result -- left AND right
+    """
+    (a_docs, a_complemented), (b_docs, b_complemented) = a, b
+    if not a_complemented and not b_complemented:
+        return merge_and(a_docs, b_docs), False
+    elif not a_complemented:
+        return merge_nand(a_docs, b_docs), False
+    elif not b_complemented:
+        return merge_nand(b_docs, a_docs), False
+    return merge_or(a_docs, b_docs), True
 
-def process_postfix_query(postfix_query: List[str], inverted_index: OrdDict[str, int]) -> List[int]:
-    """get relevant documents ids from a postfix query
+def or_results(a: Result, b: Result) -> Result:
+    """a OR b, without materializing complemented results :
+        - a OR (NOT b) is NOT (b NAND a)
+        - (NOT a) OR (NOT b) is NOT (a AND b)
+    
+    Arguments:
+        a {Result} -- left result
+        b {Result} -- right result
+    
+    Returns:
+        Result -- left OR right
+    """
+    (a_docs, a_complemented), (b_docs, b_complemented) = a, b
+    if not a_complemented and not b_complemented:
+        return merge_or(a_docs, b_docs), False
+    elif not a_complemented:
+        return merge_nand(b_docs, a_docs), True
+    elif not b_complemented:
+        return merge_nand(a_docs, b_docs), True
+    return merge_and(a_docs, b_docs), True
+
+def not_result(a: Result) -> Result:
+    """NOT a, only flags the result as complemented"""
+    return a[0], not a[1]
+
+def boolean_operator_results(boolOperator: str, result_1: Result, result_2: Result) -> Result:
+    """merge two results, given a binary logical operator
+    
+    Arguments:
+        boolOperator {str} -- logical operator to use
+        result_1 {Result} -- left result
+        result_2 {Result} -- right result
+    
+    Raises:
+        Exception: if the given boolOperator is not a supported binary operator
+    
+    Returns:
+        Result -- left OPERATOR right
+    """
+    if boolOperator == LOGICAL_TOKENS.AND.value:
+        return and_results(result_1, result_2)
+    elif boolOperator == LOGICAL_TOKENS.OR.value:
+        return or_results(result_1, result_2)
+    elif boolOperator == LOGICAL_TOKENS.NAND.value:
+        return and_results(result_1, not_result(result_2))
+    raise Exception(f"unsupported BoolOperator: {boolOperator}")
+
+def materialize(result: Result, all_doc_ids: Optional[Iterable[int]] = None) -> List[int]:
+    """documents of a result. Only a complemented result needs all the documents of the collection.
+    
+    Arguments:
+        result {Result} -- result of a query
+    
+    Keyword Arguments:
+        all_doc_ids {Optional[Iterable[int]]} -- sorted ids of all the documents, eg InvertedIndex.mapping.keys() (default: {None})
+    
+    Raises:
+        Exception: if the result is complemented and all_doc_ids is not given
+    
+    Returns:
+        List[int] -- sorted document ids
+    """
+    doc_ids, complemented = result
+    if not complemented:
+        return list(doc_ids)
+    if all_doc_ids is None:
+        raise Exception("the documents of the collection are needed for a query negated at the top level")
+    excluded = doc_ids if isinstance(doc_ids, Bitmap) else set(doc_ids)
+    return [doc_id for doc_id in all_doc_ids if doc_id not in excluded]
+
+def get_doc_ids(postings: OrdDict[int, Any]) -> Sequence[int]:
+    """sorted document ids of the postings of a term
+    
+    Arguments:
+        postings {OrdDict[int, Any]} -- postings of the term
+    
+    Returns:
+        Sequence[int] -- document ids, the array itself for compact postings (no copy),
+                         or their Bitmap for dense compact postings
+    """
+    if isinstance(postings, Postings):
+        return postings.doc_ids if postings.bitmap is None else postings.bitmap
+    return list(postings.keys())
+
+def process_postfix_query(postfix_query: List[str], inverted_index: OrdDict[str, int], all_doc_ids: Optional[Iterable[int]] = None) -> List[int]:
+    """get relevant documents ids from a postfix query.
+    NOT is kept symbolic (see and_results and or_results), the complement of a result
+    over all the documents is only computed if the whole query is negated.
     
     Arguments:
         postfix_query {List[str]} -- query in postfix form
         inverted_index {OrdDict[str, int]} -- invertedIndex "index", ie InvertedIndex.index
     
+    Keyword Arguments:
+        all_doc_ids {Optional[Iterable[int]]} -- sorted ids of all the documents, only needed
+                                                 for a query negated at the top level (default: {None})
+    
     Returns:
         List[int] -- List of relevant document ids
     """
-    relevant_docs_stack: List[List[int]] = []    
+    relevant_docs_stack: List[Result] = []    
     for term in postfix_query:
-        if term in LOGICAL_TOKENS_VALUES:
+        if term == LOGICAL_TOKENS.NOT.value:
+            relevant_docs_stack.append(not_result(relevant_docs_stack.pop()))
+        elif term in LOGICAL_TOKENS_VALUES:
             op_2 = relevant_docs_stack.pop()
             op_1 = relevant_docs_stack.pop()
-            relevant_docs_stack.append(boolean_operator_merge(term, op_1, op_2))
+            relevant_docs_stack.append(boolean_operator_results(term, op_1, op_2))
         else:
             if term in inverted_index:
-                relevant_docs_stack.append(list(inverted_index[term].keys()))
+                relevant_docs_stack.append((get_doc_ids(inverted_index[term]), False))
             else: 
-                relevant_docs_stack.append([])
+                relevant_docs_stack.append(([], False))
 
     assert len(relevant_docs_stack) == 1, Exception(f"error while processing postfix query {postfix_query}. Should obtain a result of len 1 but got {relevant_docs_stack}")
-    return relevant_docs_stack.pop()
+    return materialize(relevant_docs_stack.pop(), all_doc_ids)
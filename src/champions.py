@@ -0,0 +1,196 @@
+"""
+Champion lists and tiered postings, for a fast approximate ranking of vectorial queries.
+
+The postings of each term are split in tiers of decreasing normalized weight (weight of the term in the
+document divided by the norm of the document, ie its contribution to a cosine similarity) : the first
+tier is the champion list of the term, its 'r' best documents, the next tier holds the next
+'r * tier_factor' documents, and so on. A query only gathers the documents of the first tier of its
+terms, and goes down to the next tiers while it has fewer than k documents. The gathered documents are
+then scored exactly, so the ranking only differs from an exhaustive one when a document of the
+exhaustive top k was in none of the tiers read. Candidates are scored by looking their frequencies up
+in the postings, rather than by reading the whole postings of the terms (see vectorial_query.score_documents).
+"""
+import argparse
+import time
+
+from array import array
+from typing import List, Tuple, Dict, Iterable
+
+import vectorial_query as vq
+from preprocess import InvertedIndex, load_index
+
+from config import PATH_INDEX, POS, TOKENIZER, WEIGHT_DOCUMENT, WEIGHT_QUERY
+
+# size of the champion lists
+CHAMPIONS_SIZE = 100
+# each tier is this many times larger than the previous one
+TIER_FACTOR = 10
+
+def build_tiers(inverted_index: InvertedIndex, document_weights: vq.DocumentWeights, r: int = CHAMPIONS_SIZE, tier_factor: int = TIER_FACTOR) -> Dict[str, List[array]]:
+    """
+    split the postings of each term in tiers of decreasing normalized weight
+
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+        document_weights {vq.DocumentWeights} -- weights of the documents
+
+    Keyword Arguments:
+        r {int} -- size of the champion lists, ie of the first tier (default: {CHAMPIONS_SIZE})
+        tier_factor {int} -- growth of the size of the tiers (default: {TIER_FACTOR})
+
+    Returns:
+        Dict[str, List[array]] -- sorted document ids of each tier of each term
+    """
+    assert r > 0 and tier_factor > 0, Exception(f"champion lists and tiers can not be empty, got r={r} and tier_factor={tier_factor}")
+    norms = document_weights.norms
+    tiers = {}
+    for term, postings in inverted_index.index.items():
+        normalized = [(weight/norms[doc_ID] if norms[doc_ID] > 0 else 0., doc_ID) for doc_ID, weight in zip(postings, document_weights.impacts[term])]
+        # best documents first, ties by ascending id
+        normalized.sort(key=lambda weight_and_id: (-weight_and_id[0], weight_and_id[1]))
+        term_tiers = []
+        start, size = 0, r
+        while start < len(normalized):
+            term_tiers.append(array("I", sorted(doc_ID for _, doc_ID in normalized[start:start + size])))
+            start, size = start + size, size * tier_factor
+        tiers[term] = term_tiers
+    return tiers
+
+def add_tiers(inverted_index: InvertedIndex, schemes: Iterable[str] = vq.WD_SCHEMES, r: int = CHAMPIONS_SIZE, tier_factor: int = TIER_FACTOR):
+    """
+    build the tiers of the document weights of several weighting schemes, eg when the index is built
+
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index, its weights are computed if needed
+
+    Keyword Arguments:
+        schemes {Iterable[str]} -- weighting schemes for the document (default: {vq.WD_SCHEMES})
+        r {int} -- size of the champion lists (default: {CHAMPIONS_SIZE})
+        tier_factor {int} -- growth of the size of the tiers (default: {TIER_FACTOR})
+    """
+    for wd in schemes:
+        document_weights = vq.get_document_weights(inverted_index, wd)
+        document_weights.tiers = build_tiers(inverted_index, document_weights, r, tier_factor)
+
+def tiered_top_k(
+    query: List[str],
+    inverted_index: InvertedIndex,
+    k: int,
+    wq: str,
+    wd: str,
+    counters: Dict[str, int] = None
+    ) -> List[Tuple[int, float]]:
+    """
+    k best documents of a vectorial query among the documents of the first tiers of its terms.
+    The tiers are built with the default sizes if an in-memory index has none.
+
+    Arguments:
+        query {List[str]} -- preprocessed query
+        inverted_index {InvertedIndex} -- frequency index
+        k {int} -- number of documents
+        wq {str} -- weighting scheme for the query
+        wd {str} -- weighting scheme for the document
+
+    Keyword Arguments:
+        counters {Dict[str, int]} -- if given, "postings" is incremented by the number of tier postings read,
+                                     and "tiers" by the number of tiers read (default: {None})
+
+    Returns:
+        List[Tuple[int, float]] -- ids and scores of the best documents found, by descending score
+    """
+    assert inverted_index.itype == 2, f"need a frequency index (type 2) for a vectorial query, got index of type {inverted_index.itype}"
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    if document_weights.tiers is None:
+        vq.require_precomputed(inverted_index, "tiers")
+        document_weights.tiers = build_tiers(inverted_index, document_weights)
+    terms, query_norm = vq.get_query_weights(query, document_weights, wq)
+
+    candidates = set()
+    nb_postings = 0
+    tier = 0
+    while len(candidates) < k:
+        read = False
+        for term, _ in terms:
+            term_tiers = document_weights.tiers[term]
+            if tier < len(term_tiers):
+                candidates.update(term_tiers[tier])
+                nb_postings += len(term_tiers[tier])
+                read = True
+        if not read:
+            break
+        tier += 1
+
+    scores = vq.score_documents(candidates, terms, query_norm, inverted_index, document_weights)
+
+    if counters is not None:
+        counters["postings"] = counters.get("postings", 0) + nb_postings
+        counters["tiers"] = counters.get("tiers", 0) + tier
+    return vq.rank_scores(scores, k)
+
+def recall_report(
+    queries: List[List[str]],
+    inverted_index: InvertedIndex,
+    rs: Iterable[int] = (10, 50, 100, 500),
+    k: int = 10,
+    wq: str = WEIGHT_QUERY,
+    wd: str = WEIGHT_DOCUMENT,
+    tier_factor: int = TIER_FACTOR
+    ) -> List[Dict[str, float]]:
+    """
+    recall@k of tiered queries against exact scoring, for several sizes of champion lists
+
+    Arguments:
+        queries {List[List[str]]} -- preprocessed queries
+        inverted_index {InvertedIndex} -- frequency index
+
+    Keyword Arguments:
+        rs {Iterable[int]} -- sizes of the champion lists (default: {(10, 50, 100, 500)})
+        k {int} -- number of documents retrieved (default: {10})
+        wq {str} -- weighting scheme for the query (default: {WEIGHT_QUERY})
+        wd {str} -- weighting scheme for the document (default: {WEIGHT_DOCUMENT})
+        tier_factor {int} -- growth of the size of the tiers (default: {TIER_FACTOR})
+
+    Returns:
+        List[Dict[str, float]] -- for each r, the mean recall@k, the tier postings read per query
+                                  and the mean latency (ms)
+    """
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    exact = [[doc_ID for doc_ID, _ in vq.rank_scores(vq.get_scores(query, inverted_index, wq, wd), k)] for query in queries]
+    report = []
+    for r in rs:
+        document_weights.tiers = build_tiers(inverted_index, document_weights, r, tier_factor)
+        counters = {}
+        start = time.perf_counter()
+        results = [tiered_top_k(query, inverted_index, k, wq, wd, counters) for query in queries]
+        duration = time.perf_counter() - start
+        recalls = [
+            len(set(expected) & set(doc_ID for doc_ID, _ in found)) / len(expected)
+            for expected, found in zip(exact, results) if len(expected) > 0
+        ]
+        report.append({
+            "r": r,
+            "recall": sum(recalls) / len(recalls) if len(recalls) > 0 else 1.,
+            "postings_per_query": counters.get("postings", 0) / max(len(queries), 1),
+            "latency_ms": 1000 * duration / max(len(queries), 1),
+        })
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries", help="file with one query per line")
+    parser.add_argument("--path-index", default=PATH_INDEX, help="path of a frequency index")
+    parser.add_argument("-r", type=int, nargs="+", default=[10, 50, 100, 500], help="sizes of the champion lists (default=10 50 100 500)")
+    parser.add_argument("--k", type=int, default=10, help="number of documents retrieved (default=10)")
+    parser.add_argument("--tier-factor", type=int, default=TIER_FACTOR, help=f"growth of the size of the tiers (default={TIER_FACTOR})")
+    parser.add_argument("--weight-document", default=WEIGHT_DOCUMENT, help="weighting scheme for the document")
+    parser.add_argument("--weight-query", default=WEIGHT_QUERY, help="weighting scheme for the query")
+    parser.add_argument("--pos", type=bool, default=POS, help="<True|False> wether to use pos lemmatization or not")
+    parser.add_argument("--tokenizer", default=TOKENIZER, help=f"tokenizer used on the queries (defaults to {TOKENIZER})")
+    args = parser.parse_args()
+
+    inverted_index = load_index(args.path_index)
+    with open(args.queries) as f:
+        queries = [vq.lemmatize_query(line, pos=args.pos, tokenizer=args.tokenizer) for line in f if line.strip()]
+    print(f"{'r':>6} {'recall@' + str(args.k):>10} {'postings/query':>15} {'latency (ms)':>13}")
+    for row in recall_report(queries, inverted_index, args.r, args.k, args.weight_query, args.weight_document, args.tier_factor):
+        print(f"{row['r']:>6} {row['recall']:>10.3f} {row['postings_per_query']:>15.1f} {row['latency_ms']:>13.3f}")
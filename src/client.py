@@ -0,0 +1,84 @@
+"""
+Thin client of the query server (see server.py), taking the same options as interface.py :
+    python src/client.py --model vectorial "cats are cute"
+prints the same documents as
+    python src/interface.py --model vectorial "cats are cute"
+without loading the index, nor nltk, for each query.
+"""
+import argparse
+import http.client
+import json
+
+from typing import List, Dict, Any, Optional
+
+from config import POS, TOKENIZER, WEIGHT_DOCUMENT, WEIGHT_QUERY
+
+HOST = "127.0.0.1"
+PORT = 8080
+
+class ServerError(Exception):
+    """error answered by the query server"""
+
+class SearchClient:
+    """
+    Client of a query server, keeping its connection open between queries
+    """
+    def __init__(self, host: str = HOST, port: int = PORT, timeout: float = 60.):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """send a request and read its JSON response
+
+        Raises:
+            ServerError: if the server answers with an error
+
+        Returns:
+            Dict[str, Any] -- response
+        """
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        self.connection.request(method, path, body=body, headers=headers)
+        http_response = self.connection.getresponse()
+        response = json.loads(http_response.read())
+        if http_response.status != 200:
+            raise ServerError(f"{http_response.status} {response.get('error')}")
+        return response
+
+    def health(self) -> Dict[str, Any]:
+        return self.request("GET", "/health")
+
+    def boolean(self, query: str, **options: Any) -> List[str]:
+        """documents of a boolean query, options being the optional fields of /boolean (see server.py)"""
+        return self.request("POST", "/boolean", {"query": query, **options})["documents"]
+
+    def vectorial(self, query: str, **options: Any) -> List[str]:
+        """best documents of a vectorial query, options being the optional fields of /vectorial (see server.py)"""
+        return self.request("POST", "/vectorial", {"query": query, **options})["documents"]
+
+    def close(self):
+        self.connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", help="<boolean|vectorial> model used to process query", default="boolean")
+    parser.add_argument("query", help="query to process")
+    parser.add_argument("--number", "-n", help="number of results to display (only for vectorial)", type=int, default=10)
+    parser.add_argument("--weight-document", default=WEIGHT_DOCUMENT, help="<frequency|tf_idf_normalize|tf_idf_logarithmic|tf_idf_log_normalize> \n"+
+        "weighting scheme for the document (defaults to tf_idf_log_normalize")
+    parser.add_argument("--weight-query", default=WEIGHT_QUERY, help="<tf|tf_idf> weighting scheme for the query (defaults to tf_idf)")
+    parser.add_argument("--pos", type=bool, default=POS, help="<True|False> wether to use pos lemmatization or not")
+    parser.add_argument("--tokenizer", default=TOKENIZER, help=f"tokenizer used on the query (defaults to {TOKENIZER})")
+    parser.add_argument("--engine", default="maxscore", help="engine ranking the documents of a vectorial query (defaults to maxscore)")
+    parser.add_argument("--postings-budget", type=int, default=None, help="maximum number of postings processed by a vectorial query with the impact engine")
+    parser.add_argument("--host", default=HOST, help=f"address of the query server (defaults to {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port of the query server (defaults to {PORT})")
+    args = parser.parse_args()
+
+    client = SearchClient(args.host, args.port)
+    if args.model == "boolean":
+        print("\n".join(client.boolean(args.query, pos=args.pos, tokenizer=args.tokenizer)))
+    elif args.model == "vectorial":
+        print("\n".join(client.vectorial(args.query, number=args.number, weight_query=args.weight_query,
+            weight_document=args.weight_document, engine=args.engine, postings_budget=args.postings_budget,
+            pos=args.pos, tokenizer=args.tokenizer)))
+    client.close()
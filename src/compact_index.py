@@ -0,0 +1,203 @@
+"""
+Compact in-memory postings : instead of an OrderedDict per term, the postings of a term are
+contiguous sorted arrays of unsigned ints (document ids, frequencies, and all the positions
+with the offsets of each document in them), and the documents statistics are stored as columns.
+Dense terms store their document ids as a Bitmap instead of an array (see bitmap), used as it is by the
+boolean merges, and decoded when a query needs the ids themselves.
+A compact index is an InvertedIndex like the others, queried by the same functions.
+"""
+import sys
+
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Optional, Tuple, Any, Dict, Iterator, Mapping, OrderedDict as OrdDict
+
+from preprocess import InvertedIndex, StatCollection
+from bitmap import Bitmap, BITMAP_DENSITY, use_bitmap
+
+class Postings(Mapping):
+    """
+    Postings of a term, behaving like the OrderedDict of an in-memory index
+    (document id -> True, frequency or list of positions), backed by arrays :
+        - 'doc_ids' : sorted document ids
+        - 'frequencies' : frequency in each document (frequency index only)
+        - 'positions' and 'offsets' : positions of the term in all the documents, the positions
+          in the i-th document being positions[offsets[i]:offsets[i + 1]] (position index only)
+        - 'bitmap' : the document ids as a Bitmap, for terms dense enough (see bitmap.use_bitmap).
+          The ids are then not stored as an array : the values of a document are found from its rank
+          in the bitmap (see Bitmap.rank), and 'doc_ids' decodes the ids on its first access, eg by
+          the MaxScore engine, and keeps them.
+    """
+    __slots__ = ("_doc_ids", "frequencies", "positions", "offsets", "bitmap")
+
+    def __init__(
+        self,
+        doc_ids: Optional[array],
+        frequencies: Optional[array] = None,
+        positions: Optional[array] = None,
+        offsets: Optional[array] = None,
+        bitmap: Optional[Bitmap] = None
+        ):
+        self._doc_ids = doc_ids
+        self.frequencies = frequencies
+        self.positions = positions
+        self.offsets = offsets
+        self.bitmap = bitmap
+
+    @property
+    def doc_ids(self) -> array:
+        """sorted document ids, decoded once from the bitmap of a dense term"""
+        if self._doc_ids is None and self.bitmap is not None:
+            self._doc_ids = array("I", self.bitmap)
+        return self._doc_ids
+
+    def _position(self, doc_id: Any) -> int:
+        if self.bitmap is not None:
+            if doc_id not in self.bitmap:
+                raise KeyError(doc_id)
+            return self.bitmap.rank(doc_id)
+        idx = bisect_left(self.doc_ids, doc_id)
+        if idx == len(self.doc_ids) or self.doc_ids[idx] != doc_id:
+            raise KeyError(doc_id)
+        return idx
+
+    def _value(self, idx: int) -> Any:
+        if self.positions is not None:
+            return self.positions[self.offsets[idx]:self.offsets[idx + 1]].tolist()
+        if self.frequencies is not None:
+            return self.frequencies[idx]
+        return True
+
+    def __getitem__(self, doc_id: int) -> Any:
+        return self._value(self._position(doc_id))
+
+    def __contains__(self, doc_id: Any) -> bool:
+        try:
+            self._position(doc_id)
+            return True
+        except (KeyError, TypeError):
+            return False
+
+    def __iter__(self) -> Iterator[int]:
+        if self.bitmap is not None:
+            return iter(self.bitmap)
+        return iter(self.doc_ids)
+
+    def __len__(self) -> int:
+        if self.bitmap is not None:
+            return len(self.bitmap)
+        return len(self.doc_ids)
+
+    def values(self) -> Iterator[Any]:
+        """values in document id order, without looking the documents up"""
+        if self.frequencies is not None:
+            return iter(self.frequencies)
+        return (self._value(idx) for idx in range(len(self)))
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        """(document id, value) in document id order, without looking the documents up"""
+        return zip(iter(self), self.values())
+
+    def __repr__(self) -> str:
+        return f"Postings({dict(self.items())})"
+
+def compact_postings(postings: OrdDict[int, Any], itype: int, with_bitmap: bool = False) -> Postings:
+    """convert the postings of a term to arrays
+
+    Arguments:
+        postings {OrdDict[int, Any]} -- postings of the term, sorted by document id
+        itype {int} -- type of the index
+
+    Keyword Arguments:
+        with_bitmap {bool} -- store the document ids as a Bitmap instead of an array (default: {False})
+
+    Returns:
+        Postings -- compact postings
+    """
+    bitmap = Bitmap.from_doc_ids(postings.keys()) if with_bitmap else None
+    doc_ids = array("I", postings.keys()) if not with_bitmap else None
+    if itype == 1:
+        return Postings(doc_ids, bitmap=bitmap)
+    elif itype == 2:
+        return Postings(doc_ids, frequencies=array("I", postings.values()), bitmap=bitmap)
+    offsets = array("I", [0])
+    positions = array("I")
+    for document_positions in postings.values():
+        positions.extend(document_positions)
+        offsets.append(len(positions))
+    return Postings(doc_ids, positions=positions, offsets=offsets, bitmap=bitmap)
+
+def compact_stats(stats: StatCollection) -> StatCollection:
+    """store the documents statistics as columns
+
+    Arguments:
+        stats {StatCollection} -- statistics of the collection
+
+    Returns:
+        StatCollection -- same statistics, 'doc_stats' being a DocumentsStats
+    """
+    # disk_index imports this module for its postings
+    from disk_index import DocumentsStats
+    if stats is None or isinstance(stats.doc_stats, DocumentsStats):
+        return stats
+    doc_ids = list(stats.doc_stats.keys())
+    return StatCollection(stats.nb_docs, DocumentsStats(
+        array("I", doc_ids),
+        array("I", (stats.doc_stats[doc_id]["freq_max"] for doc_id in doc_ids)),
+        array("d", (stats.doc_stats[doc_id]["moy_freq"] for doc_id in doc_ids)),
+        array("I", (stats.doc_stats[doc_id]["unique"] for doc_id in doc_ids)),
+    ))
+
+def compact_index(inverted_index: InvertedIndex, bitmap_density: Optional[float] = BITMAP_DENSITY) -> InvertedIndex:
+    """convert an in-memory index to compact postings and statistics
+
+    Arguments:
+        inverted_index {InvertedIndex} -- index with OrderedDict postings
+
+    Keyword Arguments:
+        bitmap_density {Optional[float]} -- terms in at least this share of the documents store their document ids
+                                            as a Bitmap, None for no bitmaps (default: {BITMAP_DENSITY})
+
+    Returns:
+        InvertedIndex -- same index, with Postings
+    """
+    itype = inverted_index.itype
+    nb_docs = inverted_index.stats.nb_docs if inverted_index.stats is not None else 0
+    index = OrderedDict()
+    for term, postings in inverted_index.index.items():
+        if isinstance(postings, Postings):
+            index[term] = postings
+        else:
+            with_bitmap = bitmap_density is not None and use_bitmap(len(postings), nb_docs, bitmap_density)
+            index[term] = compact_postings(postings, itype, with_bitmap)
+    return InvertedIndex(itype, index, inverted_index.mapping, compact_stats(inverted_index.stats), inverted_index.version, inverted_index.weights)
+
+def is_compact(inverted_index: InvertedIndex) -> bool:
+    """check if the postings of an index are compact (an empty index is considered compact)"""
+    return all(isinstance(postings, Postings) for postings in inverted_index.index.values())
+
+def index_memory(index: Mapping) -> int:
+    """approximate memory taken by the postings of an index (dictionary of terms excluded), in bytes
+
+    Arguments:
+        index {Mapping} -- index, ie InvertedIndex.index
+
+    Returns:
+        int -- size in bytes of the postings containers and of the objects they hold
+    """
+    def size(obj: Any) -> int:
+        if isinstance(obj, Postings):
+            return sys.getsizeof(obj) + sum(size(getattr(obj, slot)) for slot in Postings.__slots__ if getattr(obj, slot) is not None)
+        if isinstance(obj, Bitmap):
+            return sys.getsizeof(obj) + sys.getsizeof(obj.bits)
+        if isinstance(obj, dict):
+            return sys.getsizeof(obj) + sum(size(key) + size(value) for key, value in obj.items())
+        if isinstance(obj, list):
+            return sys.getsizeof(obj) + sum(size(value) for value in obj)
+        # small ints and booleans are shared by the interpreter
+        if isinstance(obj, int) and -5 <= obj <= 256:
+            return 0
+        return sys.getsizeof(obj)
+
+    return sum(size(postings) for postings in index.values())
@@ -0,0 +1,281 @@
+import sys
+import time
+import argparse
+
+from array import array
+from typing import List, Dict, Iterable, Iterator, Tuple, Any, OrderedDict as OrdDict
+
+# codecs of the binary index, the position in the tuple is the id stored in the index header
+CODECS = ("raw", "vbyte", "gamma")
+
+def delta_encode(values: Iterable[int]) -> List[int]:
+    """replace sorted values by their gaps (the first value is kept as is)
+
+    Arguments:
+        values {Iterable[int]} -- sorted values
+
+    Returns:
+        List[int] -- gaps
+    """
+    gaps = []
+    previous = 0
+    for value in values:
+        gaps.append(value - previous)
+        previous = value
+    return gaps
+
+def delta_decode(gaps: Iterable[int]) -> List[int]:
+    """inverse of delta_encode
+
+    Arguments:
+        gaps {Iterable[int]} -- gaps
+
+    Returns:
+        List[int] -- sorted values
+    """
+    values = []
+    value = 0
+    for gap in gaps:
+        value += gap
+        values.append(value)
+    return values
+
+def vbyte_encode(numbers: Iterable[int]) -> bytes:
+    """variable byte encoding : 7 bits per byte, the high bit marks the last byte of a number
+
+    Arguments:
+        numbers {Iterable[int]} -- non negative integers
+
+    Returns:
+        bytes -- encoded numbers
+    """
+    encoded = bytearray()
+    for number in numbers:
+        number_bytes = [number & 127]
+        number >>= 7
+        while number > 0:
+            number_bytes.append(number & 127)
+            number >>= 7
+        number_bytes[0] |= 128
+        encoded.extend(reversed(number_bytes))
+    return bytes(encoded)
+
+def vbyte_iter(buffer: bytes) -> Iterator[int]:
+    """decode the numbers of vbyte_encode one at a time, so that a part of a stream can be decoded
+    and the rest later, where it stopped
+
+    Arguments:
+        buffer {bytes} -- encoded numbers
+
+    Yields:
+        int -- decoded numbers
+    """
+    number = 0
+    for byte in buffer:
+        if byte < 128:
+            number = (number << 7) | byte
+        else:
+            yield (number << 7) | (byte & 127)
+            number = 0
+
+def vbyte_decode(buffer: bytes) -> List[int]:
+    """inverse of vbyte_encode
+
+    Arguments:
+        buffer {bytes} -- encoded numbers
+
+    Returns:
+        List[int] -- decoded numbers
+    """
+    return list(vbyte_iter(buffer))
+
+def gamma_encode(numbers: Iterable[int]) -> bytes:
+    """Elias gamma encoding of non negative integers (n + 1 is encoded, gamma codes start at 1) :
+    as many 0 bits as the length of the binary representation minus one, then the binary representation,
+    ie n + 1 written on 2 * length - 1 bits. The bits are shifted into an integer, flushed byte by byte.
+    The last byte is padded with 0 bits.
+
+    Arguments:
+        numbers {Iterable[int]} -- non negative integers
+
+    Returns:
+        bytes -- encoded numbers
+    """
+    encoded = bytearray()
+    bits, nb_bits = 0, 0
+    for number in numbers:
+        number += 1
+        length = 2 * number.bit_length() - 1
+        bits = (bits << length) | number
+        nb_bits += length
+        while nb_bits >= 8:
+            nb_bits -= 8
+            encoded.append((bits >> nb_bits) & 255)
+        bits &= (1 << nb_bits) - 1
+    if nb_bits > 0:
+        encoded.append((bits << (8 - nb_bits)) & 255)
+    return bytes(encoded)
+
+def gamma_iter(buffer: bytes) -> Iterator[int]:
+    """decode the numbers of gamma_encode one at a time : bytes are shifted into an integer until it holds
+    a whole code, the number of leading 0 bits of the code being given by the bit length of the integer
+
+    Arguments:
+        buffer {bytes} -- encoded numbers
+
+    Yields:
+        int -- decoded numbers
+    """
+    bits, nb_bits = 0, 0
+    position, size = 0, len(buffer)
+    while True:
+        # the 1 bit ending the leading 0 bits of the next code
+        while bits == 0:
+            # only padding left
+            if position == size:
+                return
+            bits = (bits << 8) | buffer[position]
+            nb_bits += 8
+            position += 1
+        length = 2 * (nb_bits - bits.bit_length()) + 1
+        while nb_bits < length:
+            if position == size:
+                raise Exception("truncated gamma code")
+            bits = (bits << 8) | buffer[position]
+            nb_bits += 8
+            position += 1
+        nb_bits -= length
+        yield (bits >> nb_bits) - 1
+        bits &= (1 << nb_bits) - 1
+
+def gamma_decode(buffer: bytes) -> List[int]:
+    """inverse of gamma_encode
+
+    Arguments:
+        buffer {bytes} -- encoded numbers
+
+    Returns:
+        List[int] -- decoded numbers
+    """
+    return list(gamma_iter(buffer))
+
+def raw_encode(numbers: Iterable[int]) -> bytes:
+    """little-endian uint32 array"""
+    values = array("I", numbers)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+def raw_decode(buffer: bytes) -> array:
+    """inverse of raw_encode"""
+    values = array("I")
+    values.frombytes(buffer)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+ENCODERS = {"raw": raw_encode, "vbyte": vbyte_encode, "gamma": gamma_encode}
+DECODERS = {"raw": raw_decode, "vbyte": vbyte_decode, "gamma": gamma_decode}
+# decoders of the compressed codecs, one number at a time
+ITERATORS = {"vbyte": vbyte_iter, "gamma": gamma_iter}
+
+def encode_postings(postings: OrdDict[int, Any], itype: int, codec: str = "raw") -> bytes:
+    """serialize the postings of a term as a single stream of integers :
+        - itype 1 : document ids
+        - itype 2 : document ids, then frequencies
+        - itype 3 : document ids, then number of positions in each document, then the positions
+    With a compression codec, document ids and the positions in each document are gap encoded.
+
+    Arguments:
+        postings {OrdDict[int, Any]} -- postings of the term, sorted by document id
+        itype {int} -- type of the index
+
+    Keyword Arguments:
+        codec {str} -- <raw|vbyte|gamma> codec of the integers (default: {"raw"})
+
+    Returns:
+        bytes -- serialized postings
+    """
+    compress = codec != "raw"
+    numbers = delta_encode(postings.keys()) if compress else list(postings.keys())
+    if itype == 2:
+        numbers.extend(postings.values())
+    elif itype == 3:
+        numbers.extend(len(positions) for positions in postings.values())
+        for positions in postings.values():
+            numbers.extend(delta_encode(positions) if compress else positions)
+    return ENCODERS[codec](numbers)
+
+def decode_postings(buffer: bytes, df: int, itype: int, codec: str = "raw") -> Tuple[List[int], Any]:
+    """deserialize the postings of a term
+
+    Arguments:
+        buffer {bytes} -- serialized postings
+        df {int} -- document frequency of the term
+        itype {int} -- type of the index
+
+    Keyword Arguments:
+        codec {str} -- <raw|vbyte|gamma> codec of the integers (default: {"raw"})
+
+    Returns:
+        Tuple[List[int], Any] -- document ids, and frequencies (itype 2) or positions lists (itype 3) or None (itype 1)
+    """
+    compress = codec != "raw"
+    numbers = DECODERS[codec](buffer)
+    doc_ids = delta_decode(numbers[:df]) if compress else numbers[:df]
+    if itype == 1:
+        return doc_ids, None
+    elif itype == 2:
+        return doc_ids, numbers[df:2 * df]
+    else:
+        positions = []
+        start = 2 * df
+        for count in numbers[df:2 * df]:
+            document_positions = numbers[start:start + count]
+            positions.append(delta_decode(document_positions) if compress else list(document_positions))
+            start += count
+        return doc_ids, positions
+
+def compression_report(index: OrdDict[str, OrdDict[int, Any]], itype: int, codecs: Iterable[str] = CODECS) -> Dict[str, Dict[str, float]]:
+    """measure the size and decoding speed of each codec on an index
+
+    Arguments:
+        index {OrdDict[str, OrdDict[int, Any]]} -- index, ie InvertedIndex.index
+        itype {int} -- type of the index
+
+    Keyword Arguments:
+        codecs {Iterable[str]} -- codecs to measure (default: {CODECS})
+
+    Returns:
+        Dict[str, Dict[str, float]] -- for each codec, total size in bytes, bytes per posting,
+                                       and decoded postings per second
+    """
+    nb_postings = sum(len(postings) for postings in index.values())
+    report = {}
+    for codec in codecs:
+        encoded = [(encode_postings(postings, itype, codec), len(postings)) for postings in index.values()]
+        size = sum(len(buffer) for buffer, _ in encoded)
+        t0 = time.perf_counter()
+        for buffer, df in encoded:
+            decode_postings(buffer, df, itype, codec)
+        duration = time.perf_counter() - t0
+        report[codec] = {
+            "size": size,
+            "bytes_per_posting": size / nb_postings if nb_postings > 0 else 0.,
+            "postings_per_second": nb_postings / duration if duration > 0 else float("inf"),
+        }
+    return report
+
+if __name__ == "__main__":
+    from preprocess import load_index
+    from config import PATH_INDEX
+
+    parser = argparse.ArgumentParser(description="compare the postings codecs on an index")
+    parser.add_argument("--path-index", default=PATH_INDEX, help="index to measure")
+    args = parser.parse_args()
+
+    inverted_index = load_index(args.path_index)
+    report = compression_report(inverted_index.index, inverted_index.itype)
+    print(f"{'codec':<8}{'size (MB)':>12}{'bytes/posting':>16}{'postings/s':>14}")
+    for codec, measures in report.items():
+        print(f"{codec:<8}{measures['size'] / 2**20:>12.2f}{measures['bytes_per_posting']:>16.2f}{measures['postings_per_second']:>14.0f}")
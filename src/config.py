@@ -10,6 +10,7 @@ PATH_STOP_WORDS = os.path.join(cwd, "data", "stop_words.txt")
 PATH_INDEX = os.path.join(cwd, "data", "index_type2_pos.pkl") if not DEV_MODE else os.path.join(cwd, "data", "dev_index.pkl")
 
 POS = True
+TOKENIZER = "nltk"
 
 WEIGHT_QUERY = "tf_idf"
 WEIGHT_DOCUMENT = "tf_idf_logarithmic_normalize"
\ No newline at end of file
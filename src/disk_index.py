@@ -0,0 +1,552 @@
+"""
+Binary on-disk format of an inverted index, made of three files :
+
+- '<path>' : the term dictionary. A header (magic, format version, index type, number of terms),
+  then one fixed size entry per term, sorted by term : offset and length of the term in the
+  terms blob, offset and size of its postings in the postings file, and its document frequency.
+  The terms blob (utf-8 terms concatenated) comes last.
+- '<path>.postings' : the postings of all terms, one after the other, encoded with the codec
+  given in the header (see compression.encode_postings).
+- '<path>.meta' : pickled mapping, documents statistics (as columns) and, for each weighting scheme
+  of the precomputed document weights (see vectorial_query.DocumentWeights), the idf of the terms and
+  the norms of the documents
+- '<path>.weights' : the rest of the precomputed document weights, stored per term. A header (magic,
+  format version, number of sections, number of terms), then for each section the offsets of the records
+  of the terms, in dictionary order, then the records. A section holds one field of the weights of a
+  scheme : the weights of the postings and the largest normalized weight of each term as float64,
+  the tiers and the impact ordered postings pickled.
+
+Both the dictionary and the postings files are opened with mmap, so that a query only reads
+the dictionary entries visited by the binary search and the postings of its terms. The postings
+of a term are decoded lazily (see DiskPostings) : a boolean query only decodes document ids.
+The weights file is opened with mmap too, a vectorial query only reads the weights of its terms.
+"""
+import os
+import mmap
+import struct
+import pickle as pkl
+
+from array import array
+from collections import OrderedDict
+from itertools import islice, accumulate
+from typing import Optional, List, Tuple, Any, Dict, Iterable, Iterator, Mapping, OrderedDict as OrdDict
+
+from preprocess import InvertedIndex, StatCollection, new_index_version
+from compression import CODECS, ITERATORS, encode_postings, raw_decode, delta_decode
+from compact_index import Postings
+
+MAGIC = b"FRIIDX"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<6sHBBI")  # magic, version, itype, codec, number of terms
+ENTRY = struct.Struct("<QIQQI")  # term offset, term length, postings offset, postings size, df
+WEIGHTS_MAGIC = b"FRIWGT"
+WEIGHTS_VERSION = 1
+WEIGHTS_HEADER = struct.Struct("<6sHII")  # magic, version, number of sections, number of terms
+# fields of vectorial_query.DocumentWeights stored per term, and whether a record is a float64 or pickled
+WEIGHTS_FIELDS = (("impacts", False), ("max_impacts", False), ("tiers", True), ("impact_ordered", True))
+
+def postings_path(path: str) -> str:
+    return f"{path}.postings"
+
+def meta_path(path: str) -> str:
+    return f"{path}.meta"
+
+def weights_path(path: str) -> str:
+    return f"{path}.weights"
+
+def is_disk_index(path: str) -> bool:
+    """check if a file is the dictionary of a binary index
+
+    Arguments:
+        path {str} -- path of the file
+
+    Returns:
+        bool -- True if the file starts with the magic bytes of the binary format
+    """
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def postings_to_dict(doc_ids: List[int], values: Any, itype: int) -> OrdDict[int, Any]:
+    """build the postings of a term as in an in-memory index
+
+    Arguments:
+        doc_ids {List[int]} -- document ids
+        values {Any} -- frequencies (itype 2), positions (itype 3), or None (itype 1)
+        itype {int} -- type of the index
+
+    Returns:
+        OrdDict[int, Any] -- postings
+    """
+    if itype == 1:
+        return OrderedDict((doc_id, True) for doc_id in doc_ids)
+    return OrderedDict(zip(doc_ids, values))
+
+def write_disk_index(
+    path: str,
+    itype: int,
+    sorted_postings: Iterable[Tuple[str, OrdDict[int, Any]]],
+    mapping: OrdDict[int, str],
+    stats: StatCollection,
+    codec: str = "raw",
+    version: Optional[str] = None,
+    weights: Optional[Dict[str, Any]] = None
+    ):
+    """write a binary index, streaming the postings of the terms
+
+    Arguments:
+        path {str} -- path of the dictionary file
+        itype {int} -- type of the index
+        sorted_postings {Iterable[Tuple[str, OrdDict[int, Any]]]} -- terms and their postings, sorted by term
+        mapping {OrdDict[int, str]} -- mapping from documents ids to documents
+        stats {StatCollection} -- statistics of the collection
+
+    Keyword Arguments:
+        codec {str} -- <raw|vbyte|gamma> codec of the postings (default: {"raw"})
+        version {Optional[str]} -- version of the index, a new one by default (default: {None})
+        weights {Optional[Dict[str, Any]]} -- precomputed document weights, by weighting scheme (default: {None})
+    """
+    if codec not in CODECS:
+        raise Exception(f"unsupported codec '{codec}', not in {CODECS}")
+    entries = []
+    terms_blob = bytearray()
+    postings_offset = 0
+    previous_term = None
+    # the weights are stored in dictionary order
+    terms = [] if weights else None
+    with open(postings_path(path), "wb") as f:
+        for term, postings in sorted_postings:
+            assert previous_term is None or previous_term < term, Exception(f"terms must be sorted, got '{term}' after '{previous_term}'")
+            previous_term = term
+            if terms is not None:
+                terms.append(term)
+            encoded_term = term.encode("utf-8")
+            encoded_postings = encode_postings(postings, itype, codec)
+            f.write(encoded_postings)
+            entries.append((len(terms_blob), len(encoded_term), postings_offset, len(encoded_postings), len(postings)))
+            terms_blob += encoded_term
+            postings_offset += len(encoded_postings)
+
+    terms_start = HEADER.size + ENTRY.size * len(entries)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, itype, CODECS.index(codec), len(entries)))
+        for term_offset, term_length, offset, size, df in entries:
+            f.write(ENTRY.pack(terms_start + term_offset, term_length, offset, size, df))
+        f.write(terms_blob)
+
+    doc_ids = list(stats.doc_stats.keys())
+    with open(meta_path(path), "wb") as f:
+        pkl.dump({
+            "mapping": mapping,
+            "version": version if version is not None else new_index_version(),
+            "nb_docs": stats.nb_docs,
+            "doc_ids": array("I", doc_ids),
+            "freq_max": array("I", (stats.doc_stats[doc_id]["freq_max"] for doc_id in doc_ids)),
+            "moy_freq": array("d", (stats.doc_stats[doc_id]["moy_freq"] for doc_id in doc_ids)),
+            "unique": array("I", (stats.doc_stats[doc_id]["unique"] for doc_id in doc_ids)),
+            "weights": write_weights(path, weights, terms) if weights else None,
+        }, f, protocol=pkl.HIGHEST_PROTOCOL)
+
+def write_weights(path: str, weights: Dict[str, Any], terms: List[str]) -> Dict[str, Dict[str, Any]]:
+    """write the per term fields of precomputed document weights in the weights file of a binary index
+
+    Arguments:
+        path {str} -- path of the dictionary file
+        weights {Dict[str, Any]} -- document weights, by weighting scheme (see vectorial_query.precompute_weights)
+        terms {List[str]} -- terms of the index, in dictionary order
+
+    Returns:
+        Dict[str, Dict[str, Any]] -- for each scheme, what is kept in the meta file : the idf, the norms,
+                                     the sections of its fields in the weights file, and the levels and
+                                     scale of its impact ordered postings
+    """
+    sections = []
+    summaries = {}
+    for wd, document_weights in weights.items():
+        summary = {"idf": dict(document_weights.idf), "norms": dict(document_weights.norms), "sections": {}, "impact_levels": None}
+        for name, pickled in WEIGHTS_FIELDS:
+            values = getattr(document_weights, name)
+            if values is None:
+                continue
+            if name == "impact_ordered":
+                summary["impact_levels"] = (values.levels, values.scale)
+                values = values.segments
+            summary["sections"][name] = len(sections)
+            sections.append((values, pickled))
+        summaries[wd] = summary
+    offsets = array("Q")
+    with open(weights_path(path), "wb") as f:
+        f.write(WEIGHTS_HEADER.pack(WEIGHTS_MAGIC, WEIGHTS_VERSION, len(sections), len(terms)))
+        # the records are streamed, their offsets are written once known
+        table_start = f.tell()
+        f.seek(table_start + 8 * len(sections) * (len(terms) + 1))
+        for values, pickled in sections:
+            for term in terms:
+                offsets.append(f.tell())
+                value = values.get(term)
+                if pickled:
+                    f.write(pkl.dumps(value, protocol=pkl.HIGHEST_PROTOCOL))
+                elif value is not None:
+                    f.write(array("d", [value] if isinstance(value, (int, float)) else value).tobytes())
+            offsets.append(f.tell())
+        f.seek(table_start)
+        f.write(offsets.tobytes())
+    return summaries
+
+def save_weights(path: str, weights: Dict[str, Any]):
+    """store precomputed document weights with a binary index, eg once it is written by SPIMI
+
+    Arguments:
+        path {str} -- path of the dictionary file
+        weights {Dict[str, Any]} -- document weights, by weighting scheme (see vectorial_query.precompute_weights)
+    """
+    index = DiskIndex(path)
+    terms = list(index)
+    index.close()
+    with open(meta_path(path), "rb") as f:
+        meta = pkl.load(f)
+    meta["weights"] = write_weights(path, weights, terms) if weights else None
+    with open(meta_path(path), "wb") as f:
+        pkl.dump(meta, f, protocol=pkl.HIGHEST_PROTOCOL)
+
+def save_disk_index(path: str, inverted_index: InvertedIndex, codec: str = "raw"):
+    """save an in-memory inverted index in the binary format
+
+    Arguments:
+        path {str} -- path of the dictionary file
+        inverted_index {InvertedIndex} -- index to save
+
+    Keyword Arguments:
+        codec {str} -- <raw|vbyte|gamma> codec of the postings (default: {"raw"})
+    """
+    index = inverted_index.index
+    write_disk_index(
+        path,
+        inverted_index.itype,
+        ((term, index[term]) for term in sorted(index)),
+        inverted_index.mapping,
+        inverted_index.stats,
+        codec,
+        inverted_index.version,
+        inverted_index.weights
+    )
+
+class DocumentsStats(Mapping):
+    """
+    Read-only view of the documents statistics stored as columns,
+    giving the same OrderedDict as StatCollection.doc_stats for a document id
+    """
+    def __init__(self, doc_ids: array, freq_max: array, moy_freq: array, unique: array):
+        self.doc_ids = doc_ids
+        self.freq_max = freq_max
+        self.moy_freq = moy_freq
+        self.unique = unique
+        # ids are usually 0..n-1, no need for a lookup table then
+        self._positions = None if doc_ids.tolist() == list(range(len(doc_ids))) else {doc_id: idx for idx, doc_id in enumerate(doc_ids)}
+
+    def _position(self, doc_id: int) -> int:
+        if self._positions is None:
+            if 0 <= doc_id < len(self.doc_ids):
+                return doc_id
+            raise KeyError(doc_id)
+        return self._positions[doc_id]
+
+    def __getitem__(self, doc_id: int) -> OrdDict[str, float]:
+        idx = self._position(doc_id)
+        return OrderedDict([("freq_max", self.freq_max[idx]), ("moy_freq", self.moy_freq[idx]), ("unique", self.unique[idx])])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+class DiskPostings(Postings):
+    """
+    Postings of a term of a binary index, read by the queries like compact postings, but decoded lazily
+    from their encoded bytes (see compression.encode_postings) :
+        - the document ids are decoded on their first access, eg by a boolean merge, a skip or an iteration
+        - the frequencies, or the positions, only when a value is accessed. Compressed postings are decoded
+          one number at a time, so their decoding resumes where the document ids ended.
+    """
+    # the document ids are in the '_doc_ids' slot of Postings
+    __slots__ = ("_buffer", "_df", "_itype", "_codec", "_numbers", "_frequencies", "_positions", "_offsets")
+
+    def __init__(self, buffer: bytes, df: int, itype: int, codec: str = "raw"):
+        self._buffer = buffer
+        self._df = df
+        self._itype = itype
+        self._codec = codec
+        self._numbers: Optional[Iterator[int]] = None
+        self._doc_ids: Optional[array] = None
+        self._frequencies: Optional[array] = None
+        self._positions: Optional[array] = None
+        self._offsets: Optional[array] = None
+
+    def _decode_doc_ids(self):
+        if self._codec == "raw":
+            self._doc_ids = raw_decode(self._buffer[:4 * self._df])
+        else:
+            self._numbers = ITERATORS[self._codec](self._buffer)
+            self._doc_ids = array("I", delta_decode(islice(self._numbers, self._df)))
+
+    def _decode_values(self):
+        doc_ids, df = self.doc_ids, self._df
+        if self._codec == "raw":
+            counts = raw_decode(self._buffer[4 * df:8 * df])
+            positions = raw_decode(self._buffer[8 * df:]) if self._itype == 3 else None
+        else:
+            counts = array("I", islice(self._numbers, df))
+            if self._itype == 3:
+                positions = array("I")
+                for count in counts:
+                    positions.extend(delta_decode(islice(self._numbers, count)))
+            self._numbers = None
+        if self._itype == 2:
+            self._frequencies = counts
+        else:
+            self._positions = positions
+            self._offsets = array("I", accumulate(counts, initial=0))
+        # everything is decoded, the encoded postings are not needed anymore
+        self._buffer = None
+
+    @property
+    def doc_ids(self) -> array:
+        if self._doc_ids is None:
+            self._decode_doc_ids()
+        return self._doc_ids
+
+    @property
+    def frequencies(self) -> Optional[array]:
+        if self._itype == 2 and self._frequencies is None:
+            self._decode_values()
+        return self._frequencies
+
+    @property
+    def positions(self) -> Optional[array]:
+        if self._itype == 3 and self._positions is None:
+            self._decode_values()
+        return self._positions
+
+    @property
+    def offsets(self) -> Optional[array]:
+        if self._itype == 3 and self._offsets is None:
+            self._decode_values()
+        return self._offsets
+
+    @property
+    def bitmap(self) -> None:
+        return None
+
+    def __len__(self) -> int:
+        return self._df
+
+    def __reduce__(self):
+        # pickled as the decoded postings
+        return Postings, (self.doc_ids, self.frequencies, self.positions, self.offsets)
+
+class DiskIndex(Mapping):
+    """
+    Read-only, memory-mapped view of the index of a binary inverted index.
+    It behaves like InvertedIndex.index : index[term] gives the postings of a term as DiskPostings,
+    read from disk and decoded as the query uses them. The postings of the last 'cache_size' terms
+    accessed are kept, with what was decoded, since a query usually reads the postings of a term several times.
+    """
+    def __init__(self, path: str, cache_size: int = 64):
+        self.cache_size = cache_size
+        self._cache: OrdDict[str, DiskPostings] = OrderedDict()
+        with open(path, "rb") as f:
+            self._dictionary = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, itype, codec, nb_terms = HEADER.unpack_from(self._dictionary, 0)
+        if magic != MAGIC:
+            raise Exception(f"{path} is not a binary index")
+        if version != FORMAT_VERSION:
+            raise Exception(f"unsupported binary index version {version}, expected {FORMAT_VERSION}")
+        self.itype = itype
+        self.codec = CODECS[codec]
+        self.nb_terms = nb_terms
+        with open(postings_path(path), "rb") as f:
+            # mmap does not support empty files
+            self._postings = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size > 0 else b""
+
+    def _entry(self, idx: int) -> Tuple[int, int, int, int, int]:
+        return ENTRY.unpack_from(self._dictionary, HEADER.size + idx * ENTRY.size)
+
+    def _term(self, idx: int) -> bytes:
+        term_offset, term_length, _, _, _ = self._entry(idx)
+        return self._dictionary[term_offset:term_offset + term_length]
+
+    def _find(self, term: str) -> Optional[int]:
+        """binary search of a term in the dictionary
+
+        Returns:
+            Optional[int] -- index of the term entry, None if the term is not in the dictionary
+        """
+        encoded_term = term.encode("utf-8")
+        low, high = 0, self.nb_terms
+        while low < high:
+            mid = (low + high) // 2
+            if self._term(mid) < encoded_term:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.nb_terms and self._term(low) == encoded_term:
+            return low
+        return None
+
+    def document_frequency(self, term: str) -> int:
+        """document frequency of a term, without reading its postings"""
+        idx = self._find(term)
+        return 0 if idx is None else self._entry(idx)[4]
+
+    def __getitem__(self, term: str) -> DiskPostings:
+        try:
+            postings = self._cache[term]
+            self._cache.move_to_end(term)
+            return postings
+        except KeyError:
+            pass
+        idx = self._find(term)
+        if idx is None:
+            raise KeyError(term)
+        _, _, offset, size, df = self._entry(idx)
+        postings = DiskPostings(self._postings[offset:offset + size], df, self.itype, self.codec)
+        self._cache[term] = postings
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return postings
+
+    def __contains__(self, term: Any) -> bool:
+        return isinstance(term, str) and self._find(term) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(self.nb_terms):
+            yield self._term(idx).decode("utf-8")
+
+    def __len__(self) -> int:
+        return self.nb_terms
+
+    def close(self):
+        self._dictionary.close()
+        if isinstance(self._postings, mmap.mmap):
+            self._postings.close()
+
+class WeightsFile:
+    """
+    Memory-mapped weights file of a binary index. The records of the last 'cache_size' terms read are kept.
+    """
+    def __init__(self, path: str, cache_size: int = 256):
+        self.cache_size = cache_size
+        self._cache: OrdDict[Tuple[int, int], Any] = OrderedDict()
+        with open(weights_path(path), "rb") as f:
+            self._weights = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, nb_sections, nb_terms = WEIGHTS_HEADER.unpack_from(self._weights, 0)
+        if magic != WEIGHTS_MAGIC:
+            raise Exception(f"{weights_path(path)} is not a weights file")
+        if version != WEIGHTS_VERSION:
+            raise Exception(f"unsupported weights file version {version}, expected {WEIGHTS_VERSION}")
+        self.nb_sections = nb_sections
+        self.nb_terms = nb_terms
+
+    def record(self, section: int, idx: int, pickled: bool) -> Any:
+        """record of a term in a section
+
+        Arguments:
+            section {int} -- index of the section
+            idx {int} -- index of the term in the dictionary
+            pickled {bool} -- True if the record is pickled, else it is float64
+
+        Returns:
+            Any -- the record
+        """
+        key = (section, idx)
+        try:
+            value = self._cache[key]
+            self._cache.move_to_end(key)
+            return value
+        except KeyError:
+            pass
+        start, end = struct.unpack_from("<QQ", self._weights, WEIGHTS_HEADER.size + 8 * (section * (self.nb_terms + 1) + idx))
+        if pickled:
+            value = pkl.loads(self._weights[start:end])
+        else:
+            value = array("d")
+            value.frombytes(self._weights[start:end])
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def close(self):
+        self._weights.close()
+
+class TermWeights(Mapping):
+    """
+    Read-only view of a field of precomputed document weights stored per term in a weights file,
+    giving the same value as the dict of vectorial_query.DocumentWeights for a term
+    """
+    def __init__(self, weights_file: WeightsFile, index: DiskIndex, section: int, pickled: bool, scalar: bool = False):
+        self.weights_file = weights_file
+        self.index = index
+        self.section = section
+        self.pickled = pickled
+        self.scalar = scalar
+
+    def __getitem__(self, term: str) -> Any:
+        idx = self.index._find(term) if isinstance(term, str) else None
+        if idx is None:
+            raise KeyError(term)
+        value = self.weights_file.record(self.section, idx, self.pickled)
+        return value[0] if self.scalar else value
+
+    def __contains__(self, term: Any) -> bool:
+        return term in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+def load_weights(path: str, index: DiskIndex, summaries: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """open the precomputed document weights of a binary index, their per term fields are read when accessed
+
+    Arguments:
+        path {str} -- path of the dictionary file
+        index {DiskIndex} -- index of the binary index
+        summaries {Dict[str, Dict[str, Any]]} -- weights kept in the meta file, by weighting scheme (see write_weights)
+
+    Returns:
+        Dict[str, Any] -- document weights, by weighting scheme (see vectorial_query.DocumentWeights)
+    """
+    from vectorial_query import DocumentWeights
+    from impact_index import ImpactOrderedPostings
+    weights_file = WeightsFile(path)
+    weights = {}
+    for wd, summary in summaries.items():
+        fields = {
+            name: TermWeights(weights_file, index, summary["sections"][name], pickled, name == "max_impacts")
+            for name, pickled in WEIGHTS_FIELDS if name in summary["sections"]
+        }
+        if "impact_ordered" in fields:
+            levels, scale = summary["impact_levels"]
+            fields["impact_ordered"] = ImpactOrderedPostings(levels, scale, fields["impact_ordered"])
+        weights[wd] = DocumentWeights(wd, summary["idf"], norms=summary["norms"], **fields)
+    return weights
+
+def load_disk_index(path: str) -> InvertedIndex:
+    """open a binary index. Postings and the per term document weights stay on disk and are read when accessed.
+
+    Arguments:
+        path {str} -- path of the dictionary file
+
+    Returns:
+        InvertedIndex -- inverted index whose 'index' is a DiskIndex
+    """
+    index = DiskIndex(path)
+    with open(meta_path(path), "rb") as f:
+        meta = pkl.load(f)
+    doc_stats = DocumentsStats(meta["doc_ids"], meta["freq_max"], meta["moy_freq"], meta["unique"])
+    # indexes written before versions existed get a version when they are loaded
+    version = meta.get("version", new_index_version())
+    weights = load_weights(path, index, meta["weights"]) if meta.get("weights") else None
+    return InvertedIndex(index.itype, index, meta["mapping"], StatCollection(meta["nb_docs"], doc_stats), version, weights)
@@ -0,0 +1,243 @@
+"""
+Impact-ordered postings and score-at-a-time processing of vectorial queries.
+
+The normalized weight of a term in a document (its weight divided by the norm of the document, ie its
+contribution to a cosine similarity) is quantized into one of 'levels' integer impacts. The postings of
+each term are then grouped in segments of equal impact, the highest impacts first, each segment holding
+sorted document ids.
+
+A query gathers the segments of its terms and processes them by decreasing contribution (impact times the
+weight of the term in the query), adding it to an accumulator per document. It stops :
+    - when a budget of postings is spent, which bounds the latency of long queries of common terms,
+    - or when the k best documents can not change any more : the k-th best accumulator exceeds the next
+      one plus the largest contribution each term could still bring (safe termination),
+    - or when all the segments are processed.
+The k best documents found are finally scored exactly (see vectorial_query.score_documents), so the
+ranking only differs from an exhaustive one through the quantization, or when the budget is spent.
+"""
+import argparse
+import heapq
+import time
+
+from array import array
+from dataclasses import dataclass
+from typing import List, Tuple, Dict, Optional, Iterable
+
+import vectorial_query as vq
+from preprocess import InvertedIndex, load_index
+
+from config import PATH_INDEX, POS, TOKENIZER, WEIGHT_DOCUMENT, WEIGHT_QUERY
+
+# number of quantized impacts, one byte per posting
+IMPACT_LEVELS = 256
+
+@dataclass
+class ImpactOrderedPostings:
+    """
+    Postings of a frequency index sorted by quantized impact, for a weighting scheme
+
+    'self.levels' is the number of impacts, a normalized weight w getting the impact round(w / self.scale)
+    'self.scale' is the normalized weight of an impact of 1
+    'self.segments' maps a term to its segments, by decreasing impact : the impact, and the sorted ids
+    of the documents with that impact
+    """
+    levels: int
+    scale: float
+    segments: Dict[str, List[Tuple[int, array]]]
+
+def build_impact_ordered(inverted_index: InvertedIndex, document_weights: vq.DocumentWeights, levels: int = IMPACT_LEVELS) -> ImpactOrderedPostings:
+    """
+    quantize the normalized weights of an index and sort its postings by impact
+
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+        document_weights {vq.DocumentWeights} -- weights of the documents
+
+    Keyword Arguments:
+        levels {int} -- number of quantized impacts (default: {IMPACT_LEVELS})
+
+    Returns:
+        ImpactOrderedPostings -- impact-ordered postings
+    """
+    assert levels > 1, Exception(f"need at least 2 impact levels, got {levels}")
+    norms = document_weights.norms
+    if document_weights.max_impacts is None:
+        document_weights.max_impacts = vq.compute_max_impacts(inverted_index, document_weights)
+    max_weight = max(document_weights.max_impacts.values(), default=0.)
+    scale = max_weight / (levels - 1) if max_weight > 0 else 1.
+    segments = {}
+    for term, postings in inverted_index.index.items():
+        by_impact: Dict[int, array] = {}
+        for doc_ID, weight in zip(postings, document_weights.impacts[term]):
+            normalized = weight/norms[doc_ID] if norms[doc_ID] > 0 else 0.
+            # a document of the postings keeps an impact, even if its weight is tiny
+            impact = max(1, round(normalized / scale)) if normalized > 0 else 0
+            by_impact.setdefault(impact, array("I")).append(doc_ID)
+        segments[term] = sorted(by_impact.items(), reverse=True)
+    return ImpactOrderedPostings(levels, scale, segments)
+
+def add_impact_ordered(inverted_index: InvertedIndex, schemes: Iterable[str] = vq.WD_SCHEMES, levels: int = IMPACT_LEVELS):
+    """
+    build the impact-ordered postings of several weighting schemes, eg when the index is built
+
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index, its weights are computed if needed
+
+    Keyword Arguments:
+        schemes {Iterable[str]} -- weighting schemes for the document (default: {vq.WD_SCHEMES})
+        levels {int} -- number of quantized impacts (default: {IMPACT_LEVELS})
+    """
+    for wd in schemes:
+        document_weights = vq.get_document_weights(inverted_index, wd)
+        document_weights.impact_ordered = build_impact_ordered(inverted_index, document_weights, levels)
+
+def score_at_a_time(
+    query: List[str],
+    inverted_index: InvertedIndex,
+    k: int,
+    wq: str,
+    wd: str,
+    max_postings: Optional[int] = None,
+    counters: Dict[str, int] = None
+    ) -> List[Tuple[int, float]]:
+    """
+    k best documents of a vectorial query, processing the segments of its terms by decreasing impact.
+    The impact-ordered postings are built with the default levels if an in-memory index has none.
+
+    Arguments:
+        query {List[str]} -- preprocessed query
+        inverted_index {InvertedIndex} -- frequency index
+        k {int} -- number of documents
+        wq {str} -- weighting scheme for the query
+        wd {str} -- weighting scheme for the document
+
+    Keyword Arguments:
+        max_postings {Optional[int]} -- budget of postings, None for no budget (default: {None})
+        counters {Dict[str, int]} -- if given, "postings" is incremented by the number of postings processed,
+                                     and "safe_stops" or "budget_stops" by 1 if the query stopped early (default: {None})
+
+    Returns:
+        List[Tuple[int, float]] -- ids and scores of the best documents found, by descending score
+    """
+    assert inverted_index.itype == 2, f"need a frequency index (type 2) for a vectorial query, got index of type {inverted_index.itype}"
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    if document_weights.impact_ordered is None:
+        vq.require_precomputed(inverted_index, "impact ordered postings")
+        document_weights.impact_ordered = build_impact_ordered(inverted_index, document_weights)
+    terms, query_norm = vq.get_query_weights(query, document_weights, wq)
+    if k <= 0 or len(terms) == 0:
+        return []
+    segments = document_weights.impact_ordered.segments
+
+    # (contribution, term, position of the segment, documents) by decreasing contribution,
+    # the segments of a term keeping their order
+    queue = [
+        (weight_query * impact, idx, position, doc_ids)
+        for idx, (term, weight_query) in enumerate(terms)
+        for position, (impact, doc_ids) in enumerate(segments[term])
+    ]
+    queue.sort(key=lambda segment: (-segment[0], segment[1], segment[2]))
+    # largest contribution each term could still bring to a document, ie the one of its next segment
+    remaining = [weight_query * segments[term][0][0] if len(segments[term]) > 0 else 0. for term, weight_query in terms]
+
+    accumulators: Dict[int, float] = {}
+    nb_postings = 0
+    last_check = 0
+    stop = None
+    for contribution, idx, position, doc_ids in queue:
+        if max_postings is not None and nb_postings + len(doc_ids) > max_postings:
+            doc_ids = doc_ids[:max_postings - nb_postings]
+            stop = "budget_stops"
+        for doc_ID in doc_ids:
+            accumulators[doc_ID] = accumulators.get(doc_ID, 0.) + contribution
+        nb_postings += len(doc_ids)
+        if stop is not None:
+            break
+        term_segments = segments[terms[idx][0]]
+        remaining[idx] = terms[idx][1] * term_segments[position + 1][0] if position + 1 < len(term_segments) else 0.
+        # the safe termination condition costs a pass over the accumulators,
+        # it is checked once at least as many postings as accumulators were processed since the last time
+        if len(accumulators) >= k and nb_postings - last_check >= len(accumulators):
+            last_check = nb_postings
+            best = heapq.nlargest(k + 1, accumulators.values())
+            next_best = best[k] if len(best) > k else 0.
+            if best[k - 1] > next_best + sum(remaining):
+                stop = "safe_stops"
+                break
+
+    best_docs = heapq.nlargest(k, accumulators.items(), key=lambda id_and_score: (id_and_score[1], -id_and_score[0]))
+    scores = vq.score_documents((doc_ID for doc_ID, _ in best_docs), terms, query_norm, inverted_index, document_weights)
+    if counters is not None:
+        counters["postings"] = counters.get("postings", 0) + nb_postings
+        if stop is not None:
+            counters[stop] = counters.get(stop, 0) + 1
+    return vq.rank_scores(scores, k)
+
+def budget_report(
+    queries: List[List[str]],
+    inverted_index: InvertedIndex,
+    budgets: Iterable[Optional[int]] = (None, 10000, 1000, 100),
+    k: int = 10,
+    wq: str = WEIGHT_QUERY,
+    wd: str = WEIGHT_DOCUMENT
+    ) -> List[Dict[str, float]]:
+    """
+    recall@k of score-at-a-time queries against exact scoring, for several budgets of postings
+
+    Arguments:
+        queries {List[List[str]]} -- preprocessed queries
+        inverted_index {InvertedIndex} -- frequency index
+
+    Keyword Arguments:
+        budgets {Iterable[Optional[int]]} -- budgets of postings, None for no budget (default: {(None, 10000, 1000, 100)})
+        k {int} -- number of documents retrieved (default: {10})
+        wq {str} -- weighting scheme for the query (default: {WEIGHT_QUERY})
+        wd {str} -- weighting scheme for the document (default: {WEIGHT_DOCUMENT})
+
+    Returns:
+        List[Dict[str, float]] -- for each budget, the mean recall@k, the postings processed per query,
+                                  the mean and maximum latency (ms)
+    """
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    if document_weights.impact_ordered is None:
+        document_weights.impact_ordered = build_impact_ordered(inverted_index, document_weights)
+    exact = [[doc_ID for doc_ID, _ in vq.rank_scores(vq.get_scores(query, inverted_index, wq, wd), k)] for query in queries]
+    report = []
+    for budget in budgets:
+        counters = {}
+        latencies = []
+        recalls = []
+        for query, expected in zip(queries, exact):
+            start = time.perf_counter()
+            found = score_at_a_time(query, inverted_index, k, wq, wd, budget, counters)
+            latencies.append(time.perf_counter() - start)
+            if len(expected) > 0:
+                recalls.append(len(set(expected) & set(doc_ID for doc_ID, _ in found)) / len(expected))
+        report.append({
+            "budget": budget,
+            "recall": sum(recalls) / len(recalls) if len(recalls) > 0 else 1.,
+            "postings_per_query": counters.get("postings", 0) / max(len(queries), 1),
+            "latency_ms": 1000 * sum(latencies) / max(len(queries), 1),
+            "max_latency_ms": 1000 * max(latencies, default=0.),
+        })
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries", help="file with one query per line")
+    parser.add_argument("--path-index", default=PATH_INDEX, help="path of a frequency index")
+    parser.add_argument("--budgets", type=int, nargs="*", default=[10000, 1000, 100], help="budgets of postings, also compared to no budget (default=10000 1000 100)")
+    parser.add_argument("--k", type=int, default=10, help="number of documents retrieved (default=10)")
+    parser.add_argument("--weight-document", default=WEIGHT_DOCUMENT, help="weighting scheme for the document")
+    parser.add_argument("--weight-query", default=WEIGHT_QUERY, help="weighting scheme for the query")
+    parser.add_argument("--pos", type=bool, default=POS, help="<True|False> wether to use pos lemmatization or not")
+    parser.add_argument("--tokenizer", default=TOKENIZER, help=f"tokenizer used on the queries (defaults to {TOKENIZER})")
+    args = parser.parse_args()
+
+    inverted_index = load_index(args.path_index)
+    with open(args.queries) as f:
+        queries = [vq.lemmatize_query(line, pos=args.pos, tokenizer=args.tokenizer) for line in f if line.strip()]
+    print(f"{'budget':>8} {'recall@' + str(args.k):>10} {'postings/query':>15} {'latency (ms)':>13} {'max (ms)':>9}")
+    for row in budget_report(queries, inverted_index, [None] + args.budgets, args.k, args.weight_query, args.weight_document):
+        budget = "none" if row["budget"] is None else row["budget"]
+        print(f"{budget:>8} {row['recall']:>10.3f} {row['postings_per_query']:>15.1f} {row['latency_ms']:>13.3f} {row['max_latency_ms']:>9.3f}")
@@ -0,0 +1,125 @@
+"""
+Cold start of the query cli : import time report of a module, as given by `python -X importtime`,
+and wall time of a fresh interpreter importing it, checked against a budget.
+
+    python src/import_time.py --module interface --top 15
+prints the slowest imports of interface.py by cumulative time, and exits with an error if its cold
+start exceeds the budget. The modules of HEAVY_MODULES take about a second to import together and
+should only be imported by the code paths using them (see preprocess and interface).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from dataclasses import dataclass
+from typing import List, Iterable
+
+# budget of the cold start of the query cli, in seconds : a fresh interpreter importing interface.py
+COLD_START_BUDGET = 0.5
+# dependencies which must not be imported when the query cli starts
+HEAVY_MODULES = ("nltk", "numpy", "scipy", "tqdm", "tt")
+
+SRC_PATH = os.path.dirname(os.path.abspath(__file__))
+
+@dataclass
+class ImportTiming:
+    """
+    Import of a module, as reported by `python -X importtime`
+
+    'self.module' is the name of the module
+    'self.self_us' is the time spent importing the module itself, in µs
+    'self.cumulative_us' also counts the modules it imported, in µs
+    'self.depth' is the nesting of the import, 0 for the modules imported by the statement itself
+    """
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+def run_python(arguments: List[str]) -> subprocess.CompletedProcess:
+    """run a fresh interpreter, with the modules of the project importable"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SRC_PATH, os.environ.get("PYTHONPATH")])))
+    return subprocess.run([sys.executable] + arguments, env=env, capture_output=True, text=True, check=True)
+
+def parse_import_times(report: str) -> List[ImportTiming]:
+    """
+    parse the report written on stderr by `python -X importtime`
+
+    Arguments:
+        report {str} -- stderr of the interpreter
+
+    Returns:
+        List[ImportTiming] -- imports, in the order of the report (a module after the modules it imported)
+    """
+    timings = []
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            # header of the report
+            continue
+        stripped = name.lstrip(" ")
+        timings.append(ImportTiming(stripped, int(self_us), int(cumulative_us), (len(name) - len(stripped) - 1) // 2))
+    return timings
+
+def import_times(module: str = "interface") -> List[ImportTiming]:
+    """
+    imports of a module in a fresh interpreter
+
+    Keyword Arguments:
+        module {str} -- module of the project (default: {"interface"})
+
+    Returns:
+        List[ImportTiming] -- all the imports, including the ones of the interpreter startup
+    """
+    return parse_import_times(run_python(["-X", "importtime", "-c", f"import {module}"]).stderr)
+
+def cold_start(module: str = "interface", runs: int = 3) -> float:
+    """
+    wall time of a fresh interpreter importing a module, the best of several runs
+
+    Keyword Arguments:
+        module {str} -- module of the project (default: {"interface"})
+        runs {int} -- number of runs (default: {3})
+
+    Returns:
+        float -- cold start, in seconds
+    """
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_python(["-c", f"import {module}"])
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+def heavy_imports(timings: Iterable[ImportTiming], heavy_modules: Iterable[str] = HEAVY_MODULES) -> List[str]:
+    """heavy dependencies among the imports, a dependency being imported by any of its submodules"""
+    heavy_modules = set(heavy_modules)
+    return sorted({timing.module.split(".")[0] for timing in timings} & heavy_modules)
+
+def format_report(timings: List[ImportTiming], top: int = 20) -> str:
+    """table of the slowest imports, by cumulative time"""
+    lines = [f"{'cumulative (ms)':>16} {'self (ms)':>10}  module"]
+    for timing in sorted(timings, key=lambda timing: -timing.cumulative_us)[:top]:
+        lines.append(f"{timing.cumulative_us / 1000:>16.1f} {timing.self_us / 1000:>10.1f}  {'  ' * timing.depth}{timing.module}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="interface", help="module of the project to import (defaults to interface)")
+    parser.add_argument("--top", type=int, default=20, help="number of imports displayed (defaults to 20)")
+    parser.add_argument("--budget", type=float, default=COLD_START_BUDGET, help=f"cold start budget in seconds (defaults to {COLD_START_BUDGET})")
+    args = parser.parse_args()
+
+    timings = import_times(args.module)
+    print(format_report(timings, args.top))
+    heavy = heavy_imports(timings)
+    if len(heavy) > 0:
+        print(f"heavy dependencies imported : {', '.join(heavy)}")
+    duration = cold_start(args.module)
+    print(f"cold start of {args.module} : {1000 * duration:.1f} ms (budget {1000 * args.budget:.0f} ms)")
+    if duration > args.budget:
+        sys.exit(1)
@@ -1,57 +1,215 @@
-from typing import List
+from typing import List, Tuple, Dict, Any, Iterable, Iterator, Optional
+from dataclasses import dataclass
+from contextlib import nullcontext
+import json
 import pickle as pkl
+import sys
+import time
 
 import bool_query as bq
+import query_plan as qp
 import vectorial_query as vq
+import top_k
+import champions
+import impact_index
 import argparse
-from preprocess import InvertedIndex, StatCollection, load_index
+from preprocess import InvertedIndex, StatCollection, load_index, preload_lemma_cache, TOKENIZERS
+from query_cache import QueryCache
+from query_analyzer import get_query_analyzer
 
-from config import PATH_INDEX, POS, WEIGHT_DOCUMENT, WEIGHT_QUERY
+from config import PATH_INDEX, POS, TOKENIZER, WEIGHT_DOCUMENT, WEIGHT_QUERY
 
-def retrieve_docs_from_bool_query(query: str, inverted_index: InvertedIndex, pos: bool) -> List[str]:
-    lemmatized_query = bq.lemmatize_query(query, pos=pos)
+# engines ranking the documents of a vectorial query, all giving the same results but the approximate
+# "champions", which only ranks the documents of the best tiers of the query terms, and "impact",
+# which ranks quantized weights by decreasing impact until a budget of postings is spent
+VECTORIAL_ENGINES = ("exhaustive", "maxscore", "numpy", "champions", "impact")
 
-    # if no logical operator in the query, we assumes it's a "and"
-    # "dog cat" -> "dog and cat"
-    if not(any([x in lemmatized_query for x in bq.LOGICAL_TOKENS_VALUES])):
+def bool_query_to_postfix(query: str, pos: bool, tokenizer: str = "nltk") -> List[str]:
+    lemmatized_query = bq.lemmatize_query(query, pos=pos, tokenizer=tokenizer)
+
+    # if no binary logical operator in the query, we assumes it's a "and"
+    # "dog cat" -> "dog and cat", "dog not cat" -> "dog and not cat"
+    if not(any([x in lemmatized_query for x in bq.BINARY_TOKENS_VALUES])):
         new_query = []
         for term in lemmatized_query:
+            if len(new_query) > 0 and new_query[-1] != bq.LOGICAL_TOKENS.NOT.value:
+                new_query.append("and")
             new_query.append(term)
-            new_query.append("and")
-        new_query.pop()
         lemmatized_query = new_query
         
-    postfix_query = bq.query_to_postfix(lemmatized_query)
-    relevant_documents_id = bq.process_postfix_query(postfix_query, inverted_index.index)
+    return bq.query_to_postfix(lemmatized_query)
+
+def retrieve_docs_from_bool_query(query: str, inverted_index: InvertedIndex, pos: bool, tokenizer: str = "nltk", cache: Optional[QueryCache] = None) -> List[str]:
+    if cache is None:
+        postfix_query = bool_query_to_postfix(query, pos, tokenizer)
+    else:
+        # cached lemmatized queries and results are only valid for the index they were computed on
+        cache.check_version(inverted_index.version)
+        key = ("query", query, pos, tokenizer)
+        postfix_query = cache.get(key)
+        if postfix_query is None:
+            postfix_query = tuple(bool_query_to_postfix(query, pos, tokenizer))
+            cache.put(key, postfix_query)
+    relevant_documents_id = qp.process_planned_query(postfix_query, inverted_index.index, inverted_index.mapping.keys(), cache)
 
     return [inverted_index.mapping[doc_id] for doc_id in relevant_documents_id]
 
-def retrieve_docs_from_vectorial_query(query: str, inverted_index: InvertedIndex, n_results: int, pos: bool, wq:str, wd:str) -> List[str]:
-    lemmatized_query = vq.lemmatize_query(query, pos=pos)
+def rank_vectorial_query(query: str, inverted_index: InvertedIndex, n_results: int, pos: bool, wq:str, wd:str, tokenizer: str = "nltk", engine: str = "maxscore", max_postings: Optional[int] = None) -> List[Tuple[int, float]]:
+    lemmatized_query = vq.lemmatize_query(query, pos=pos, tokenizer=tokenizer)
     
-    ids_and_scores = vq.get_scores(lemmatized_query, inverted_index, wq, wd)
-    best_ids_and_scores = sorted(list(ids_and_scores.items()), key=lambda id_and_score: id_and_score[1], reverse=True)[:n_results]
+    if engine == "maxscore":
+        best_ids_and_scores = top_k.top_k_scores(lemmatized_query, inverted_index, n_results, wq, wd)
+    elif engine == "numpy":
+        # numpy, scipy and multiprocessing are only imported by the code paths using them, to keep the startup of the cli short
+        import vectorial_numpy
+        best_ids_and_scores = vectorial_numpy.top_k_scores(lemmatized_query, inverted_index, n_results, wq, wd)
+    elif engine == "champions":
+        best_ids_and_scores = champions.tiered_top_k(lemmatized_query, inverted_index, n_results, wq, wd)
+    elif engine == "impact":
+        best_ids_and_scores = impact_index.score_at_a_time(lemmatized_query, inverted_index, n_results, wq, wd, max_postings)
+    elif engine == "exhaustive":
+        best_ids_and_scores = vq.rank_scores(vq.get_scores(lemmatized_query, inverted_index, wq, wd), n_results)
+    else:
+        raise Exception(f"unsupported vectorial engine '{engine}', not in {VECTORIAL_ENGINES}")
+
+    return best_ids_and_scores
+
+def retrieve_docs_from_vectorial_query(query: str, inverted_index: InvertedIndex, n_results: int, pos: bool, wq:str, wd:str, tokenizer: str = "nltk", engine: str = "maxscore", max_postings: Optional[int] = None) -> List[str]:
+    best_ids_and_scores = rank_vectorial_query(query, inverted_index, n_results, pos, wq, wd, tokenizer, engine, max_postings)
 
     return [inverted_index.mapping[id_and_score[0]] for id_and_score in best_ids_and_scores]
 
+def retrieve_docs_from_vectorial_queries(queries: List[str], inverted_index: InvertedIndex, n_results: int, pos: bool, wq:str, wd:str, tokenizer: str = "nltk") -> List[List[str]]:
+    import batch_scoring
+    lemmatized_queries = [vq.lemmatize_query(query, pos=pos, tokenizer=tokenizer) for query in queries]
+
+    # all the queries are scored at once, as a sparse matrix product
+    best_ids_and_scores = batch_scoring.batch_top_k(lemmatized_queries, inverted_index, n_results, wq, wd)
+
+    return [[inverted_index.mapping[id_and_score[0]] for id_and_score in query_results] for query_results in best_ids_and_scores]
+
+@dataclass
+class QueryOptions:
+    """
+    Options of the queries of a batch, as given on the command line
+    """
+    model: str = "boolean"
+    n_results: int = 10
+    pos: bool = POS
+    wq: str = WEIGHT_QUERY
+    wd: str = WEIGHT_DOCUMENT
+    tokenizer: str = TOKENIZER
+    engine: str = "maxscore"
+    max_postings: Optional[int] = None
+
+# index, options and cache of a process answering the queries of a batch, set by init_batch_worker
+BATCH_STATE: Dict[str, Any] = {}
+
+def init_batch_worker(inverted_index: InvertedIndex, options: QueryOptions):
+    BATCH_STATE["index"] = inverted_index
+    BATCH_STATE["options"] = options
+    BATCH_STATE["cache"] = QueryCache()
+
+def process_batch_query(query: str) -> Dict[str, Any]:
+    """
+    answer a query of a batch with the index and options of the process (see init_batch_worker)
+
+    Arguments:
+        query {str} -- query to process
+
+    Returns:
+        Dict[str, Any] -- the query, its documents, their scores (vectorial model only) and the time spent (ms),
+                          or the error raised by the query, eg for an empty query
+    """
+    inverted_index, options = BATCH_STATE["index"], BATCH_STATE["options"]
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"query": query}
+    try:
+        if not query:
+            raise Exception("empty query")
+        if options.model == "boolean":
+            result["documents"] = retrieve_docs_from_bool_query(query, inverted_index, options.pos, options.tokenizer, BATCH_STATE["cache"])
+        else:
+            best_ids_and_scores = rank_vectorial_query(query, inverted_index, options.n_results, options.pos,
+                options.wq, options.wd, options.tokenizer, options.engine, options.max_postings)
+            result["documents"] = [inverted_index.mapping[doc_ID] for doc_ID, _ in best_ids_and_scores]
+            result["scores"] = [score for _, score in best_ids_and_scores]
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["time_ms"] = 1000 * (time.perf_counter() - start)
+    return result
+
+def run_batch(queries: Iterable[str], inverted_index: InvertedIndex, options: QueryOptions, workers: int = 1, chunksize: int = 16) -> Iterator[Dict[str, Any]]:
+    """
+    answer a batch of queries, in the order of the queries whatever the number of workers
+
+    Arguments:
+        queries {Iterable[str]} -- queries to process
+        inverted_index {InvertedIndex} -- index loaded once for the whole batch
+        options {QueryOptions} -- options of the queries
+
+    Keyword Arguments:
+        workers {int} -- number of processes answering the queries, 1 to answer them in this process (default: {1})
+        chunksize {int} -- number of queries sent to a worker at once (default: {16})
+
+    Returns:
+        Iterator[Dict[str, Any]] -- results of the queries (see process_batch_query)
+    """
+    # built once here rather than by each worker
+    get_query_analyzer()
+    if options.model == "vectorial":
+        vq.get_document_weights(inverted_index, options.wd)
+    if workers <= 1:
+        init_batch_worker(inverted_index, options)
+        yield from map(process_batch_query, queries)
+        return
+    import multiprocessing
+    # forked workers share the loaded index with this process instead of receiving a pickled copy
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    with context.Pool(workers, initializer=init_batch_worker, initargs=(inverted_index, options)) as pool:
+        yield from pool.imap(process_batch_query, queries, chunksize)
+
 if __name__ == "__main__" :
     parser = argparse.ArgumentParser()
     parser.add_argument("--model", help="<boolean|vectorial> model used to process query", default="boolean")
-    parser.add_argument("query", help="query to process")
+    parser.add_argument("query", nargs="?", help="query to process, unless --queries-file is given")
     parser.add_argument("--number", "-n", help="number of results to display (only for vectorial)", type=int, default=10)
     parser.add_argument("--weight-document", default=WEIGHT_DOCUMENT, help="<frequency|tf_idf_normalize|tf_idf_logarithmic|tf_idf_log_normalize> \n"+
         "weighting scheme for the document (defaults to tf_idf_log_normalize")
     parser.add_argument("--weight-query", default=WEIGHT_QUERY, help="<tf|tf_idf> weighting scheme for the query (defaults to tf_idf)")
     parser.add_argument("--pos", type=bool, default=POS, help="<True|False> wether to use pos lemmatization or not")
     parser.add_argument("--path-index", default=PATH_INDEX, help="specify this path to use a custom index")
+    parser.add_argument("--tokenizer", default=TOKENIZER, choices=TOKENIZERS, help=f"tokenizer used on the query (defaults to {TOKENIZER})")
+    parser.add_argument("--compact", action="store_true", help="load the postings as arrays, to use less memory")
+    parser.add_argument("--explain", action="store_true", help="print the plan of a boolean query before its results")
+    parser.add_argument("--engine", default="maxscore", choices=VECTORIAL_ENGINES, help="engine ranking the documents of a vectorial query (defaults to maxscore)")
+    parser.add_argument("--postings-budget", type=int, default=None, help="maximum number of postings processed by a vectorial query with the impact engine")
+    parser.add_argument("--queries-file", default=None, help="file with one query per line, '-' for stdin : the results are written as JSON lines, in the order of the queries")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes answering the queries of --queries-file (defaults to 1)")
+    parser.add_argument("--output", "-o", default=None, help="file the JSON lines of --queries-file are written to (defaults to stdout)")
     args = parser.parse_args()
+    if (args.query is None) == (args.queries_file is None):
+        parser.error("give either a query or --queries-file")
 
-    inverted_index = load_index(args.path_index)
-    if args.model == "boolean":
-        print("\n".join(retrieve_docs_from_bool_query(args.query, inverted_index, args.pos)))
+    inverted_index = load_index(args.path_index, compact=args.compact)
+    preload_lemma_cache(args.path_index)
+    if args.queries_file is not None:
+        options = QueryOptions(args.model, args.number, args.pos, args.weight_query, args.weight_document,
+            args.tokenizer, args.engine, args.postings_budget)
+        with nullcontext(sys.stdin) if args.queries_file == "-" else open(args.queries_file) as queries_file, \
+             nullcontext(sys.stdout) if args.output is None else open(args.output, "w") as output:
+            # one result per line, blank lines getting an error, so that result n is the query of line n
+            queries = (line.strip() for line in queries_file)
+            for result in run_batch(queries, inverted_index, options, args.workers):
+                output.write(json.dumps(result) + "\n")
+            output.flush()
+    elif args.model == "boolean":
+        if args.explain:
+            print(qp.explain(bool_query_to_postfix(args.query, args.pos, args.tokenizer), inverted_index.index))
+        print("\n".join(retrieve_docs_from_bool_query(args.query, inverted_index, args.pos, args.tokenizer)))
     elif args.model == "vectorial":
         print("\n".join(retrieve_docs_from_vectorial_query(args.query, inverted_index, args.number, 
-            args.pos, args.weight_query, args.weight_document)))
+            args.pos, args.weight_query, args.weight_document, args.tokenizer, args.engine, args.postings_budget)))
 
 
     
@@ -1,20 +1,30 @@
 import os
+import re
 import pickle as pkl
 import argparse
 
 from collections import OrderedDict, Counter
-from tqdm import tqdm
-from dataclasses import dataclass
-from typing import Optional, List, Union, Tuple, Any, Dict, OrderedDict as OrdDict
+from itertools import repeat
+from dataclasses import dataclass, field
+from uuid import uuid4
+from typing import Optional, List, Union, Tuple, Any, Dict, Set, Iterable, Iterator, TYPE_CHECKING, OrderedDict as OrdDict
 
 from utils import timer
-from config import PATH_DATA, DEV_MODE, DEV_ITER, PATH_INDEX, PATH_STOP_WORDS, PATH_DATA_BIN, POS
-from nltk import pos_tag
-from nltk.stem.api import StemmerI
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import wordnet
-from nltk.tokenize import word_tokenize
-from nltk.stem import SnowballStemmer
+from config import PATH_DATA, DEV_MODE, DEV_ITER, PATH_INDEX, PATH_STOP_WORDS, PATH_DATA_BIN, POS, TOKENIZER
+from compression import CODECS
+
+# nltk takes more than a second to import : it is only imported by the code using it (nltk tokenizer,
+# lemmatizer, stemmer and tagger), so that loading an index or answering a query with cached lemmas does not pay it
+if TYPE_CHECKING:
+    from nltk.tag.perceptron import PerceptronTagger
+
+# wordnet POS tags, ie nltk.corpus.wordnet.ADJ, VERB, NOUN and ADV
+WORDNET_ADJ, WORDNET_VERB, WORDNET_NOUN, WORDNET_ADV = "a", "v", "n", "r"
+
+def progress_bar(*args: Any, **kwargs: Any) -> Any:
+    """tqdm progress bar, tqdm being imported on first use"""
+    from tqdm import tqdm
+    return tqdm(*args, **kwargs)
 
 # @timer
 def create_corpus_from_files(path: str, dev: bool =False, dev_iter: Optional[int]=None) -> OrdDict[str, str]:
@@ -57,33 +67,108 @@ def load_corpus_from_binary(path: str) -> OrdDict[str, str]:
         corpus = pkl.load(f)
     return corpus
     
-def tokenize_document(document: str) -> List[str]:
-    """tokenize a document with nltk
+# tokenizers supported by tokenize_document
+TOKENIZERS = ("nltk", "regex", "whitespace")
+
+# any character which is neither a word character nor a space
+_PUNCTUATION = re.compile(r"[^\w\s]")
+# leading single quote, split off by nltk unless it starts a clitic ('s, 're, ...)
+_LEADING_QUOTE = re.compile(r"(?<!\w)'(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)")
+# punctuation always split off by nltk
+_SEPARATORS = re.compile(r"[;@#$%&?!*\[\](){}<>\"`«»“”‘’„‒-―]|''|--|\.{2,}|[:,](?!\d)|[:,]$")
+# contractions split in two words by nltk
+_CONTRACTED_WORDS = ("cannot", "gimme", "gonna", "gotta", "lemme", "wanna")
+_CONTRACTIONS = re.compile(r"\b(?:(can)(not)|(gim)(me)|(gon)(na)|(got)(ta)|(lem)(me))\b|\b(wan)(na)(?=[\s'.]|$)")
+# clitics split off at the end of a word by nltk, in the order nltk applies them
+_CLITICS = (re.compile(r"(?<=[^' ])(?:'s|'m|'d|')$"), re.compile(r"(?<=[^' ])(?:'ll|'re|'ve|n't)$"))
+
+def _split_chunk(chunk: str, final: bool) -> List[str]:
+    """split a space separated chunk containing punctuation like nltk would
     
     Arguments:
-        document {str} -- a str representing the document, query, etc..
+        chunk {str} -- chunk of text, without spaces
+        final {bool} -- True if this is the last chunk of the text
     
     Returns:
-        List[str] -- lowered tokens
+        List[str] -- tokens of the chunk
     """
-    tokens = word_tokenize(document.lower())
-    return [tok.lower() for tok in tokens]
-
-# @timer
-def tokenize_collection(collection: OrdDict[str, str]) -> OrdDict[str, List[str]]:
-    """tokenize a collection
+    suffixes = []
+    if chunk.endswith(".") and len(chunk) > 1:
+        suffixes.append(".")
+        chunk = chunk[:-1]
+        final = False
+    # nltk only splits a closing quote when it is followed by a space
+    if not final and len(chunk) > 1 and chunk[-1] == "'" and chunk[-2] != "'":
+        suffixes.append("'")
+        chunk = chunk[:-1]
+    for clitic in _CLITICS:
+        match = clitic.search(chunk)
+        if match is not None:
+            suffixes.append(match.group())
+            chunk = chunk[:match.start()]
+    tokens = [chunk] if chunk else []
+    tokens.extend(reversed(suffixes))
+    return tokens
+
+def regex_tokenize(text: str) -> List[str]:
+    """tokenize a lowered text with compiled regular expressions, mimicking nltk's word tokenizer.
+    The tokens kept by filter_function are the same as with nltk, except for sentence boundaries
+    which are not detected : we always split the final period of a word, where nltk keeps it
+    on abbreviations (e.g. "dr.").
+    Text without any punctuation, like the CS276 collection, is simply split on spaces.
     
     Arguments:
-        collection {OrdDict[str, str]} -- the collection to tokenize
+        text {str} -- lowered text
     
     Returns:
-        OrdDict[str, List[str]] -- tokenized collection
+        List[str] -- tokens
     """
-    new_collection = OrderedDict()
-    for key in tqdm(collection, desc="tokenizing collection : "):
-        new_collection[key] = tokenize_document(collection[key])
-
-    return new_collection
+    punctuation = _PUNCTUATION.search(text) is not None
+    if punctuation:
+        if "'" in text:
+            text = _LEADING_QUOTE.sub("' ", text)
+        text = _SEPARATORS.sub(r" \g<0> ", text)
+    if any(word in text for word in _CONTRACTED_WORDS):
+        text = _CONTRACTIONS.sub(r"\1\3\5\7\9\11 \2\4\6\8\10\12", text)
+    if not punctuation:
+        return text.split()
+
+    tokens = []
+    chunks = text.split()
+    last = len(chunks) - 1
+    for idx, chunk in enumerate(chunks):
+        if chunk.isalnum():
+            tokens.append(chunk)
+        else:
+            tokens.extend(_split_chunk(chunk, idx == last))
+    return tokens
+
+def tokenize_document(document: str, tokenizer: str = "nltk") -> List[str]:
+    """tokenize a document
+    
+    Arguments:
+        document {str} -- a str representing the document, query, etc..
+    
+    Keyword Arguments:
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use : nltk's word_tokenize,
+                           its regex equivalent (much faster), or a simple split on spaces
+                           for already tokenized text (default: {"nltk"})
+    
+    Raises:
+        Exception: if the tokenizer is not supported
+    
+    Returns:
+        List[str] -- lowered tokens
+    """
+    document = document.lower()
+    if tokenizer == "nltk":
+        from nltk.tokenize import word_tokenize
+        return word_tokenize(document)
+    elif tokenizer == "regex":
+        return regex_tokenize(document)
+    elif tokenizer == "whitespace":
+        return document.split()
+    raise Exception(f"unsupported tokenizer '{tokenizer}', not in {TOKENIZERS}")
 
 def filter_function(token: str) -> bool:
     """determines if a token should be kept
@@ -101,22 +186,6 @@ def filter_function(token: str) -> bool:
         filter_out = True
     return filter_out
 
-def filter_collection(collection: OrdDict[str, str]) -> OrdDict[str, List[str]]:
-    """
-    filter the collection removing numbers and special caracters
-
-    Arguments:
-        collection {OrdDict[str, str]} -- the collection to filter
-    
-    Returns:
-        OrdDict[str, List[str]] -- filtered_collection
-    """
-    new_collection = OrderedDict()
-    for key in tqdm(collection, desc="filtering collection : "):
-        new_collection[key] = [token for token in collection[key] if not filter_function(token)]
-    return new_collection
-
-
 def load_stop_words(stop_word_path: str) -> List[str]:
     """load the list of stop words from a file
     
@@ -130,7 +199,7 @@ def load_stop_words(stop_word_path: str) -> List[str]:
         stp = [word.lower() for word in f.read().split("\n") if word != ""]
     return stp
 
-def remove_stop_words_from_document(d: List[str], stop_words: List[str], exceptions: List[str] = []) -> List[str]:
+def remove_stop_words_from_document(d: List[str], stop_words: Union[List[str], Set[str]], exceptions: List[str] = []) -> List[str]:
     """remove stop words from a list, except for tokens specified in exceptions
 
     Arguments:
@@ -145,33 +214,186 @@ def remove_stop_words_from_document(d: List[str], stop_words: List[str], excepti
     
     return [word for word in d if (word in exceptions) or (word not in stop_words)]
 
-# @timer
-def remove_stop_words_collection(collection: OrdDict[str, List[str]], stop_word_path: str) -> OrdDict[str, List[str]]:
-    """remove all stop words from corpus given a stop words file
+
+class LemmaCache:
+    """
+    Bounded memoization of the lemmatizer and the stemmer
+
+    'self.lemmas' maps (token, wordnet pos) to the lemma given by the WordNet lemmatizer
+    'self.stems' maps a token to the stem given by the Snowball stemmer
+    'self.hits' and 'self.misses' count the lookups served by the cache or computed
+    'self.lemmas' and 'self.stems' each hold at most 'self.max_size' entries, the least recently
+    used entries being evicted first.
+    """
+    def __init__(self, max_size: int = 1000000):
+        self.max_size = max_size
+        self.lemmas: OrdDict[Tuple[str, str], str] = OrderedDict()
+        self.stems: OrdDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lemmatizer = None
+        self._stemmer = None
+
+    def __len__(self) -> int:
+        return len(self.lemmas) + len(self.stems)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # lemmatizer and stemmer are rebuilt lazily, no need to pickle them. The counters are kept,
+        # so that the caches returned by worker processes add up to the hit rate of the build
+        return {"max_size": self.max_size, "lemmas": self.lemmas, "stems": self.stems, "hits": self.hits, "misses": self.misses}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__(state["max_size"])
+        self.lemmas = state["lemmas"]
+        self.stems = state["stems"]
+        self.hits = state.get("hits", 0)
+        self.misses = state.get("misses", 0)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+    def _evict(self, entries: OrdDict[Any, str]):
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    def lemmatize(self, token: str, wordnet_pos: str) -> str:
+        """lemmatize a token with the WordNet lemmatizer, using the cache if possible
+        
+        Arguments:
+            token {str} -- token to lemmatize
+            wordnet_pos {str} -- wordnet POS tag of the token
+        
+        Returns:
+            str -- lemma
+        """
+        key = (token, wordnet_pos)
+        try:
+            lemma = self.lemmas[key]
+            self.lemmas.move_to_end(key)
+            self.hits += 1
+            return lemma
+        except KeyError:
+            self.misses += 1
+        if self._lemmatizer is None:
+            from nltk.stem import WordNetLemmatizer
+            self._lemmatizer = WordNetLemmatizer()
+        lemma = self._lemmatizer.lemmatize(token, wordnet_pos)
+        self.lemmas[key] = lemma
+        self._evict(self.lemmas)
+        return lemma
+
+    def stem(self, token: str) -> str:
+        """stem a token with the Snowball stemmer, using the cache if possible
+        
+        Arguments:
+            token {str} -- token to stem
+        
+        Returns:
+            str -- stem
+        """
+        try:
+            stem = self.stems[token]
+            self.stems.move_to_end(token)
+            self.hits += 1
+            return stem
+        except KeyError:
+            self.misses += 1
+        if self._stemmer is None:
+            from nltk.stem import SnowballStemmer
+            self._stemmer = SnowballStemmer("english")
+        stem = self._stemmer.stem(token)
+        self.stems[token] = stem
+        self._evict(self.stems)
+        return stem
+
+    def update(self, other: "LemmaCache"):
+        """add the entries of another cache (e.g. built by a worker process) to this one
+        
+        Arguments:
+            other {LemmaCache} -- cache to merge into this one
+        """
+        self.lemmas.update(other.lemmas)
+        self._evict(self.lemmas)
+        self.stems.update(other.stems)
+        self._evict(self.stems)
+        self.hits += other.hits
+        self.misses += other.misses
+
+    def save(self, path: str):
+        # the entries only, so that a cache saved by preprocess.py, whose LemmaCache is __main__.LemmaCache,
+        # can be loaded by any script. The counters of the build are not those of the queries
+        state = self.__getstate__()
+        del state["hits"], state["misses"]
+        with open(path, "wb") as f:
+            pkl.dump(state, f)
+
+    @staticmethod
+    def load(path: str) -> "LemmaCache":
+        with open(path, "rb") as f:
+            state = pkl.load(f)
+        cache = LemmaCache.__new__(LemmaCache)
+        cache.__setstate__(state)
+        return cache
+
+# cache shared by the indexing and the query processing of a process
+LEMMA_CACHE = LemmaCache()
+
+def lemma_cache_path(index_path: str) -> str:
+    """path of the lemma cache saved next to an index
     
     Arguments:
-        collection {OrdDict[str, List[str]]} -- corpus of split articles
-        stop_word_path {string} -- path of the stop words file
+        index_path {str} -- path of the index
     
     Returns:
-        {OrdDict[str, List[str]]} -- updated corpus
+        str -- path of the lemma cache
     """
-    stp = load_stop_words(stop_word_path)
-    init_coll_size = get_collection_size(collection)
-    new_corpus = OrderedDict()
-    for key in tqdm(collection, desc="removing stop words"):
-        new_corpus[key] = remove_stop_words_from_document(collection[key], stp, [])
-    end_coll_size = get_collection_size(new_corpus)
+    return f"{index_path}.lemmas"
 
-    # print(f"removing stop word : from {init_coll_size} tokens to {end_coll_size} : {end_coll_size/init_coll_size : .2%}")
+def preload_lemma_cache(index_path: str) -> bool:
+    """load the lemma cache saved next to an index into the shared cache, if it exists
+    
+    Arguments:
+        index_path {str} -- path of the index
+    
+    Returns:
+        bool -- True if a cache was loaded
+    """
+    path = lemma_cache_path(index_path)
+    if not os.path.exists(path):
+        return False
+    LEMMA_CACHE.update(LemmaCache.load(path))
+    return True
 
-    return new_corpus
+# POS tagger of the process, loaded once (see get_tagger)
+_TAGGER: Optional["PerceptronTagger"] = None
 
-def get_collection_size(collection: OrdDict[str, List[str]]) -> int:
-    return sum([len(tokens) for tokens in collection.values()])
+def get_tagger() -> "PerceptronTagger":
+    """get the perceptron POS tagger of the current process, loading it on first use.
+    nltk.pos_tag looks the tagger up again on every call, we keep it resident instead.
+    
+    Returns:
+        PerceptronTagger -- the POS tagger
+    """
+    global _TAGGER
+    if _TAGGER is None:
+        from nltk.tag.perceptron import PerceptronTagger
+        _TAGGER = PerceptronTagger()
+    return _TAGGER
 
+def pos_tag_documents(documents: List[List[str]]) -> List[List[Tuple[str, str]]]:
+    """POS tag a batch of tokenized documents with the resident tagger
+    
+    Arguments:
+        documents {List[List[str]]} -- tokenized documents
+    
+    Returns:
+        List[List[Tuple[str, str]]] -- (token, treebank tag) pairs of each document
+    """
+    return get_tagger().tag_sents(documents)
 
-def lemmatize_document(document: List[str], pos: bool = True) -> List[str]:
+def lemmatize_document(document: List[str], pos: bool = True, cache: Optional[LemmaCache] = None) -> List[str]:
     """
     lemmatize a single sentence, document, query.
     Having a full sentence/query/document allows to use the context for a better lemmatization.
@@ -181,46 +403,46 @@ def lemmatize_document(document: List[str], pos: bool = True) -> List[str]:
     
     Keyword Arguments:
         pos {bool} -- use pos tagging for lemmatization
+        cache {Optional[LemmaCache]} -- memoization cache, defaults to the shared LEMMA_CACHE
     
     Returns:
-        str -- [description]
+        List[str] -- lemmatized document
     """
-    if pos :
-        lemmatizer = WordNetLemmatizer()
-        tags = pos_tag(document)
-        return [lemmatizer.lemmatize(tag[0],get_wordnet_pos(tag[1])) for tag in tags]
-    else : 
-        stemmer = SnowballStemmer("english")
-        return [stemmer.stem(token) for token in document]
+    return lemmatize_documents([document], pos, cache)[0]
 
-# @timer
-def lemmatize_collection(segmented_collection: OrdDict[str, List[str]], pos: bool = True) -> OrdDict[str, List[str]]:
-    """Lemmatize all articles in corpus using pos tags
+def lemmatize_documents(documents: List[List[str]], pos: bool = True, cache: Optional[LemmaCache] = None) -> List[List[str]]:
+    """lemmatize a batch of documents, POS tagging them all at once
     
     Arguments:
-        segmented_collection {OrdDict[str, List[str]]} -- corpus without stop words
-    
-    Returns:
-        {OrdDict[str, List[str]]} -- lemmatized corpus
-    """
-    lemmatized_collection = OrderedDict()
-    for key in tqdm(segmented_collection, desc="lemmatizing collection : "):
-        lemmatized_collection[key] = lemmatize_document(segmented_collection[key], pos)
-    return lemmatized_collection
-
-def construct_documents_mapping(collection: OrdDict[str, Any]) -> OrdDict[int, str]:
-    """get the default mapping between documents paths and ids for an inverted index
+        documents {List[List[str]]} -- tokenized documents
     
-    Arguments:
-        collection {OrdDict[str, Any]} -- collection 
+    Keyword Arguments:
+        pos {bool} -- use pos tagging for lemmatization
+        cache {Optional[LemmaCache]} -- memoization cache, defaults to the shared LEMMA_CACHE
     
     Returns:
-        List[str] -- [description]
-    """    
-    mapping = OrderedDict()
-    for idx, key in enumerate(collection.keys()):
-        mapping[idx] = key
-    return mapping
+        List[List[str]] -- lemmatized documents
+    """
+    if cache is None:
+        cache = LEMMA_CACHE
+    if pos :
+        return [
+            [cache.lemmatize(token, get_wordnet_pos(tag)) for token, tag in tags]
+            for tags in pos_tag_documents(documents)
+        ]
+    else : 
+        return [[cache.stem(token) for token in document] for document in documents]
+
+def batches(iterable: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """group the elements of an iterable in lists of batch_size elements (the last one can be shorter)"""
+    batch = []
+    for element in iterable:
+        batch.append(element)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
 
 @dataclass
 class StatCollection:
@@ -256,20 +478,8 @@ def get_stats_document(document: List[str]) -> OrdDict[str, float]:
     
     return stats
 
-# @timer
-def get_stats_collection(processed_collection: OrdDict[int, List[str]]) -> StatCollection:
-    """Computes usefull stats for the collection
-    
-    Arguments:
-        processed_collection {Dict[str, List[str]]} -- collection of lemmatized articles
-    
-    Returns:
-        StatCollection -- Statictics of the collection
-    """
-    stats={}
-    for key in processed_collection:
-        stats[key] = get_stats_document(processed_collection[key])
-    return StatCollection(len(processed_collection), stats)
+def new_index_version() -> str:
+    return uuid4().hex
 
 @dataclass
 class InvertedIndex:
@@ -282,6 +492,10 @@ class InvertedIndex:
         - 1 : simple doc index, we save only the id of the documents in which the term appears
         - 2 : frequency index, we save both the id of the documents and the tf in the document
         - 3 : position index, we save, for each term, the id of the document, and all the position of the terms
+    'self.version' identifies the content of the index, a new index gets a new version
+    (used to invalidate caches of query results, see query_cache)
+    'self.weights' maps a weighting scheme of the documents to the precomputed document weights
+    of a frequency index (see vectorial_query.DocumentWeights), None if they are not computed yet
     """
     itype: int
     index: Union[
@@ -291,120 +505,386 @@ class InvertedIndex:
         ]
     mapping: OrdDict[int, str]
     stats: StatCollection
+    version: str = field(default_factory=new_index_version, compare=False)
+    weights: Optional[Dict[str, Any]] = field(default=None, compare=False)
 
-# TODO: @Antoine-marchais : This part could be refactored with auxiliary function for lisibility.
-# @timer
-def build_inverted_index(
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        # indexes pickled before versions existed get a version when they are loaded
+        if "version" not in state:
+            self.version = new_index_version()
+
+def prepare_document(document: str, stop_words: Set[str], tokenizer: str = "nltk") -> List[str]:
+    """first steps of the preprocessing pipeline, before lemmatization
+    (tokenization, stop words, filtering)
+    
+    Arguments:
+        document {str} -- raw document
+        stop_words {Set[str]} -- stop words
+    
+    Keyword Arguments:
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use (default: {"nltk"})
+    
+    Returns:
+        List[str] -- tokens to lemmatize
+    """
+    tokens = tokenize_document(document, tokenizer)
+    tokens = remove_stop_words_from_document(tokens, stop_words)
+    return [token for token in tokens if not filter_function(token)]
+
+def process_document(document: str, stop_words: Set[str], pos: bool = True, tokenizer: str = "nltk") -> List[str]:
+    """apply the whole preprocessing pipeline to a single document
+    (tokenization, stop words, filtering, lemmatization, stop words)
+    
+    Arguments:
+        document {str} -- raw document
+        stop_words {Set[str]} -- stop words
+    
+    Keyword Arguments:
+        pos {bool} -- use pos tagging for lemmatization
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use (default: {"nltk"})
+    
+    Returns:
+        List[str] -- processed document
+    """
+    tokens = lemmatize_document(prepare_document(document, stop_words, tokenizer), pos)
+    return remove_stop_words_from_document(tokens, stop_words)
+
+def process_documents(
     collection: OrdDict[str, str],
     stop_words_path: str,
-    type_index: int = 1,
-    pos: bool = True
-    ) -> InvertedIndex:
-    """Build an inverted index from a corpus
+    pos: bool = True,
+    batch_size: int = 256,
+    tokenizer: str = "nltk"
+    ) -> Iterator[Tuple[str, List[str]]]:
+    """lazily preprocess a collection, batch_size documents at a time, so that
+    no intermediate copy of the whole collection is ever built.
+    Documents of a batch are POS tagged together by the resident tagger (see pos_tag_documents).
     
     Arguments:
         collection {OrdDict[str, str]} -- corpus
+        stop_words_path {str} -- path of the stop words file
     
     Keyword Arguments:
-        type_index {int} -- type of index : document(1) frequency(2) position(3) (default: {1})
         pos {bool} -- use pos tagging for lemmatization
+        batch_size {int} -- number of documents lemmatized at once (default: {256})
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use (default: {"nltk"})
     
-    Returns:
-        {InvertedIndex} -- inverted index of given type
+    Yields:
+        Tuple[str, List[str]] -- document key and processed document
     """
-    collection = tokenize_collection(collection)
-    collection = remove_stop_words_collection(collection, stop_words_path)
-    collection = filter_collection(collection)
-    collection = lemmatize_collection(collection, pos)
-    collection = remove_stop_words_collection(collection, stop_words_path)
-    mapping = OrderedDict()
-    index = OrderedDict()
-    # docs_stats = OrderedDict()
+    stop_words = set(load_stop_words(stop_words_path))
+    for key_batch in batches(collection, batch_size):
+        documents = [prepare_document(collection[key], stop_words, tokenizer) for key in key_batch]
+        for key, tokens in zip(key_batch, lemmatize_documents(documents, pos)):
+            yield key, remove_stop_words_from_document(tokens, stop_words)
 
-    doc_id = 0
+def add_document(index: OrdDict[str, OrdDict[int, Any]], doc_id: int, terms: List[str], type_index: int):
+    """add the postings of a processed document to an index
+    
+    Arguments:
+        index {OrdDict[str, OrdDict[int, Any]]} -- index to update
+        doc_id {int} -- id of the document, greater than all the ids already in the index
+        terms {List[str]} -- processed document
+        type_index {int} -- type of index : document(1) frequency(2) position(3)
+    """
     if type_index == 1:
-        for document in tqdm(collection, desc="building index : "):
-
-            for term in collection[document]:
-
+        for term in terms:
+            try:
                 try:
-                    try:
-                        _ = index[term][doc_id]
-                        # if pass, do nothing
-                    except KeyError:
-                        index[term][doc_id]=True
-
+                    _ = index[term][doc_id]
+                    # if pass, do nothing
                 except KeyError:
-                    index[term]=OrderedDict()
                     index[term][doc_id]=True
 
-            
-            mapping[doc_id] = document
-            doc_id += 1
+            except KeyError:
+                index[term]=OrderedDict()
+                index[term][doc_id]=True
 
-    elif type_index ==2:
-        for document in tqdm(collection, desc="building index : "):
-            for term in collection[document]:
+    elif type_index == 2:
+        for term in terms:
+            try:
                 try:
-                    try:
-                        index[term][doc_id] += 1
-                    except KeyError:
-                        index[term][doc_id]= 1
+                    index[term][doc_id] += 1
                 except KeyError:
-                    index[term]=OrderedDict()
-                    index[term][doc_id]=1
-
-
-            mapping[doc_id] = document
-            doc_id += 1
+                    index[term][doc_id]= 1
+            except KeyError:
+                index[term]=OrderedDict()
+                index[term][doc_id]=1
 
-    elif type_index==3:
-        for document in tqdm(collection, desc="building index : "):
-            pos=0
-            for term in collection[document]:
+    else:
+        for position, term in enumerate(terms):
+            try:
                 try:
-                    try:
-                        index[term][doc_id].append(pos)
-                    except KeyError:
-                        index[term][doc_id]= [pos]
+                    index[term][doc_id].append(position)
                 except KeyError:
-                    index[term]=OrderedDict()
-                    index[term][doc_id]=[pos]
+                    index[term][doc_id]= [position]
+            except KeyError:
+                index[term]=OrderedDict()
+                index[term][doc_id]=[position]
 
-                pos += 1
-            
-            mapping[doc_id] = document
-            doc_id += 1
-    else:
+def index_documents(
+    processed_documents: Iterable[Tuple[str, List[str]]],
+    type_index: int = 1,
+    first_doc_id: int = 0,
+    nb_documents: Optional[int] = None
+    ) -> InvertedIndex:
+    """index processed documents as they come, giving them consecutive ids.
+    The statistics of each document are computed in the same pass.
+    
+    Arguments:
+        processed_documents {Iterable[Tuple[str, List[str]]]} -- documents keys and processed documents
+    
+    Keyword Arguments:
+        type_index {int} -- type of index : document(1) frequency(2) position(3) (default: {1})
+        first_doc_id {int} -- id of the first document (default: {0})
+        nb_documents {Optional[int]} -- number of documents, only used for the progress bar (default: {None})
+    
+    Raises:
+        Exception: if the index type is not supported
+    
+    Returns:
+        InvertedIndex -- inverted index of the documents
+    """
+    if type_index not in (1, 2, 3):
         raise Exception(f"index type '{type_index}' is not supported")
 
-    stats = get_stats_collection({doc_id:collection[mapping[doc_id]] for doc_id in mapping})
+    mapping = OrderedDict()
+    index = OrderedDict()
+    doc_stats = {}
+
+    doc_id = first_doc_id
+    for document, terms in progress_bar(processed_documents, total=nb_documents, desc="building index : "):
+        add_document(index, doc_id, terms, type_index)
+        mapping[doc_id] = document
+        doc_stats[doc_id] = get_stats_document(terms)
+        doc_id += 1
+
+    return InvertedIndex(type_index, index, mapping, StatCollection(len(mapping), doc_stats))
+
+def split_collection(collection: OrdDict[str, Any], n_shards: int) -> List[OrdDict[str, Any]]:
+    """split a collection into contiguous shards of (almost) equal size,
+    keeping the order of the documents
+    
+    Arguments:
+        collection {OrdDict[str, Any]} -- collection to split
+        n_shards {int} -- number of shards
+    
+    Returns:
+        List[OrdDict[str, Any]] -- non empty shards, in the collection order
+    """
+    keys = list(collection.keys())
+    shard_size, remainder = divmod(len(keys), n_shards)
+    shards = []
+    start = 0
+    for shard_idx in range(n_shards):
+        end = start + shard_size + (1 if shard_idx < remainder else 0)
+        if end > start:
+            shards.append(OrderedDict((key, collection[key]) for key in keys[start:end]))
+        start = end
+    return shards
+
+def build_shard_index(
+    shard: OrdDict[str, str],
+    stop_words_path: str,
+    type_index: int,
+    pos: bool,
+    first_doc_id: int,
+    tokenizer: str = "nltk",
+    batch_size: int = 256
+    ) -> InvertedIndex:
+    """build the partial inverted index of a shard, its documents ids starting at first_doc_id
+    
+    Arguments:
+        shard {OrdDict[str, str]} -- contiguous part of the corpus
+        stop_words_path {str} -- path of the stop words file
+        type_index {int} -- type of index : document(1) frequency(2) position(3)
+        pos {bool} -- use pos tagging for lemmatization
+        first_doc_id {int} -- id of the first document of the shard in the whole collection
+    
+    Keyword Arguments:
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use (default: {"nltk"})
+        batch_size {int} -- number of documents lemmatized at once (default: {256})
+    
+    Returns:
+        InvertedIndex -- partial inverted index
+    """
+    processed_documents = process_documents(shard, stop_words_path, pos, batch_size, tokenizer)
+    return index_documents(processed_documents, type_index, first_doc_id, len(shard))
+
+def build_shard_index_with_cache(
+    shard: OrdDict[str, str],
+    stop_words_path: str,
+    type_index: int,
+    pos: bool,
+    first_doc_id: int,
+    tokenizer: str = "nltk",
+    batch_size: int = 256
+    ) -> Tuple[InvertedIndex, LemmaCache]:
+    """same as build_shard_index, also returning the lemma cache filled by the process
+    
+    Returns:
+        Tuple[InvertedIndex, LemmaCache] -- partial inverted index and lemma cache of the process
+    """
+    return build_shard_index(shard, stop_words_path, type_index, pos, first_doc_id, tokenizer, batch_size), LEMMA_CACHE
+
+def merge_inverted_indexes(partial_indexes: List[InvertedIndex]) -> InvertedIndex:
+    """merge partial indexes built on consecutive shards of a collection.
+    Partial indexes must be given in the order of the shards, so that the merged
+    index is identical to the one built on the whole collection at once.
+    
+    Arguments:
+        partial_indexes {List[InvertedIndex]} -- partial indexes, in shards order
     
-    return InvertedIndex(type_index, index, mapping, stats)
+    Returns:
+        InvertedIndex -- merged inverted index
+    """
+    type_index = partial_indexes[0].itype
+    index = OrderedDict()
+    mapping = OrderedDict()
+    doc_stats = {}
+    for partial_index in partial_indexes:
+        assert partial_index.itype == type_index, Exception(f"cannot merge indexes of types {type_index} and {partial_index.itype}")
+        for term, postings in partial_index.index.items():
+            try:
+                index[term].update(postings)
+            except KeyError:
+                index[term] = postings
+        mapping.update(partial_index.mapping)
+        doc_stats.update(partial_index.stats.doc_stats)
+    return InvertedIndex(type_index, index, mapping, StatCollection(len(mapping), doc_stats))
+
+# @timer
+def build_inverted_index(
+    collection: OrdDict[str, str],
+    stop_words_path: str,
+    type_index: int = 1,
+    pos: bool = True,
+    workers: int = 1,
+    tokenizer: str = "nltk",
+    batch_size: int = 256
+    ) -> InvertedIndex:
+    """Build an inverted index from a corpus
+    
+    Arguments:
+        collection {OrdDict[str, str]} -- corpus
+    
+    Keyword Arguments:
+        type_index {int} -- type of index : document(1) frequency(2) position(3) (default: {1})
+        pos {bool} -- use pos tagging for lemmatization
+        workers {int} -- number of processes used to build the index. With more than one worker,
+                         the corpus is split in document-range shards indexed in parallel and merged (default: {1})
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use (default: {"nltk"})
+        batch_size {int} -- number of documents POS tagged and lemmatized at once, in each process (default: {256})
+    
+    Returns:
+        {InvertedIndex} -- inverted index of given type
+    """
+    if type_index not in (1, 2, 3):
+        raise Exception(f"index type '{type_index}' is not supported")
+
+    if workers > 1 and len(collection) > 1:
+        shards = split_collection(collection, workers)
+        first_doc_ids = []
+        first_doc_id = 0
+        for shard in shards:
+            first_doc_ids.append(first_doc_id)
+            first_doc_id += len(shard)
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            results = list(executor.map(
+                build_shard_index_with_cache,
+                shards,
+                repeat(stop_words_path),
+                repeat(type_index),
+                repeat(pos),
+                first_doc_ids,
+                repeat(tokenizer),
+                repeat(batch_size)
+            ))
+        partial_indexes = []
+        for partial_index, lemma_cache in results:
+            partial_indexes.append(partial_index)
+            LEMMA_CACHE.update(lemma_cache)
+        return merge_inverted_indexes(partial_indexes)
+
+    return build_shard_index(collection, stop_words_path, type_index, pos, 0, tokenizer, batch_size)
 
 def get_wordnet_pos(treebank_tag: str) -> str:
     """Convert treebank tags into wordnet POS tag"""
 
     if treebank_tag.startswith('J'):
-        return wordnet.ADJ
+        return WORDNET_ADJ
     elif treebank_tag.startswith('V'):
-        return wordnet.VERB
+        return WORDNET_VERB
     elif treebank_tag.startswith('N'):
-        return wordnet.NOUN
+        return WORDNET_NOUN
     elif treebank_tag.startswith('R'):
-        return wordnet.ADV
+        return WORDNET_ADV
     else:
-        return wordnet.NOUN
+        return WORDNET_NOUN
+
+# index formats supported by save_index
+INDEX_FORMATS = ("pickle", "binary")
+
+class IndexUnpickler(pkl.Unpickler):
+    """
+    Unpickler of the pickled indexes. preprocess.py saves them while it runs as a script,
+    so their classes are __main__.InvertedIndex and __main__.StatCollection : they are looked up
+    in this module instead, whatever script loads the index.
+    """
+    def find_class(self, module: str, name: str) -> Any:
+        if module == "__main__":
+            module = "preprocess"
+        return super().find_class(module, name)
 
 # @timer
-def load_index(index_path:str) -> InvertedIndex:
+def load_index(index_path:str, compact: bool = False) -> InvertedIndex:
+    """load an index saved with save_index, in any format
+    
+    Arguments:
+        index_path {str} -- path of the index
+    
+    Keyword Arguments:
+        compact {bool} -- convert the postings of an in-memory index to arrays (see compact_index) (default: {False})
+    
+    Returns:
+        InvertedIndex -- the index. For a binary index, postings stay on disk until they are accessed
+    """
+    from disk_index import is_disk_index, load_disk_index
+    if is_disk_index(index_path):
+        return load_disk_index(index_path)
     with open(index_path, "rb") as f:
-        return pkl.load(f)
+        index = IndexUnpickler(f).load()
+    if compact:
+        from compact_index import compact_index
+        index = compact_index(index)
+    return index
 
 # @timer
-def save_index(index_path: str, index: InvertedIndex):
-    with open(index_path,"wb") as f:
-        pkl.dump(index,f)
+def save_index(index_path: str, index: InvertedIndex, index_format: str = "pickle", codec: str = "raw"):
+    """save an index
+    
+    Arguments:
+        index_path {str} -- path of the index
+        index {InvertedIndex} -- index to save
+    
+    Keyword Arguments:
+        index_format {str} -- <pickle|binary> pickle the whole index, or use the memory-mapped
+                              binary format of disk_index (default: {"pickle"})
+        codec {str} -- <raw|vbyte|gamma> codec of the postings, for the binary format (default: {"raw"})
+    
+    Raises:
+        Exception: if the format is not supported
+    """
+    if index_format == "binary":
+        from disk_index import save_disk_index
+        save_disk_index(index_path, index, codec)
+    elif index_format == "pickle":
+        with open(index_path,"wb") as f:
+            pkl.dump(index,f)
+    else:
+        raise Exception(f"unsupported index format '{index_format}', not in {INDEX_FORMATS}")
 
 
 if __name__ == "__main__" :
@@ -412,10 +892,27 @@ if __name__ == "__main__" :
     parser.add_argument("index_type", type=int, help="type of the index to build")
     parser.add_argument("--pos", type=bool, default=POS, help="use the the Part-Of-Speech (pos) lemmatization, or simple stemmer (default=True)")
     parser.add_argument("output", type=str, default=PATH_INDEX, help="path where the index will be saved")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used to build the index (default=1)")
+    parser.add_argument("--batch-size", type=int, default=256, help="number of documents POS tagged and lemmatized at once (default=256)")
+    parser.add_argument("--memory-budget", type=int, default=None, help="build the index with SPIMI, spilling blocks to disk above this memory budget (in MB), and write it as a binary index")
+    parser.add_argument("--tokenizer", default=TOKENIZER, choices=TOKENIZERS, help=f"tokenizer used on the documents (default={TOKENIZER})")
+    parser.add_argument("--format", default=None, choices=INDEX_FORMATS, help="format of the saved index (default=pickle, binary with --memory-budget)")
+    parser.add_argument("--codec", default="raw", choices=CODECS, help="compression of the postings of a binary index (default=raw)")
+    parser.add_argument("--compact", action="store_true", help="store the postings of a pickle index as arrays (see compact_index)")
+    parser.add_argument("--weights", nargs="*", default=None, help="weighting schemes of the documents whose weights and norms are precomputed for a frequency index (default=all, none if empty)")
+    parser.add_argument("--champions", type=int, default=None, help="also store champion lists of this size, and tiers of postings, with the precomputed weights (see champions)")
+    parser.add_argument("--impact-ordered", action="store_true", help="also store the postings sorted by quantized weight, with the precomputed weights (see impact_index)")
     args = parser.parse_args()
 
     valid_index_types =  (1, 2, 3)
     assert args.index_type in valid_index_types, Exception(f"invalid index type {args.index_type}, not in {valid_index_types}")
+    if args.memory_budget is not None:
+        # the merged runs are streamed to a binary index : a pickle index would hold the whole index in memory
+        if args.format == "pickle" or args.compact:
+            parser.error("--memory-budget writes a binary index, it cannot be used with --format pickle or --compact")
+        args.format = "binary"
+    elif args.format is None:
+        args.format = "pickle"
     print("reading corpus")
     if os.path.exists(PATH_DATA_BIN) and not DEV_MODE:
         print("loading from binary")
@@ -428,6 +925,44 @@ if __name__ == "__main__" :
                 pkl.dump(corpus, f)
     
     print(f"build inverted index of type {args.index_type} {'with Part-Of-Speech lemmatization' if args.pos else 'with Snowball stemmer'}")
-    index = build_inverted_index(corpus, PATH_STOP_WORDS, type_index=args.index_type, pos=args.pos)
-    print(f"saving index with pickle at {args.output}")
-    save_index(args.output, index)
\ No newline at end of file
+    if args.memory_budget is not None:
+        # merged runs are written straight to disk, the whole index is never in memory
+        from spimi import build_disk_index_spimi
+        print(f"building and saving binary index at {args.output}")
+        build_disk_index_spimi(corpus, PATH_STOP_WORDS, args.output, type_index=args.index_type, pos=args.pos,
+            memory_budget=args.memory_budget, tokenizer=args.tokenizer, codec=args.codec)
+        # spimi lemmatizes with the cache of the preprocess module, not the one of this script
+        import preprocess
+        LEMMA_CACHE.update(preprocess.LEMMA_CACHE)
+        if args.index_type == 2:
+            from disk_index import load_disk_index, save_weights
+            from vectorial_query import WD_SCHEMES, precompute_weights
+            print("precomputing document weights")
+            disk_index = load_disk_index(args.output)
+            disk_index.weights = precompute_weights(disk_index, WD_SCHEMES if args.weights is None else args.weights)
+            if args.champions is not None:
+                from champions import add_tiers
+                add_tiers(disk_index, disk_index.weights.keys(), args.champions)
+            if args.impact_ordered:
+                from impact_index import add_impact_ordered
+                add_impact_ordered(disk_index, disk_index.weights.keys())
+            save_weights(args.output, disk_index.weights)
+    else:
+        index = build_inverted_index(corpus, PATH_STOP_WORDS, type_index=args.index_type, pos=args.pos, workers=args.workers, tokenizer=args.tokenizer, batch_size=args.batch_size)
+        if args.index_type == 2:
+            from vectorial_query import WD_SCHEMES, precompute_weights
+            print("precomputing document weights")
+            index.weights = precompute_weights(index, WD_SCHEMES if args.weights is None else args.weights)
+            if args.champions is not None:
+                from champions import add_tiers
+                add_tiers(index, index.weights.keys(), args.champions)
+            if args.impact_ordered:
+                from impact_index import add_impact_ordered
+                add_impact_ordered(index, index.weights.keys())
+        if args.compact:
+            from compact_index import compact_index
+            index = compact_index(index)
+        print(f"saving index as {args.format} at {args.output}")
+        save_index(args.output, index, args.format, args.codec)
+    print(f"saving lemma cache at {lemma_cache_path(args.output)} ({len(LEMMA_CACHE)} entries, hit rate {LEMMA_CACHE.hit_rate:.2%})")
+    LEMMA_CACHE.save(lemma_cache_path(args.output))
\ No newline at end of file
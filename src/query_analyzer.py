@@ -0,0 +1,189 @@
+"""
+Analysis of the queries : tokenization, stop words removal and lemmatization (or stemming).
+
+A QueryAnalyzer is built once, with the stop words as a set, and keeps the lemmatizer, the stemmer
+(through a LemmaCache) and the POS tagger (see preprocess.get_tagger) resident. The analyzed queries
+are cached, so a query asked again, eg by an evaluation or through the server, is not analyzed twice.
+Both query models go through the analyzer of the process (see get_query_analyzer).
+"""
+import argparse
+import time
+
+from typing import List, Dict, Iterable, FrozenSet, Optional
+
+from preprocess import tokenize_document, remove_stop_words_from_document, load_stop_words, lemmatize_document, LemmaCache, LEMMA_CACHE
+from query_cache import QueryCache
+
+from config import PATH_STOP_WORDS, POS, TOKENIZER
+
+class QueryAnalyzer:
+    """
+    Analyzer of the queries, holding the resources of the analysis and a cache of the analyzed queries
+
+    'self.stop_words' is the set of stop words removed from the queries
+    'self.pos' and 'self.tokenizer' are the default options of the analysis
+    'self.lemma_cache' memoizes the lemmatizer and the stemmer
+    'self.cache' maps (query, pos, tokenizer, kept operators) to the analyzed query
+    """
+    def __init__(
+        self,
+        stop_words_path: str = PATH_STOP_WORDS,
+        pos: bool = POS,
+        tokenizer: str = TOKENIZER,
+        lemma_cache: Optional[LemmaCache] = None,
+        cache: Optional[QueryCache] = None
+        ):
+        self.stop_words: FrozenSet[str] = frozenset(load_stop_words(stop_words_path))
+        self.pos = pos
+        self.tokenizer = tokenizer
+        self.lemma_cache = lemma_cache if lemma_cache is not None else LEMMA_CACHE
+        self.cache = cache if cache is not None else QueryCache(max_bytes=8 * 2**20)
+
+    def analyze(
+        self,
+        query: str,
+        pos: Optional[bool] = None,
+        tokenizer: Optional[str] = None,
+        lemma_cache: Optional[LemmaCache] = None
+        ) -> List[str]:
+        """analyze a vectorial query
+
+        Arguments:
+            query {str} -- base query string, as input by the user
+
+        Keyword Arguments:
+            pos {Optional[bool]} -- use pos tagging for lemmatization, defaults to self.pos
+            tokenizer {Optional[str]} -- <nltk|regex|whitespace> tokenizer to use, defaults to self.tokenizer
+            lemma_cache {Optional[LemmaCache]} -- lemma cache used instead of self.lemma_cache,
+                                                  the analyzed query is then not cached (default: {None})
+
+        Returns:
+            List[str] -- processed query, after removing stop words and lemmatization
+        """
+        return self._cached(query, frozenset(), pos, tokenizer, lemma_cache)
+
+    def analyze_boolean(
+        self,
+        query: str,
+        operators: Iterable[str],
+        pos: Optional[bool] = None,
+        tokenizer: Optional[str] = None,
+        lemma_cache: Optional[LemmaCache] = None
+        ) -> List[str]:
+        """analyze a boolean query, keeping its logical operators even if they are stop words
+
+        Arguments:
+            query {str} -- base query string, as input by the user
+            operators {Iterable[str]} -- logical operators of the query language
+
+        Keyword Arguments:
+            pos {Optional[bool]} -- use pos tagging for lemmatization, defaults to self.pos
+            tokenizer {Optional[str]} -- <nltk|regex|whitespace> tokenizer to use, defaults to self.tokenizer
+            lemma_cache {Optional[LemmaCache]} -- lemma cache used instead of self.lemma_cache,
+                                                  the analyzed query is then not cached (default: {None})
+
+        Returns:
+            List[str] -- processed query, after lemmatization and removing stop words
+        """
+        return self._cached(query, frozenset(operators), pos, tokenizer, lemma_cache)
+
+    def _cached(self, query: str, operators: FrozenSet[str], pos: Optional[bool], tokenizer: Optional[str], lemma_cache: Optional[LemmaCache]) -> List[str]:
+        pos = self.pos if pos is None else pos
+        tokenizer = self.tokenizer if tokenizer is None else tokenizer
+        if lemma_cache is not None:
+            return self._analyze(query, operators, pos, tokenizer, lemma_cache)
+        key = (query, pos, tokenizer, operators)
+        analyzed = self.cache.get(key)
+        if analyzed is None:
+            analyzed = tuple(self._analyze(query, operators, pos, tokenizer, self.lemma_cache))
+            self.cache.put(key, analyzed)
+        return list(analyzed)
+
+    def _analyze(self, query: str, operators: FrozenSet[str], pos: bool, tokenizer: str, lemma_cache: LemmaCache) -> List[str]:
+        tokens = tokenize_document(query, tokenizer)
+        tokens = [token for token in tokens if token in operators or token not in self.stop_words]
+        if pos:
+            # the whole query is lemmatized at once, for the POS tagger to use the context of each token
+            lemmatized_query = lemmatize_document(tokens, pos=True, cache=lemma_cache)
+        else:
+            # stemming needs no context, the operators are not stemmed
+            lemmatized_query = [token if token in operators else lemma_cache.stem(token) for token in tokens]
+        if len(operators) == 0:
+            return lemmatized_query
+
+        assert len(lemmatized_query) == len(tokens), Exception("lemmatization should not remove tokens")
+        # put back logical operators in case they have been changed with lemmatization
+        lemmatized_query = [token if token in operators else lemma for token, lemma in zip(tokens, lemmatized_query)]
+        # second pass, on the lemmas
+        return [word for word in lemmatized_query if word in operators or word not in self.stop_words]
+
+# analyzer of the process, built on first use (see get_query_analyzer)
+_QUERY_ANALYZER: Optional[QueryAnalyzer] = None
+
+def get_query_analyzer() -> QueryAnalyzer:
+    """get the query analyzer of the current process, building it on first use
+
+    Returns:
+        QueryAnalyzer -- the query analyzer
+    """
+    global _QUERY_ANALYZER
+    if _QUERY_ANALYZER is None:
+        _QUERY_ANALYZER = QueryAnalyzer()
+    return _QUERY_ANALYZER
+
+def analyze_without_analyzer(query: str, pos: bool, tokenizer: str) -> List[str]:
+    """analysis of a vectorial query without an analyzer, reading the stop words for each query,
+    as the query models did before the analyzer (reference of benchmark_analysis)"""
+    tokens = tokenize_document(query, tokenizer)
+    stop_words = load_stop_words(PATH_STOP_WORDS)
+    tokens = remove_stop_words_from_document(tokens, stop_words, [])
+    return lemmatize_document(tokens, pos=pos)
+
+def benchmark_analysis(queries: List[str], pos: bool = POS, tokenizer: str = TOKENIZER, rounds: int = 3) -> Dict[str, float]:
+    """
+    per-query analysis latency without an analyzer, with a new analyzer (cold cache)
+    and with an analyzer which already analyzed the queries
+
+    Arguments:
+        queries {List[str]} -- queries, as input by the user
+
+    Keyword Arguments:
+        pos {bool} -- use pos tagging for lemmatization (default: {POS})
+        tokenizer {str} -- tokenizer to use (default: {TOKENIZER})
+        rounds {int} -- number of times the queries are analyzed (default: {3})
+
+    Returns:
+        Dict[str, float] -- mean latency (µs) of each way
+    """
+    def mean_latency(analyze) -> float:
+        start = time.perf_counter()
+        for query in queries:
+            analyze(query)
+        return 1e6 * (time.perf_counter() - start) / max(len(queries), 1)
+
+    # the lemmas are computed once beforehand, so all the ways hit the same lemma cache
+    for query in queries:
+        analyze_without_analyzer(query, pos, tokenizer)
+
+    report = {"without_analyzer": min(mean_latency(lambda query: analyze_without_analyzer(query, pos, tokenizer)) for _ in range(rounds))}
+    cold: List[float] = []
+    for _ in range(rounds):
+        analyzer = QueryAnalyzer(pos=pos, tokenizer=tokenizer)
+        cold.append(mean_latency(analyzer.analyze))
+    report["cold_analyzer"] = min(cold)
+    report["warm_analyzer"] = min(mean_latency(analyzer.analyze) for _ in range(rounds))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries", help="file with one query per line")
+    parser.add_argument("--pos", type=bool, default=POS, help="<True|False> wether to use pos lemmatization or not")
+    parser.add_argument("--tokenizer", default=TOKENIZER, help=f"tokenizer used on the queries (defaults to {TOKENIZER})")
+    args = parser.parse_args()
+
+    with open(args.queries) as f:
+        queries = [line.strip() for line in f if line.strip()]
+    report = benchmark_analysis(queries, args.pos, args.tokenizer)
+    print(f"{'analysis':>18} {'latency (µs)':>13}")
+    for name, latency in report.items():
+        print(f"{name:>18} {latency:>13.1f}")
@@ -0,0 +1,123 @@
+import sys
+
+from array import array
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Tuple, Hashable, OrderedDict as OrdDict
+
+from bitmap import Bitmap
+
+def nbytes(value: Any) -> int:
+    """approximate memory taken by a cached value (containers, and the objects they hold)
+
+    Arguments:
+        value {Any} -- cached value
+
+    Returns:
+        int -- size in bytes
+    """
+    if isinstance(value, Bitmap):
+        return sys.getsizeof(value) + sys.getsizeof(value.bits)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(nbytes(item) for item in value)
+    # arrays hold their buffer, small ints and booleans are shared by the interpreter
+    if isinstance(value, int) and -5 <= value <= 256:
+        return 0
+    return sys.getsizeof(value)
+
+def compact_doc_ids(doc_ids: Any) -> Any:
+    """store a list of document ids as an array, bitmaps and arrays are kept as they are"""
+    return array("I", doc_ids) if isinstance(doc_ids, list) else doc_ids
+
+class QueryCache:
+    """
+    Bounded LRU cache of query processing results, eg lemmatized queries and the documents
+    of query sub-expressions (see query_plan.evaluate)
+
+    'self.entries' maps a key to its value and its size in bytes
+    'self.hits' and 'self.misses' count the lookups served by the cache or not
+    'self.version' is the version of the index the cached values were computed with :
+    checking another version (see check_version) empties the cache.
+    When the values take more than 'self.max_bytes', the least recently used entries are evicted first.
+    """
+    def __init__(self, max_bytes: int = 64 * 2**20, version: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.version = version
+        self.entries: OrdDict[Hashable, Tuple[Any, int]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def check_version(self, version: str):
+        """empty the cache if its values were computed on another version of the index
+
+        Arguments:
+            version {str} -- version of the index about to be queried, ie InvertedIndex.version
+        """
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """value of a key, marking it as the most recently used
+
+        Arguments:
+            key {Hashable} -- key
+
+        Returns:
+            Optional[Any] -- cached value, None if the key is not in the cache
+        """
+        try:
+            value, _ = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """add a value, evicting the least recently used ones beyond the memory budget.
+        A value larger than the whole budget is not cached.
+
+        Arguments:
+            key {Hashable} -- key
+            value {Any} -- value, not None
+        """
+        size = nbytes(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        """counters of the cache"""
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evictions": self.evictions,
+        }
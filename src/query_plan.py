@@ -0,0 +1,309 @@
+"""
+Cost-based planning of boolean queries.
+
+The postfix query given by query_to_postfix is turned into a tree, where chains of the associative
+AND and OR operators are flattened into n-ary nodes. The operands of a node are then ordered by
+their estimated number of documents (from the document frequencies of the terms) :
+an AND starts from its rarest operand and stops as soon as the intersection is empty,
+an OR merges its smallest operands first, and the right side of a NAND is only evaluated
+if its left side has documents.
+
+NOT nodes are not materialized : a node evaluates to a Result, ie documents that may be
+complemented (see bool_query.and_results and bool_query.or_results). The complemented operands
+of an AND come after the others, so that they are only removed from the documents found.
+"""
+from dataclasses import dataclass
+from typing import List, Tuple, Dict, Any, Union, Optional, Iterable, Mapping
+
+from bool_query import LOGICAL_TOKENS, LOGICAL_TOKENS_VALUES, Result, and_results, or_results, not_result, materialize, get_doc_ids
+from query_cache import QueryCache, compact_doc_ids
+
+@dataclass(frozen=True)
+class Term:
+    term: str
+
+@dataclass(frozen=True)
+class Operation:
+    operator: LOGICAL_TOKENS
+    operands: Tuple["Node", ...]
+
+Node = Union[Term, Operation]
+
+# operators whose chains can be flattened, ie (a AND b) AND c -> AND(a, b, c)
+ASSOCIATIVE_OPERATORS = (LOGICAL_TOKENS.AND, LOGICAL_TOKENS.OR)
+
+def parse_postfix(postfix_query: List[str]) -> Node:
+    """build the tree of a postfix query, flattening chains of AND and OR,
+    and removing double negations
+
+    Arguments:
+        postfix_query {List[str]} -- query in postfix form
+
+    Raises:
+        IndexError: if an operator is missing an operand
+        Exception: if operands are missing an operator
+
+    Returns:
+        Node -- root of the query tree
+    """
+    stack: List[Node] = []
+    for token in postfix_query:
+        if token == LOGICAL_TOKENS.NOT.value:
+            operand = stack.pop()
+            if isinstance(operand, Operation) and operand.operator == LOGICAL_TOKENS.NOT:
+                stack.append(operand.operands[0])
+            else:
+                stack.append(Operation(LOGICAL_TOKENS.NOT, (operand,)))
+        elif token in LOGICAL_TOKENS_VALUES:
+            operator = LOGICAL_TOKENS(token)
+            right = stack.pop()
+            left = stack.pop()
+            operands = []
+            for operand in (left, right):
+                if operator in ASSOCIATIVE_OPERATORS and isinstance(operand, Operation) and operand.operator == operator:
+                    operands.extend(operand.operands)
+                else:
+                    operands.append(operand)
+            stack.append(Operation(operator, tuple(operands)))
+        else:
+            stack.append(Term(token))
+
+    assert len(stack) == 1, Exception(f"error while parsing postfix query {postfix_query}. Should obtain a single tree but got {stack}")
+    return stack.pop()
+
+def document_frequency(term: str, inverted_index: Mapping[str, Any]) -> int:
+    """number of documents of a term, without decoding the postings of a binary index
+
+    Arguments:
+        term {str} -- term
+        inverted_index {Mapping[str, Any]} -- invertedIndex "index", ie InvertedIndex.index
+
+    Returns:
+        int -- document frequency, 0 if the term is not in the index
+    """
+    if hasattr(inverted_index, "document_frequency"):
+        return inverted_index.document_frequency(term)
+    return len(inverted_index[term]) if term in inverted_index else 0
+
+def is_complemented(node: Node) -> bool:
+    """check if a node evaluates to a complemented result
+
+    Arguments:
+        node {Node} -- query tree
+
+    Returns:
+        bool -- True if the node gives all the documents but some
+    """
+    if isinstance(node, Term):
+        return False
+    complemented = [is_complemented(operand) for operand in node.operands]
+    if node.operator == LOGICAL_TOKENS.NOT:
+        return not complemented[0]
+    elif node.operator == LOGICAL_TOKENS.AND:
+        return all(complemented)
+    elif node.operator == LOGICAL_TOKENS.OR:
+        return any(complemented)
+    return complemented[0] and not complemented[1]
+
+def estimate(node: Node, inverted_index: Mapping[str, Any]) -> int:
+    """estimated number of documents of a node : the document frequency of a term,
+    the smallest operand of an AND, the sum of the operands of an OR (an upper bound),
+    and the left side of a NAND. For a complemented node, this is the estimated number
+    of documents it excludes.
+
+    Arguments:
+        node {Node} -- query tree
+        inverted_index {Mapping[str, Any]} -- invertedIndex "index", ie InvertedIndex.index
+
+    Returns:
+        int -- estimated number of documents
+    """
+    if isinstance(node, Term):
+        return document_frequency(node.term, inverted_index)
+    if node.operator == LOGICAL_TOKENS.NOT:
+        return estimate(node.operands[0], inverted_index)
+    operands = node.operands
+    if node.operator == LOGICAL_TOKENS.NAND:
+        operands = (operands[0], Operation(LOGICAL_TOKENS.NOT, (operands[1],)))
+    estimates = [(is_complemented(operand), estimate(operand, inverted_index)) for operand in operands]
+    plain = [size for complemented, size in estimates if not complemented]
+    excluded = [size for complemented, size in estimates if complemented]
+    if node.operator == LOGICAL_TOKENS.OR:
+        # NOT (excluded AND ... NAND plain OR ...)
+        return min(excluded) if len(excluded) > 0 else sum(plain)
+    # NOT (excluded OR ...) if all operands are complemented
+    return min(plain) if len(plain) > 0 else sum(excluded)
+
+def plan(node: Node, inverted_index: Mapping[str, Any]) -> Node:
+    """order the operands of AND and OR nodes by ascending estimated number of documents,
+    complemented operands last for an AND and first for an OR
+
+    Arguments:
+        node {Node} -- query tree
+        inverted_index {Mapping[str, Any]} -- invertedIndex "index", ie InvertedIndex.index
+
+    Returns:
+        Node -- planned query tree
+    """
+    if isinstance(node, Term):
+        return node
+    operands = tuple(plan(operand, inverted_index) for operand in node.operands)
+    # sorted is stable, operands with the same estimate keep the query order
+    if node.operator == LOGICAL_TOKENS.AND:
+        operands = tuple(sorted(operands, key=lambda operand: (is_complemented(operand), estimate(operand, inverted_index))))
+    elif node.operator == LOGICAL_TOKENS.OR:
+        operands = tuple(sorted(operands, key=lambda operand: (not is_complemented(operand), estimate(operand, inverted_index))))
+    return Operation(node.operator, operands)
+
+def is_empty(result: Result) -> bool:
+    return not result[1] and len(result[0]) == 0
+
+def is_everything(result: Result) -> bool:
+    return result[1] and len(result[0]) == 0
+
+def canonical(node: Node) -> str:
+    """normalized form of a query tree, the same for all the orders of the operands of AND and OR
+
+    Arguments:
+        node {Node} -- query tree
+
+    Returns:
+        str -- prefix form of the tree, eg "(and cat (not dog))"
+    """
+    if isinstance(node, Term):
+        return node.term
+    operands = [canonical(operand) for operand in node.operands]
+    if node.operator in ASSOCIATIVE_OPERATORS:
+        operands.sort()
+    return f"({node.operator.value} {' '.join(operands)})"
+
+def cache_result(cache: QueryCache, key: str, result: Result):
+    doc_ids, complemented = result
+    cache.put(("expression", key), (compact_doc_ids(doc_ids), complemented))
+
+def evaluate(
+    node: Node,
+    inverted_index: Mapping[str, Any],
+    trace: Optional[Dict[int, Result]] = None,
+    cache: Optional[QueryCache] = None
+    ) -> Result:
+    """evaluate a (planned) query tree
+
+    Arguments:
+        node {Node} -- query tree
+        inverted_index {Mapping[str, Any]} -- invertedIndex "index", ie InvertedIndex.index
+
+    Keyword Arguments:
+        trace {Optional[Dict[int, Result]]} -- if given, filled with the result of each
+                                               evaluated node, by id(node) (default: {None})
+        cache {Optional[QueryCache]} -- if given, results of the operations are looked up
+                                        and stored in the cache, by canonical form (default: {None})
+
+    Returns:
+        Result -- sorted ids of the relevant documents, and whether they are complemented
+    """
+    key = None
+    if cache is not None and isinstance(node, Operation):
+        key = canonical(node)
+        result = cache.get(("expression", key))
+        if result is not None:
+            if trace is not None:
+                trace[id(node)] = result
+            return result
+
+    if isinstance(node, Term):
+        result = (get_doc_ids(inverted_index[node.term]) if node.term in inverted_index else [], False)
+    elif node.operator == LOGICAL_TOKENS.NOT:
+        result = not_result(evaluate(node.operands[0], inverted_index, trace, cache))
+    elif node.operator == LOGICAL_TOKENS.AND:
+        result = evaluate(node.operands[0], inverted_index, trace, cache)
+        for operand in node.operands[1:]:
+            if is_empty(result):
+                break
+            result = and_results(result, evaluate(operand, inverted_index, trace, cache))
+    elif node.operator == LOGICAL_TOKENS.OR:
+        result = evaluate(node.operands[0], inverted_index, trace, cache)
+        for operand in node.operands[1:]:
+            if is_everything(result):
+                break
+            result = or_results(result, evaluate(operand, inverted_index, trace, cache))
+    else:
+        result = evaluate(node.operands[0], inverted_index, trace, cache)
+        if not is_empty(result):
+            result = and_results(result, not_result(evaluate(node.operands[1], inverted_index, trace, cache)))
+
+    if key is not None:
+        cache_result(cache, key, result)
+    if trace is not None:
+        trace[id(node)] = result
+    return result
+
+def process_planned_query(
+    postfix_query: List[str],
+    inverted_index: Mapping[str, Any],
+    all_doc_ids: Optional[Iterable[int]] = None,
+    cache: Optional[QueryCache] = None
+    ) -> List[int]:
+    """get relevant documents ids from a postfix query, evaluated with a cost-based plan.
+    Gives the same documents as bool_query.process_postfix_query.
+
+    Arguments:
+        postfix_query {List[str]} -- query in postfix form
+        inverted_index {Mapping[str, Any]} -- invertedIndex "index", ie InvertedIndex.index
+
+    Keyword Arguments:
+        all_doc_ids {Optional[Iterable[int]]} -- sorted ids of all the documents, only needed
+                                                 for a query negated at the top level (default: {None})
+        cache {Optional[QueryCache]} -- cache of the results of the query and its sub-expressions,
+                                        a cached query is answered without planning nor reading postings.
+                                        Its version must be checked against the index (default: {None})
+
+    Returns:
+        List[int] -- List of relevant document ids
+    """
+    root = parse_postfix(postfix_query)
+    if cache is None:
+        return materialize(evaluate(plan(root, inverted_index), inverted_index), all_doc_ids)
+
+    key = canonical(root)
+    # the lookup of an operation not in the cache is counted by evaluate
+    result = cache.get(("expression", key)) if isinstance(root, Term) or ("expression", key) in cache else None
+    if result is None:
+        result = evaluate(plan(root, inverted_index), inverted_index, cache=cache)
+        # results of operations are cached by evaluate
+        if isinstance(root, Term):
+            cache_result(cache, key, result)
+    return materialize(result, all_doc_ids)
+
+def explain(postfix_query: List[str], inverted_index: Mapping[str, Any]) -> str:
+    """describe the plan of a postfix query : its tree, in evaluation order, with the estimated
+    and actual number of documents of each node (nodes skipped by a short-circuit are not evaluated).
+    The size of a complemented node is given as "all but" the number of documents it excludes.
+
+    Arguments:
+        postfix_query {List[str]} -- query in postfix form
+        inverted_index {Mapping[str, Any]} -- invertedIndex "index", ie InvertedIndex.index
+
+    Returns:
+        str -- plan, one node per line
+    """
+    root = plan(parse_postfix(postfix_query), inverted_index)
+    trace: Dict[int, Result] = {}
+    evaluate(root, inverted_index, trace)
+
+    def size(nb_docs: int, complemented: bool) -> str:
+        return f"all but {nb_docs}" if complemented else str(nb_docs)
+
+    lines = []
+    def describe(node: Node, depth: int):
+        label = node.term if isinstance(node, Term) else node.operator.value.upper()
+        estimated = size(estimate(node, inverted_index), is_complemented(node))
+        result = trace.get(id(node))
+        actual = "not evaluated" if result is None else f"actual {size(len(result[0]), result[1])}"
+        lines.append(f"{'  ' * depth}{label} (estimated {estimated}, {actual})")
+        if isinstance(node, Operation):
+            for operand in node.operands:
+                describe(operand, depth + 1)
+
+    describe(root, 0)
+    return "\n".join(lines)
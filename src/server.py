@@ -0,0 +1,198 @@
+"""
+Resident query server : the index is loaded once, and queries are answered over HTTP/JSON.
+
+Endpoints :
+    - GET /health : {"status": "ok", "version": <index version>, "itype": <index type>}
+    - POST /boolean {"query": str, "pos": bool, "tokenizer": str} : {"documents": [...], "time_ms": float}
+    - POST /vectorial {"query": str, "number": int, "weight_query": str, "weight_document": str,
+      "engine": str, "postings_budget": int, "pos": bool, "tokenizer": str} : {"documents": [...], "time_ms": float}
+Only "query" is required, the other fields default to the options of the server.
+
+Connections are handled concurrently by an asyncio event loop, with keep-alive. Queries run one at a time
+in a single worker thread, the caches of the index and of the queries not being thread-safe, so the event
+loop keeps accepting connections and answering health checks while a query is processed.
+See client.py for a client with the same options as interface.py.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, Any, Optional
+
+from interface import retrieve_docs_from_bool_query, retrieve_docs_from_vectorial_query, VECTORIAL_ENGINES
+from preprocess import InvertedIndex, load_index, preload_lemma_cache, TOKENIZERS
+from query_cache import QueryCache
+from query_analyzer import QueryAnalyzer, get_query_analyzer
+
+from config import PATH_INDEX, POS, TOKENIZER, WEIGHT_DOCUMENT, WEIGHT_QUERY
+
+HOST = "127.0.0.1"
+PORT = 8080
+# largest request body accepted, in bytes
+MAX_BODY_SIZE = 2**20
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class QueryServer:
+    """
+    HTTP/JSON server answering the queries of an index loaded once
+
+    'self.inverted_index' is the index queried
+    'self.pos' and 'self.tokenizer' are the default preprocessing options of the queries
+    'self.cache' caches the lemmatized boolean queries and their results (see query_cache)
+    'self.analyzer' is the query analyzer of the process, shared by both query models
+    """
+    def __init__(
+        self,
+        inverted_index: InvertedIndex,
+        pos: bool = POS,
+        tokenizer: str = TOKENIZER,
+        cache: Optional[QueryCache] = None
+        ):
+        self.inverted_index = inverted_index
+        self.pos = pos
+        self.tokenizer = tokenizer
+        self.cache = cache if cache is not None else QueryCache()
+        # built before the first query, rather than while answering it
+        self.analyzer: QueryAnalyzer = get_query_analyzer()
+        # a single thread : the queries share caches which are not thread-safe
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def port(self) -> int:
+        """port the server listens on, eg when started on port 0"""
+        return self.server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = HOST, port: int = PORT) -> asyncio.AbstractServer:
+        """start listening
+
+        Keyword Arguments:
+            host {str} -- address to listen on (default: {HOST})
+            port {int} -- port to listen on, 0 for any free port (default: {PORT})
+
+        Returns:
+            asyncio.AbstractServer -- listening server
+        """
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    def dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        """answer a request
+
+        Arguments:
+            method {str} -- HTTP method
+            path {str} -- path of the request
+            body {bytes} -- JSON body of the request
+
+        Returns:
+            Tuple[int, Dict[str, Any]] -- HTTP status and JSON response
+        """
+        if path == "/health":
+            return 200, {"status": "ok", "version": self.inverted_index.version, "itype": self.inverted_index.itype}
+        if path not in ("/boolean", "/vectorial"):
+            return 404, {"error": f"unknown endpoint {path}"}
+        if method != "POST":
+            return 405, {"error": f"{path} only accepts POST requests"}
+        try:
+            request = json.loads(body)
+            query = request["query"]
+        except (ValueError, TypeError, KeyError):
+            return 400, {"error": "the body must be a JSON object with a 'query'"}
+        pos = request.get("pos", self.pos)
+        tokenizer = request.get("tokenizer", self.tokenizer)
+
+        start = time.perf_counter()
+        if path == "/boolean":
+            documents = retrieve_docs_from_bool_query(query, self.inverted_index, pos, tokenizer, self.cache)
+        else:
+            engine = request.get("engine", "maxscore")
+            if engine not in VECTORIAL_ENGINES:
+                return 400, {"error": f"unsupported vectorial engine '{engine}', not in {VECTORIAL_ENGINES}"}
+            documents = retrieve_docs_from_vectorial_query(
+                query, self.inverted_index, request.get("number", 10), pos,
+                request.get("weight_query", WEIGHT_QUERY), request.get("weight_document", WEIGHT_DOCUMENT),
+                tokenizer, engine, request.get("postings_budget")
+            )
+        return 200, {"documents": documents, "time_ms": 1000 * (time.perf_counter() - start)}
+
+    async def answer(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        """answer a request in the worker thread, health checks being answered right away"""
+        try:
+            if path == "/health":
+                return self.dispatch(method, path, body)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.dispatch, method, path, body)
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """answer the requests of a connection until it is closed"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "malformed request line"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                length = int(headers.get("content-length", 0) or 0)
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {"error": f"body larger than {MAX_BODY_SIZE} bytes"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length > 0 else b""
+                status, response = await self.answer(method, target.split("?", 1)[0], body)
+                await self.respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: int, response: Dict[str, Any], keep_alive: bool = True):
+        body = json.dumps(response).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+async def serve(query_server: QueryServer, host: str = HOST, port: int = PORT):
+    server = await query_server.start(host, port)
+    print(f"serving index of type {query_server.inverted_index.itype} on http://{host}:{query_server.port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=HOST, help=f"address to listen on (defaults to {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (defaults to {PORT})")
+    parser.add_argument("--path-index", default=PATH_INDEX, help="specify this path to use a custom index")
+    parser.add_argument("--compact", action="store_true", help="load the postings as arrays, to use less memory")
+    parser.add_argument("--pos", type=bool, default=POS, help="<True|False> wether to use pos lemmatization or not, by default")
+    parser.add_argument("--tokenizer", default=TOKENIZER, choices=TOKENIZERS, help=f"tokenizer used on the queries by default (defaults to {TOKENIZER})")
+    args = parser.parse_args()
+
+    inverted_index = load_index(args.path_index, compact=args.compact)
+    preload_lemma_cache(args.path_index)
+    asyncio.run(serve(QueryServer(inverted_index, args.pos, args.tokenizer), args.host, args.port))
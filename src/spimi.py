@@ -0,0 +1,214 @@
+import os
+import heapq
+import pickle as pkl
+import tempfile
+
+from collections import OrderedDict
+from tqdm import tqdm
+from typing import Optional, List, Tuple, Any, Iterable, Iterator, OrderedDict as OrdDict
+
+from preprocess import InvertedIndex, StatCollection, add_document, get_stats_document, process_documents
+
+# rough memory cost of the postings while they are in a block, in bytes
+POSTING_SIZE = 150
+POSITION_SIZE = 40
+
+def estimate_postings_size(nb_postings: int, nb_positions: int, type_index: int) -> int:
+    """estimate the memory taken by postings in an in-memory block
+
+    Arguments:
+        nb_postings {int} -- number of (term, document) postings
+        nb_positions {int} -- number of positions (only for a position index)
+        type_index {int} -- type of index : document(1) frequency(2) position(3)
+
+    Returns:
+        int -- estimated size in bytes
+    """
+    size = nb_postings * POSTING_SIZE
+    if type_index == 3:
+        size += nb_positions * POSITION_SIZE
+    return size
+
+def write_run(block: OrdDict[str, OrdDict[int, Any]], run_path: str):
+    """spill a block to disk, its terms sorted, one pickled (term, postings) record after the other
+
+    Arguments:
+        block {OrdDict[str, OrdDict[int, Any]]} -- partial index
+        run_path {str} -- path of the run file
+    """
+    with open(run_path, "wb") as f:
+        for term in sorted(block):
+            pkl.dump((term, block[term]), f, protocol=pkl.HIGHEST_PROTOCOL)
+
+def read_run(run_path: str) -> Iterator[Tuple[str, OrdDict[int, Any]]]:
+    """read the records of a run, in term order
+
+    Arguments:
+        run_path {str} -- path of the run file
+
+    Yields:
+        Tuple[str, OrdDict[int, Any]] -- term and its postings in the block
+    """
+    with open(run_path, "rb") as f:
+        while True:
+            try:
+                yield pkl.load(f)
+            except EOFError:
+                return
+
+def merge_runs(run_paths: List[str]) -> Iterator[Tuple[str, OrdDict[int, Any]]]:
+    """k-way merge of sorted runs. Runs must be given in the order they were written,
+    so that the postings of a term stay sorted by document id.
+
+    Arguments:
+        run_paths {List[str]} -- paths of the runs
+
+    Yields:
+        Tuple[str, OrdDict[int, Any]] -- term and its complete postings, in term order
+    """
+    # heapq.merge is stable : for a same term, records come in runs order
+    records = heapq.merge(*[read_run(run_path) for run_path in run_paths], key=lambda record: record[0])
+    current_term, current_postings = None, None
+    for term, postings in records:
+        if term == current_term:
+            current_postings.update(postings)
+        else:
+            if current_term is not None:
+                yield current_term, current_postings
+            current_term, current_postings = term, postings
+    if current_term is not None:
+        yield current_term, current_postings
+
+def spimi_invert(
+    processed_documents: Iterable[Tuple[str, List[str]]],
+    type_index: int,
+    memory_budget: int,
+    tmp_dir: str,
+    nb_documents: Optional[int] = None
+    ) -> Tuple[List[str], OrdDict[int, str], StatCollection]:
+    """single-pass in-memory indexing : index documents in a block until its
+    estimated size reaches the memory budget, then spill it to disk as a sorted run
+
+    Arguments:
+        processed_documents {Iterable[Tuple[str, List[str]]]} -- documents keys and processed documents
+        type_index {int} -- type of index : document(1) frequency(2) position(3)
+        memory_budget {int} -- memory budget of a block, in bytes
+        tmp_dir {str} -- directory where runs are written
+
+    Keyword Arguments:
+        nb_documents {Optional[int]} -- number of documents, only used for the progress bar (default: {None})
+
+    Returns:
+        Tuple[List[str], OrdDict[int, str], StatCollection] -- paths of the runs, mapping and stats of the collection
+    """
+    run_paths = []
+    mapping = OrderedDict()
+    doc_stats = {}
+    block = OrderedDict()
+    nb_postings, nb_positions = 0, 0
+
+    def spill():
+        run_path = os.path.join(tmp_dir, f"run_{len(run_paths)}.pkl")
+        write_run(block, run_path)
+        run_paths.append(run_path)
+        block.clear()
+
+    doc_id = 0
+    for document, terms in tqdm(processed_documents, total=nb_documents, desc="building index blocks : "):
+        add_document(block, doc_id, terms, type_index)
+        mapping[doc_id] = document
+        doc_stats[doc_id] = get_stats_document(terms)
+        nb_postings += doc_stats[doc_id]["unique"]
+        nb_positions += len(terms)
+        doc_id += 1
+
+        if estimate_postings_size(nb_postings, nb_positions, type_index) >= memory_budget:
+            spill()
+            nb_postings, nb_positions = 0, 0
+
+    if len(block) > 0 or len(run_paths) == 0:
+        spill()
+
+    return run_paths, mapping, StatCollection(len(mapping), doc_stats)
+
+def build_inverted_index_spimi(
+    collection: OrdDict[str, str],
+    stop_words_path: str,
+    type_index: int = 1,
+    pos: bool = True,
+    memory_budget: int = 512,
+    tmp_dir: Optional[str] = None,
+    tokenizer: str = "nltk"
+    ) -> InvertedIndex:
+    """Build an inverted index with SPIMI : partial sorted indexes are built in memory
+    within a memory budget, spilled to disk, then merged.
+    Unlike build_inverted_index, terms of the index are sorted.
+    The merged index is loaded back in memory, so this is not an out-of-core build : it checks the runs
+    and their merge against build_inverted_index in the tests. preprocess.py builds with build_disk_index_spimi.
+
+    Arguments:
+        collection {OrdDict[str, str]} -- corpus
+        stop_words_path {str} -- path of the stop words file
+
+    Keyword Arguments:
+        type_index {int} -- type of index : document(1) frequency(2) position(3) (default: {1})
+        pos {bool} -- use pos tagging for lemmatization
+        memory_budget {int} -- memory budget of the in-memory blocks, in MB (default: {512})
+        tmp_dir {Optional[str]} -- directory for the runs, a temporary directory by default (default: {None})
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use (default: {"nltk"})
+
+    Raises:
+        Exception: if the index type is not supported
+
+    Returns:
+        InvertedIndex -- inverted index of given type
+    """
+    if type_index not in (1, 2, 3):
+        raise Exception(f"index type '{type_index}' is not supported")
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as runs_dir:
+        processed_documents = process_documents(collection, stop_words_path, pos, tokenizer=tokenizer)
+        run_paths, mapping, stats = spimi_invert(processed_documents, type_index, memory_budget * 2**20, runs_dir, len(collection))
+        index = OrderedDict(tqdm(merge_runs(run_paths), desc=f"merging {len(run_paths)} runs : "))
+
+    return InvertedIndex(type_index, index, mapping, stats)
+
+def build_disk_index_spimi(
+    collection: OrdDict[str, str],
+    stop_words_path: str,
+    output_path: str,
+    type_index: int = 1,
+    pos: bool = True,
+    memory_budget: int = 512,
+    tmp_dir: Optional[str] = None,
+    tokenizer: str = "nltk",
+    codec: str = "raw"
+    ):
+    """Build an inverted index with SPIMI, writing the merged runs straight to
+    a binary index (see disk_index), so that the whole index is never in memory
+
+    Arguments:
+        collection {OrdDict[str, str]} -- corpus
+        stop_words_path {str} -- path of the stop words file
+        output_path {str} -- path of the binary index
+
+    Keyword Arguments:
+        type_index {int} -- type of index : document(1) frequency(2) position(3) (default: {1})
+        pos {bool} -- use pos tagging for lemmatization
+        memory_budget {int} -- memory budget of the in-memory blocks, in MB (default: {512})
+        tmp_dir {Optional[str]} -- directory for the runs, a temporary directory by default (default: {None})
+        tokenizer {str} -- <nltk|regex|whitespace> tokenizer to use (default: {"nltk"})
+        codec {str} -- <raw|vbyte|gamma> codec of the postings (default: {"raw"})
+
+    Raises:
+        Exception: if the index type is not supported
+    """
+    from disk_index import write_disk_index
+
+    if type_index not in (1, 2, 3):
+        raise Exception(f"index type '{type_index}' is not supported")
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as runs_dir:
+        processed_documents = process_documents(collection, stop_words_path, pos, tokenizer=tokenizer)
+        run_paths, mapping, stats = spimi_invert(processed_documents, type_index, memory_budget * 2**20, runs_dir, len(collection))
+        write_disk_index(output_path, type_index, tqdm(merge_runs(run_paths), desc=f"merging {len(run_paths)} runs : "), mapping, stats, codec)
@@ -0,0 +1,231 @@
+"""
+Top-k retrieval for the vectorial model, with MaxScore dynamic pruning.
+
+Instead of scoring every document containing a query term and sorting them all, the documents are
+scored one at a time, in document id order, and the k best are kept in a heap. Each term has an upper
+bound of its contribution to a cosine similarity (see vectorial_query.DocumentWeights.max_impacts).
+Terms are sorted by upper bound : once the k-th score of the heap is larger than the sum of the bounds
+of the first terms, these terms are *non-essential* : a document only containing them can not enter
+the top k, so only the postings of the other (*essential*) terms give candidates, the non-essential
+postings being searched for these candidates, and the search stops as soon as the bound of
+what is left can not reach the heap.
+
+The results, and their scores, are the same as ranking the exhaustive scores of vectorial_query.get_scores
+(see vectorial_query.rank_scores), ties being broken by ascending document id.
+"""
+import argparse
+import heapq
+import math
+import time
+
+from bisect import bisect_left
+from typing import List, Tuple, Dict, Any, Sequence, Iterable
+
+import vectorial_query as vq
+from preprocess import InvertedIndex, load_index
+from compact_index import Postings
+
+from config import PATH_INDEX, POS, TOKENIZER, WEIGHT_DOCUMENT, WEIGHT_QUERY
+
+# relative margin on the upper bounds, so that rounding errors never prune a document of the top k
+BOUND_MARGIN = 1e-9
+
+def get_postings_doc_ids(postings: Any) -> Sequence[int]:
+    """sorted document ids of postings, as a sequence supporting bisect"""
+    return postings.doc_ids if isinstance(postings, Postings) else list(postings)
+
+def top_k_scores(
+    query: List[str],
+    inverted_index: InvertedIndex,
+    k: int,
+    wq: str,
+    wd: str,
+    counters: Dict[str, int] = None
+    ) -> List[Tuple[int, float]]:
+    """
+    k best documents of a vectorial query, with MaxScore dynamic pruning
+
+    Arguments:
+        query {List[str]} -- preprocessed query
+        inverted_index {InvertedIndex} -- frequency index
+        k {int} -- number of documents
+        wq {str} -- weighting scheme for the query
+        wd {str} -- weighting scheme for the document
+
+    Keyword Arguments:
+        counters {Dict[str, int]} -- if given, "postings" is incremented by the number of postings
+                                     evaluated, and "candidates" by the number of documents scored (default: {None})
+
+    Returns:
+        List[Tuple[int, float]] -- ids and scores of the k best documents, by descending score
+    """
+    assert inverted_index.itype == 2, f"need a frequency index (type 2) for a vectorial query, got index of type {inverted_index.itype}"
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    if document_weights.max_impacts is None:
+        vq.require_precomputed(inverted_index, "largest normalized weights of the terms")
+        document_weights.max_impacts = vq.compute_max_impacts(inverted_index, document_weights)
+    terms, query_norm = vq.get_query_weights(query, document_weights, wq)
+    if k <= 0 or len(terms) == 0:
+        return []
+    norms = document_weights.norms
+
+    # terms by ascending upper bound, keeping their position in the query to sum the scores in query order
+    order = sorted(range(len(terms)), key=lambda idx: terms[idx][1] * document_weights.max_impacts[terms[idx][0]])
+    doc_ids = [get_postings_doc_ids(inverted_index.index[terms[idx][0]]) for idx in order]
+    impacts = [document_weights.impacts[terms[idx][0]] for idx in order]
+    weights = [terms[idx][1] for idx in order]
+    bounds = [weights[i] * document_weights.max_impacts[terms[idx][0]] / query_norm for i, idx in enumerate(order)]
+    # cumulative_bounds[i] : upper bound of the score of a document only in the terms 0..i
+    cumulative_bounds = []
+    for bound in bounds:
+        cumulative_bounds.append((cumulative_bounds[-1] if cumulative_bounds else 0.) + bound * (1 + BOUND_MARGIN))
+    nb_terms = len(terms)
+    lengths = [len(term_doc_ids) for term_doc_ids in doc_ids]
+    cursors = [0] * nb_terms
+    contributions = [0.] * nb_terms
+
+    heap: List[Tuple[float, int]] = []  # (score, -doc id), the worst of the top k first
+    threshold = -math.inf
+    first_essential = 0
+    nb_postings = 0
+    nb_candidates = 0
+    while True:
+        if first_essential == nb_terms - 1 and first_essential > 0:
+            # a single essential term (the usual case once the heap is full) : its postings are skipped
+            # without looking up the other terms, until one can enter the top k
+            last = nb_terms - 1
+            last_doc_ids, last_impacts, last_weight = doc_ids[last], impacts[last], weights[last]
+            others_bound = cumulative_bounds[last - 1]
+            cursor = cursors[last]
+            while cursor < lengths[last]:
+                norm = query_norm * norms[last_doc_ids[cursor]]
+                if norm > 0 and last_weight * last_impacts[cursor] / norm + others_bound < threshold:
+                    cursor += 1
+                else:
+                    break
+            nb_postings += cursor - cursors[last]
+            nb_candidates += cursor - cursors[last]
+            cursors[last] = cursor
+
+        candidate = None
+        for i in range(first_essential, nb_terms):
+            if cursors[i] < lengths[i] and (candidate is None or doc_ids[i][cursors[i]] < candidate):
+                candidate = doc_ids[i][cursors[i]]
+        if candidate is None:
+            break
+        nb_candidates += 1
+
+        partial = 0.
+        for i in range(first_essential, nb_terms):
+            cursor = cursors[i]
+            if cursor < lengths[i] and doc_ids[i][cursor] == candidate:
+                contribution = weights[i] * impacts[i][cursor]
+                contributions[order[i]] = contribution
+                partial += contribution
+                cursors[i] = cursor + 1
+                nb_postings += 1
+        norm = query_norm * norms[candidate]
+        pruned = False
+        for i in range(first_essential - 1, -1, -1):
+            if norm > 0 and partial / norm + cumulative_bounds[i] < threshold:
+                pruned = True
+                break
+            cursor = cursors[i] = bisect_left(doc_ids[i], candidate, cursors[i])
+            if cursor < lengths[i] and doc_ids[i][cursor] == candidate:
+                contribution = weights[i] * impacts[i][cursor]
+                contributions[order[i]] = contribution
+                partial += contribution
+                nb_postings += 1
+        if pruned:
+            contributions = [0.] * nb_terms
+            continue
+
+        # same additions, in the same order, as get_scores (adding 0. to a score does not change it)
+        score = 0
+        for contribution in contributions:
+            score += contribution
+        contributions = [0.] * nb_terms
+        score = score/norm if norm > 0 else 0.
+        if len(heap) < k:
+            heapq.heappush(heap, (score, -candidate))
+        elif (score, -candidate) > heap[0]:
+            heapq.heapreplace(heap, (score, -candidate))
+        else:
+            continue
+        if len(heap) == k:
+            threshold = heap[0][0]
+            while first_essential < nb_terms and cumulative_bounds[first_essential] < threshold:
+                first_essential += 1
+
+    if counters is not None:
+        counters["postings"] = counters.get("postings", 0) + nb_postings
+        counters["candidates"] = counters.get("candidates", 0) + nb_candidates
+    return [(-negative_doc_id, score) for score, negative_doc_id in sorted(heap, reverse=True)]
+
+def benchmark_top_k(
+    queries: List[List[str]],
+    inverted_index: InvertedIndex,
+    ks: Iterable[int] = (10, 100, 1000),
+    wq: str = WEIGHT_QUERY,
+    wd: str = WEIGHT_DOCUMENT
+    ) -> List[Dict[str, float]]:
+    """
+    compare exhaustive scoring and MaxScore top-k on preprocessed queries
+
+    Arguments:
+        queries {List[List[str]]} -- preprocessed queries
+        inverted_index {InvertedIndex} -- frequency index
+
+    Keyword Arguments:
+        ks {Iterable[int]} -- numbers of documents retrieved (default: {(10, 100, 1000)})
+        wq {str} -- weighting scheme for the query (default: {WEIGHT_QUERY})
+        wd {str} -- weighting scheme for the document (default: {WEIGHT_DOCUMENT})
+
+    Raises:
+        Exception: if the top-k results differ from the exhaustive ranking
+
+    Returns:
+        List[Dict[str, float]] -- for each k and engine, the postings evaluated per query and the mean latency (ms)
+    """
+    # weights are computed before timing anything
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    report = []
+    for k in ks:
+        start = time.perf_counter()
+        exhaustive_results = [vq.rank_scores(vq.get_scores(query, inverted_index, wq, wd), k) for query in queries]
+        exhaustive_time = time.perf_counter() - start
+        nb_postings = sum(len(inverted_index.index[term]) for query in queries for term, _ in vq.get_query_weights(query, document_weights, wq)[0])
+
+        counters = {}
+        start = time.perf_counter()
+        top_k_results = [top_k_scores(query, inverted_index, k, wq, wd, counters) for query in queries]
+        top_k_time = time.perf_counter() - start
+        if top_k_results != exhaustive_results:
+            raise Exception(f"top-{k} results differ from the exhaustive ranking")
+
+        for engine, postings, duration in (("exhaustive", nb_postings, exhaustive_time), ("maxscore", counters.get("postings", 0), top_k_time)):
+            report.append({
+                "k": k,
+                "engine": engine,
+                "postings_per_query": postings / max(len(queries), 1),
+                "latency_ms": 1000 * duration / max(len(queries), 1),
+            })
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries", help="file with one query per line")
+    parser.add_argument("--path-index", default=PATH_INDEX, help="path of a frequency index")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 100, 1000], help="numbers of documents retrieved (default=10 100 1000)")
+    parser.add_argument("--weight-document", default=WEIGHT_DOCUMENT, help="weighting scheme for the document")
+    parser.add_argument("--weight-query", default=WEIGHT_QUERY, help="weighting scheme for the query")
+    parser.add_argument("--pos", type=bool, default=POS, help="<True|False> wether to use pos lemmatization or not")
+    parser.add_argument("--tokenizer", default=TOKENIZER, help=f"tokenizer used on the queries (defaults to {TOKENIZER})")
+    args = parser.parse_args()
+
+    inverted_index = load_index(args.path_index)
+    with open(args.queries) as f:
+        queries = [vq.lemmatize_query(line, pos=args.pos, tokenizer=args.tokenizer) for line in f if line.strip()]
+    print(f"{'k':>6} {'engine':>10} {'postings/query':>15} {'latency (ms)':>13}")
+    for row in benchmark_top_k(queries, inverted_index, args.k, args.weight_query, args.weight_document):
+        print(f"{row['k']:>6} {row['engine']:>10} {row['postings_per_query']:>15.1f} {row['latency_ms']:>13.3f}")
@@ -0,0 +1,125 @@
+"""
+Term-at-a-time scoring of vectorial queries with NumPy.
+
+The postings of each query term are turned into two arrays, the document ids and their precomputed
+weights (see vectorial_query.DocumentWeights), and added to a dense accumulator of one score per
+document with a vectorized scatter-add. The best documents are then selected with a partition instead
+of a full sort. Scores are computed with the same floating point operations, in the same order, as
+vectorial_query.get_scores, so both give the same rankings.
+"""
+from dataclasses import dataclass, field
+from typing import List, Tuple, Dict, Any
+
+import numpy as np
+
+import vectorial_query as vq
+from preprocess import InvertedIndex
+from compact_index import Postings
+
+@dataclass
+class DenseWeights:
+    """
+    NumPy view of the document weights of an index for a weighting scheme
+
+    'self.norms' is the norm of each document, indexed by document id (0 for missing ids)
+    'self.doc_ids' and 'self.impacts' map a term to the arrays of its document ids and weights,
+    filled the first time the term is queried
+    """
+    norms: np.ndarray
+    doc_ids: Dict[str, np.ndarray] = field(default_factory=dict)
+    impacts: Dict[str, np.ndarray] = field(default_factory=dict)
+
+# dense weights of the indexes queried, by index version and weighting scheme
+DENSE_WEIGHTS: Dict[Tuple[str, str], DenseWeights] = {}
+
+def get_dense_weights(inverted_index: InvertedIndex, document_weights: vq.DocumentWeights) -> DenseWeights:
+    """
+    dense weights of an index, built the first time they are needed
+
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+        document_weights {vq.DocumentWeights} -- weights of the documents
+
+    Returns:
+        DenseWeights -- dense weights
+    """
+    key = (inverted_index.version, document_weights.wd)
+    if key not in DENSE_WEIGHTS:
+        norms = document_weights.norms
+        dense_norms = np.zeros(max(norms, default=-1) + 1)
+        dense_norms[np.fromiter(norms.keys(), dtype=np.int64, count=len(norms))] = np.fromiter(norms.values(), dtype=np.float64, count=len(norms))
+        DENSE_WEIGHTS[key] = DenseWeights(dense_norms)
+    return DENSE_WEIGHTS[key]
+
+def get_term_arrays(term: str, inverted_index: InvertedIndex, document_weights: vq.DocumentWeights, dense_weights: DenseWeights) -> Tuple[np.ndarray, np.ndarray]:
+    """document ids and weights of the postings of a term, as arrays
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- document ids and weights
+    """
+    if term not in dense_weights.doc_ids:
+        postings = inverted_index.index[term]
+        if isinstance(postings, Postings):
+            doc_ids = np.frombuffer(postings.doc_ids, dtype=np.uint32).astype(np.int64)
+        else:
+            doc_ids = np.fromiter(postings, dtype=np.int64, count=len(postings))
+        dense_weights.doc_ids[term] = doc_ids
+        # the weights are an array("d"), viewed without copy
+        dense_weights.impacts[term] = np.frombuffer(document_weights.impacts[term], dtype=np.float64)
+    return dense_weights.doc_ids[term], dense_weights.impacts[term]
+
+def get_scores_array(query: List[str], inverted_index: InvertedIndex, wq: str, wd: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    compute the cosine similarity between the query and each document containing a query term
+
+    Arguments:
+        query {List[str]} -- preprocessed query
+        inverted_index {InvertedIndex} -- frequency index
+        wq {str} -- weighting scheme for the query
+        wd {str} -- weighting scheme for the document
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] -- ids of the documents containing a query term, ascending, and their scores
+    """
+    assert inverted_index.itype == 2, f"need a frequency index (type 2) for a vectorial query, got index of type {inverted_index.itype}"
+    document_weights = vq.get_document_weights(inverted_index, wd)
+    dense_weights = get_dense_weights(inverted_index, document_weights)
+    terms, query_norm = vq.get_query_weights(query, document_weights, wq)
+    accumulator = np.zeros(len(dense_weights.norms))
+    found = np.zeros(len(dense_weights.norms), dtype=bool)
+    for term, weight_query in terms:
+        doc_ids, impacts = get_term_arrays(term, inverted_index, document_weights, dense_weights)
+        # the document ids of a term are unique, a fancy-indexed += adds each posting once
+        accumulator[doc_ids] += weight_query * impacts
+        found[doc_ids] = True
+    doc_ids = np.flatnonzero(found)
+    norms = query_norm * dense_weights.norms[doc_ids]
+    scores = np.zeros(len(doc_ids))
+    np.divide(accumulator[doc_ids], norms, out=scores, where=norms > 0)
+    return doc_ids, scores
+
+def top_k_scores(query: List[str], inverted_index: InvertedIndex, k: int, wq: str, wd: str) -> List[Tuple[int, float]]:
+    """
+    k best documents of a vectorial query, ties being broken by ascending document id
+    (same results as vectorial_query.rank_scores on vectorial_query.get_scores)
+
+    Arguments:
+        query {List[str]} -- preprocessed query
+        inverted_index {InvertedIndex} -- frequency index
+        k {int} -- number of documents
+        wq {str} -- weighting scheme for the query
+        wd {str} -- weighting scheme for the document
+
+    Returns:
+        List[Tuple[int, float]] -- ids and scores of the k best documents, by descending score
+    """
+    doc_ids, scores = get_scores_array(query, inverted_index, wq, wd)
+    if k <= 0 or len(doc_ids) == 0:
+        return []
+    if k < len(doc_ids):
+        # every document scoring at least the k-th score, so that ties at the boundary are broken by id
+        kth_score = -np.partition(-scores, k - 1)[k - 1]
+        selected = scores >= kth_score
+        doc_ids, scores = doc_ids[selected], scores[selected]
+    best = np.lexsort((doc_ids, -scores))[:k]
+    return list(zip(doc_ids[best].tolist(), scores[best].tolist()))
@@ -1,15 +1,211 @@
-from config import WEIGHT_DOCUMENT, WEIGHT_QUERY, PATH_STOP_WORDS
+from config import WEIGHT_DOCUMENT, WEIGHT_QUERY
 from collections import Counter
+from array import array
+import heapq
+from dataclasses import dataclass
 import math
-from preprocess import InvertedIndex, StatCollection, lemmatize_document, tokenize_document, load_stop_words, remove_stop_words_from_document
-from typing import Optional, Dict, List, Union, Tuple
+from preprocess import InvertedIndex, StatCollection, LemmaCache
+from query_analyzer import get_query_analyzer
+from typing import Optional, Dict, List, Union, Tuple, Iterable, Any
 
-def lemmatize_query(query: str, pos:bool = True) -> List[str]:
-    tokens = tokenize_document(query)
-    stop_words = load_stop_words(PATH_STOP_WORDS)
-    tokens = remove_stop_words_from_document(tokens, stop_words, [])
-    tokens = lemmatize_document(tokens, pos=pos)
-    return tokens
+# weighting schemes for the documents, any other scheme falls back to tf_idf_log_normalize
+WD_SCHEMES = ("binary", "frequency", "tf_idf_normalize", "tf_idf_logarithmic", "tf_idf_log_normalize")
+
+@dataclass
+class DocumentWeights:
+    """
+    Weights of the documents of a frequency index for a weighting scheme, computed once for all queries
+
+    'self.wd' is the weighting scheme of the documents
+    'self.idf' maps a term to its inverse document frequency
+    'self.impacts' maps a term to the weights of its postings, in the order of the postings
+    'self.norms' maps a document id to the norm of the document vector, over all its terms
+    'self.max_impacts' maps a term to the largest weight of its postings divided by the norm of
+    the document, ie the upper bound of its contribution to a cosine similarity (see top_k)
+    'self.tiers' maps a term to the document ids of its postings split in tiers of decreasing
+    normalized weight, the first tier being its champion list (see champions), None if not built
+    'self.impact_ordered' holds the postings of each term sorted by quantized normalized weight
+    (see impact_index.ImpactOrderedPostings), None if not built
+    """
+    wd: str
+    idf: Dict[str, float]
+    impacts: Dict[str, array]
+    norms: Dict[int, float]
+    max_impacts: Optional[Dict[str, float]] = None
+    tiers: Optional[Dict[str, List[array]]] = None
+    impact_ordered: Optional[Any] = None
+
+def lemmatize_query(query: str, pos:bool = True, cache: Optional[LemmaCache] = None, tokenizer: str = "nltk") -> List[str]:
+    return get_query_analyzer().analyze(query, pos=pos, tokenizer=tokenizer, lemma_cache=cache)
+
+def document_weight(wd: str, tf: int, idf: float, doc_stats: Dict[str, float]) -> float:
+    """
+    weight of a term in a document
+    
+    Arguments:
+        wd {str} -- weighting scheme for the document
+        tf {int} -- frequency of the term in the document
+        idf {float} -- inverse document frequency of the term
+        doc_stats {Dict[str, float]} -- statistics of the document (see preprocess.get_stats_document)
+    
+    Returns:
+        float -- weight of the term in the document
+    """
+    if wd == "binary":
+        return 1
+    elif wd == "frequency":
+        return tf
+    elif wd == "tf_idf_normalize":
+        return tf/doc_stats["freq_max"]*idf
+    elif wd == "tf_idf_logarithmic":
+        return (1 + math.log(tf))*idf
+    #fall back to tf_idf_log_normalize
+    return (1 + math.log(tf))/(1 + math.log(doc_stats["moy_freq"]))*idf
+
+def compute_document_weights(inverted_index: InvertedIndex, wd: str) -> DocumentWeights:
+    """
+    compute the idf of the terms, the weights of all the postings and the norms of all the documents
+    for a weighting scheme, in a single pass over the index
+    
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+        wd {str} -- weighting scheme for the document
+    
+    Returns:
+        DocumentWeights -- weights of the documents
+    """
+    assert inverted_index.itype == 2, f"need a frequency index (type 2) for document weights, got index of type {inverted_index.itype}"
+    stats_collection = inverted_index.stats
+    idf = {}
+    impacts = {}
+    norms = {}
+    for term, postings in inverted_index.index.items():
+        idf[term] = math.log(stats_collection.nb_docs/len(postings))
+        weights = array("d")
+        for doc_ID, frequency in postings.items():
+            weight = document_weight(wd, frequency, idf[term], stats_collection.doc_stats[doc_ID])
+            weights.append(weight)
+            norms[doc_ID] = norms.get(doc_ID, 0) + weight**2
+        impacts[term] = weights
+    for doc_ID in norms:
+        norms[doc_ID] = math.sqrt(norms[doc_ID])
+    document_weights = DocumentWeights(wd, idf, impacts, norms)
+    document_weights.max_impacts = compute_max_impacts(inverted_index, document_weights)
+    return document_weights
+
+def compute_max_impacts(inverted_index: InvertedIndex, document_weights: DocumentWeights) -> Dict[str, float]:
+    """
+    largest normalized weight of the postings of each term (see DocumentWeights.max_impacts)
+    
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+        document_weights {DocumentWeights} -- weights of the documents
+    
+    Returns:
+        Dict[str, float] -- upper bound of the normalized weight of each term
+    """
+    norms = document_weights.norms
+    max_impacts = {}
+    for term, postings in inverted_index.index.items():
+        max_impacts[term] = max((weight/norms[doc_ID] if norms[doc_ID] > 0 else 0. for doc_ID, weight in zip(postings, document_weights.impacts[term])), default=0.)
+    return max_impacts
+
+def precompute_weights(inverted_index: InvertedIndex, schemes: Iterable[str] = WD_SCHEMES) -> Dict[str, DocumentWeights]:
+    """
+    compute the document weights of several weighting schemes, eg when the index is built
+    
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+    
+    Keyword Arguments:
+        schemes {Iterable[str]} -- weighting schemes for the document (default: {WD_SCHEMES})
+    
+    Returns:
+        Dict[str, DocumentWeights] -- document weights of each scheme, to be stored in InvertedIndex.weights
+    """
+    return {wd: compute_document_weights(inverted_index, wd) for wd in schemes}
+
+def require_precomputed(inverted_index: InvertedIndex, what: str):
+    """
+    raise if an index is a binary index : building what it lacks would decode all its postings,
+    so it must be precomputed when the index is built. An in-memory index builds it when first needed.
+    
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+        what {str} -- what the index lacks, for the error message
+    """
+    from disk_index import DiskIndex
+    if isinstance(inverted_index.index, DiskIndex):
+        raise Exception(f"the binary index has no {what}, rebuild it with preprocess.py (see --weights, --champions and --impact-ordered)")
+
+def get_document_weights(inverted_index: InvertedIndex, wd: str) -> DocumentWeights:
+    """
+    document weights of an index for a weighting scheme. They are computed and kept in the index
+    the first time, if they were not computed when the index was built, except for a binary index
+    (see require_precomputed)
+    
+    Arguments:
+        inverted_index {InvertedIndex} -- frequency index
+        wd {str} -- weighting scheme for the document
+    
+    Returns:
+        DocumentWeights -- weights of the documents
+    """
+    if wd not in WD_SCHEMES:
+        wd = "tf_idf_log_normalize"
+    if inverted_index.weights is None or wd not in inverted_index.weights:
+        require_precomputed(inverted_index, f"document weights for the scheme '{wd}'")
+    if inverted_index.weights is None:
+        inverted_index.weights = {}
+    if wd not in inverted_index.weights:
+        inverted_index.weights[wd] = compute_document_weights(inverted_index, wd)
+    return inverted_index.weights[wd]
+
+def get_query_weight(wq: str, tf_query: int, idf: Optional[float]) -> float:
+    """
+    weight of a term in the query
+    
+    Arguments:
+        wq {str} -- weighting scheme for the query
+        tf_query {int} -- frequency of the term in the query
+        idf {Optional[float]} -- inverse document frequency of the term, None if the term is not in the index
+    
+    Returns:
+        float -- weight of the term in the query
+    """
+    if wq == "binary":
+        return 1
+
+    #fall back to term frequency for the query
+    elif wq == "tf" :
+        return tf_query
+
+    #fall back to tf-idf for the query, a term which is not in the index has no weight
+    return tf_query*idf if idf is not None else 0
+
+def get_query_weights(query: List[str], document_weights: DocumentWeights, wq: str) -> Tuple[List[Tuple[str, float]], float]:
+    """
+    weights of the terms of a query
+    
+    Arguments:
+        query {List[str]} -- preprocessed query
+        document_weights {DocumentWeights} -- weights of the documents
+        wq {str} -- weighting scheme for the query
+    
+    Returns:
+        Tuple[List[Tuple[str, float]], float] -- terms of the index with a non zero weight and their weight,
+                                                 in query order, and the norm of the query vector
+    """
+    terms = []
+    query_norm = 0
+    words = Counter(query)
+    for term in words:
+        idf = document_weights.idf.get(term)
+        weight_query = get_query_weight(wq, words[term], idf)
+        query_norm += weight_query**2
+        if idf is not None and weight_query != 0:
+            terms.append((term, weight_query))
+    return terms, math.sqrt(query_norm)
 
 def get_scores(
     query: List[str], 
@@ -17,7 +213,9 @@ def get_scores(
     wq: str,
     wd: str) -> Dict[int,float]:
     """
-    compute score for all documents using the vectorial model with the config parameters
+    compute score for all documents using the vectorial model with the config parameters :
+    the cosine similarity between the query and each document containing a query term,
+    from the precomputed document weights and norms (see get_document_weights)
     
     Arguments:
         query {List[str]} -- preprocessed query 
@@ -28,57 +226,66 @@ def get_scores(
     Returns:
         Dict[int,float] -- similarity between the query and each document
     """
-    scores = {}
-    document_norms = {}
-    query_norm = 0
-    words = Counter(query)
-    stats_collection = inverted_index.stats
     assert inverted_index.itype == 2, f"need a frequency index (type 2) for a vectorial query, got index of type {inverted_index.itype}"
+    document_weights = get_document_weights(inverted_index, wd)
     frequency_index = inverted_index.index
-    for term in words:
-        if wq == "binary":
-            weight_query = 1
-            
-        #fall back to term frequency for the query
-        elif wq == "tf" : 
-            weight_query = words[term]
-
-        #fall back to tf-idf for the query
-        else : 
-            tf_query = words[term]
-            idf_query = get_idf(term, frequency_index, stats_collection.nb_docs)
-            weight_query = tf_query*idf_query
-        query_norm += weight_query**2
-        if term in frequency_index :
-            for doc_ID, frequency in frequency_index[term].items():
-                if wd == "binary":
-                    weight_document = 1
-                elif wd == "frequency":
-                    weight_document = get_tf(term, doc_ID, frequency_index)
-                elif wd == "tf_idf_normalize":
-                    tf_document = get_tf_normalize(term, doc_ID, frequency_index, stats_collection)
-                    idf_document = get_idf(term, frequency_index, stats_collection.nb_docs)
-                    weight_document = tf_document*idf_document
-                elif wd == "tf_idf_logarithmic":
-                    tf_document = get_tf_logarithmique(term, doc_ID, frequency_index)
-                    idf_document = get_idf(term, frequency_index, stats_collection.nb_docs)
-                    weight_document = tf_document*idf_document
-                
-                #fall back to tf_idf_log_normalize
-                else:
-                    tf_document = get_tf_logarithme_normalize(term, doc_ID, frequency_index, stats_collection)
-                    idf_document = get_idf(term, frequency_index, stats_collection.nb_docs)
-                    weight_document = tf_document*idf_document
-                if doc_ID in scores:
-                    scores[doc_ID] += weight_query * weight_document
-                    document_norms[doc_ID] += weight_document**2
-                else:
-                    scores[doc_ID] = weight_query * weight_document
-                    document_norms[doc_ID] = weight_document**2
+    scores = {}
+    terms, query_norm = get_query_weights(query, document_weights, wq)
+    for term, weight_query in terms:
+        for doc_ID, impact in zip(frequency_index[term], document_weights.impacts[term]):
+            scores[doc_ID] = scores.get(doc_ID, 0) + weight_query * impact
+    for doc_ID in scores:
+        norm = query_norm * document_weights.norms[doc_ID]
+        scores[doc_ID] = scores[doc_ID]/norm if norm > 0 else 0.
+    return scores
+
+def score_documents(
+    doc_IDs: Iterable[int],
+    terms: List[Tuple[str, float]],
+    query_norm: float,
+    inverted_index: InvertedIndex,
+    document_weights: DocumentWeights) -> Dict[int, float]:
+    """
+    exact scores of some documents, looking their frequencies up in the postings of the query terms
+    rather than reading the whole postings, with the same operations, in the same order, as get_scores
+    
+    Arguments:
+        doc_IDs {Iterable[int]} -- documents to score
+        terms {List[Tuple[str, float]]} -- terms of the query and their weight (see get_query_weights)
+        query_norm {float} -- norm of the query
+        inverted_index {InvertedIndex} -- frequency index
+        document_weights {DocumentWeights} -- weights of the documents
+    
+    Returns:
+        Dict[int, float] -- similarity between the query and each document
+    """
+    doc_stats = inverted_index.stats.doc_stats
+    scores = dict.fromkeys(doc_IDs, 0)
+    for term, weight_query in terms:
+        postings = inverted_index.index[term]
+        idf = document_weights.idf[term]
+        for doc_ID in scores:
+            frequency = postings.get(doc_ID)
+            if frequency is not None:
+                scores[doc_ID] += weight_query * document_weight(document_weights.wd, frequency, idf, doc_stats[doc_ID])
     for doc_ID in scores:
-        scores[doc_ID] = scores[doc_ID]/(math.sqrt(query_norm)*math.sqrt(document_norms[doc_ID]))
+        norm = query_norm * document_weights.norms[doc_ID]
+        scores[doc_ID] = scores[doc_ID]/norm if norm > 0 else 0.
     return scores
 
+def rank_scores(scores: Dict[int, float], n_results: int) -> List[Tuple[int, float]]:
+    """
+    best documents by descending score, ties being broken by ascending document id
+    
+    Arguments:
+        scores {Dict[int, float]} -- score of each document
+        n_results {int} -- number of documents to keep
+    
+    Returns:
+        List[Tuple[int, float]] -- ids and scores of the best documents
+    """
+    return heapq.nlargest(n_results, scores.items(), key=lambda id_and_score: (id_and_score[1], -id_and_score[0]))
+
 def get_tf(term: str, doc_ID: int, index_frequence: Dict[str, Dict[int, int]]) -> float:
     """
     returns the term frequency of a term in a document
@@ -91,13 +298,7 @@ def get_tf(term: str, doc_ID: int, index_frequence: Dict[str, Dict[int, int]]) -
     Returns:
         float -- term frequency
     """
-    postings_list = index_frequence[term].items()
-    tf = 0
-    for elt in postings_list:
-        if elt[0] == doc_ID:
-            tf = elt[1]
-            break
-    return tf
+    return index_frequence[term].get(doc_ID, 0)
 
 def get_tf_logarithmique(term: str ,doc_ID: int, index_frequence: Dict[str, Dict[int, int]]) -> float:
     """
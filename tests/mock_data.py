@@ -1,3 +1,5 @@
+import random
+
 from preprocess import InvertedIndex, StatCollection
 from collections import OrderedDict
 
@@ -105,4 +107,22 @@ def get_index(index_type):
     elif index_type == 2:
         return INVERTED_INDEX_2
     else :
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+def random_frequency_index(nb_docs, nb_terms, seed):
+    # zipfian terms, so that some terms are in most documents
+    rng = random.Random(seed)
+    index = OrderedDict()
+    doc_stats = OrderedDict()
+    for doc_ID in range(nb_docs):
+        frequencies = {}
+        for term in rng.choices(range(nb_terms), weights=[1/(rank + 1) for rank in range(nb_terms)], k=rng.randint(1, 30)):
+            frequencies[term] = frequencies.get(term, 0) + 1
+        doc_stats[doc_ID] = OrderedDict([
+            ("freq_max", max(frequencies.values())),
+            ("moy_freq", sum(frequencies.values())/len(frequencies)),
+            ("unique", len(frequencies)),
+        ])
+        for term, frequency in frequencies.items():
+            index.setdefault(f"term{term}", OrderedDict())[doc_ID] = frequency
+    return InvertedIndex(2, index, OrderedDict((doc_ID, f"doc{doc_ID}") for doc_ID in range(nb_docs)), StatCollection(nb_docs, doc_stats))
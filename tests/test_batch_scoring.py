@@ -0,0 +1,45 @@
+from config import PATH_STOP_WORDS
+from preprocess import build_inverted_index
+from vectorial_query import WD_SCHEMES, get_scores, rank_scores
+from batch_scoring import batch_top_k, get_term_document_matrix
+from interface import retrieve_docs_from_vectorial_queries, retrieve_docs_from_vectorial_query
+from mock_data import COLLECTION, INVERTED_INDEX_2
+
+import pytest
+
+QUERIES = [
+    ["dumb", "test", "query"],
+    ["scientific", "paper", "medium"],
+    ["paper", "paper", "student", "unknown"],
+    ["unknown"],
+    [],
+]
+
+def assert_same_ranking(results, expected):
+    # only the documents with a non zero score are ranked by a batch
+    expected = [(doc_ID, score) for doc_ID, score in expected if score > 0]
+    assert [doc_ID for doc_ID, _ in results] == [doc_ID for doc_ID, _ in expected]
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+
+@pytest.mark.parametrize(
+    "wd,wq",
+    [(wd, wq) for wd in WD_SCHEMES for wq in ("binary", "tf", "tf_idf")],
+)
+def test_batch_top_k(wd, wq):
+    for k in (1, 3, 10):
+        results = batch_top_k(QUERIES, INVERTED_INDEX_2, k, wq, wd, batch_size=2)
+        assert len(results) == len(QUERIES)
+        for query, query_results in zip(QUERIES, results):
+            assert_same_ranking(query_results, rank_scores(get_scores(query, INVERTED_INDEX_2, wq, wd), k))
+
+def test_term_document_matrix():
+    term_document_matrix = get_term_document_matrix(INVERTED_INDEX_2, "binary")
+    assert term_document_matrix is get_term_document_matrix(INVERTED_INDEX_2, "binary")
+    assert term_document_matrix.matrix.shape == (len(INVERTED_INDEX_2.index), INVERTED_INDEX_2.stats.nb_docs)
+    assert term_document_matrix.matrix.nnz == sum(len(postings) for postings in INVERTED_INDEX_2.index.values())
+
+def test_retrieve_docs_from_vectorial_queries():
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=2, pos=False, tokenizer="regex")
+    queries = ["dumb tests about papers", "scientific media", "information retrieval"]
+    expected = [retrieve_docs_from_vectorial_query(query, inverted_index, 3, False, "tf_idf", "tf_idf_log_normalize", "regex") for query in queries]
+    assert retrieve_docs_from_vectorial_queries(queries, inverted_index, 3, False, "tf_idf", "tf_idf_log_normalize", "regex") == expected
@@ -0,0 +1,70 @@
+import json
+import pickle as pkl
+
+from config import PATH_STOP_WORDS
+from preprocess import build_inverted_index
+from benchmark import STAGES, benchmark_stages, load_sample, draw_queries, results_to_json, compare_to_baseline, format_table
+from mock_data import COLLECTION
+
+def test_benchmark_stages():
+    results = benchmark_stages(COLLECTION, type_index=2, pos=False, tokenizer="regex", nb_queries=8)
+    assert [result.stage for result in results] == [stage for stage in STAGES if stage != "corpus_loading"]
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=2, pos=False, tokenizer="regex")
+    stages = {result.stage: result for result in results}
+    assert stages["index"].postings == sum(len(postings) for postings in inverted_index.index.values())
+    # the preprocessing stage gives the terms indexed by build_inverted_index
+    assert stages["preprocessing"].postings == sum(inverted_index.index[term][doc_id] for term in inverted_index.index for doc_id in inverted_index.index[term])
+    assert stages["preparation"].items == len(COLLECTION) and 0 < stages["boolean_queries"].items <= 8
+    assert all(result.seconds > 0 and result.peak_bytes > 0 for result in results)
+    assert "total" in format_table(results)
+
+    # no weights nor vectorial queries for a document index
+    results = benchmark_stages(COLLECTION, type_index=1, pos=False, tokenizer="regex", nb_queries=4, memory=False)
+    assert [result.stage for result in results][-2:] == ["index", "boolean_queries"]
+    assert all(result.peak_bytes is None for result in results)
+
+def test_benchmark_loads_a_sample(tmp_path):
+    binary = tmp_path / "corpus.pkl"
+    with open(binary, "wb") as f:
+        pkl.dump(COLLECTION, f)
+    assert list(load_sample(str(binary), 3)) == ["test1", "test2", "test3"]
+
+    folder = tmp_path / "collection"
+    for block in ("0", "1"):
+        (folder / block).mkdir(parents=True)
+        for name in ("a", "b", "c"):
+            (folder / block / name).write_text(f"document {name} of block {block}")
+    assert list(load_sample(str(folder), 3)) == ["0/a", "0/b", "1/a"]
+
+    results = benchmark_stages(None, str(binary), sample=5, pos=False, tokenizer="regex", nb_queries=2, memory=False)
+    assert results[0].stage == "corpus_loading" and results[0].items == 5
+    assert results[1].items == 5
+
+def test_draw_queries_is_deterministic():
+    documents = [["cat", "dog", "fish"], [], ["bird"]]
+    boolean_queries, vectorial_queries = draw_queries(documents, 8, seed=1)
+    assert (boolean_queries, vectorial_queries) == draw_queries(documents, 8, seed=1)
+    assert len(boolean_queries) == len(vectorial_queries) == 8
+    assert " or " in boolean_queries[1] and " and not " in boolean_queries[2]
+    assert draw_queries([[]], 3) == ([], [])
+
+def test_compare_to_baseline():
+    results = benchmark_stages(COLLECTION, pos=False, tokenizer="regex", nb_queries=4)
+    current = json.loads(json.dumps(results_to_json(results, sample=len(COLLECTION))))
+    assert current["meta"]["sample"] == len(COLLECTION)
+    assert compare_to_baseline(current, current) == []
+
+    baseline = {"stages": [
+        {"stage": "index", "seconds": 1., "peak_bytes": 1000},
+        {"stage": "preparation", "seconds": 1., "peak_bytes": 1000},
+    ]}
+    run = {"stages": [
+        {"stage": "index", "seconds": 1.5, "peak_bytes": 1100},
+        {"stage": "preparation", "seconds": 0.01, "peak_bytes": 2000},
+        {"stage": "weights", "seconds": 10., "peak_bytes": 10},
+    ]}
+    regressions = compare_to_baseline(run, baseline, threshold=0.2)
+    assert [(regression["stage"], regression["metric"]) for regression in regressions] == [("index", "seconds"), ("preparation", "peak_bytes")]
+    assert regressions[0]["ratio"] == 1.5
+    # preparation is faster than min_seconds, only its memory is compared
+    assert compare_to_baseline(run, baseline, threshold=0.6) == [regressions[1]]
@@ -0,0 +1,83 @@
+from bitmap import Bitmap, use_bitmap, bitmap_and, bitmap_or, bitmap_andnot
+from bool_query import merge_and, merge_or, merge_nand, process_postfix_query
+from compact_index import compact_index, compact_postings, index_memory
+from mock_data import INVERTED_INDEX_1
+
+from collections import OrderedDict
+
+import pickle as pkl
+import random
+import pytest
+
+def test_bitmap():
+    bitmap = Bitmap.from_doc_ids([0, 3, 8, 9, 1000])
+    assert list(bitmap) == [0, 3, 8, 9, 1000]
+    assert len(bitmap) == 5
+    assert 8 in bitmap and 7 not in bitmap and 1001 not in bitmap and 10**6 not in bitmap
+    assert list(Bitmap()) == [] and len(Bitmap()) == 0
+    assert pkl.loads(pkl.dumps(bitmap)) == bitmap
+    assert list(pkl.loads(pkl.dumps(Bitmap()))) == []
+
+def test_bitmap_rank():
+    bitmap = Bitmap.from_doc_ids([0, 3, 8, 9, 1000])
+    assert [bitmap.rank(doc_id) for doc_id in (0, 3, 8, 9, 1000)] == [0, 1, 2, 3, 4]
+    # ranks across several blocks, and past the last document
+    doc_ids = sorted(random.Random(0).sample(range(20000), 3000))
+    bitmap = Bitmap.from_doc_ids(doc_ids)
+    assert [bitmap.rank(doc_id) for doc_id in doc_ids] == list(range(len(doc_ids)))
+    assert bitmap.rank(doc_ids[-1] + 1) == bitmap.rank(10**6) == len(doc_ids)
+
+def test_bitmap_postings():
+    postings = compact_postings(OrderedDict([(1, [0, 4]), (3, [2]), (8, [1, 5, 9])]), 3, with_bitmap=True)
+    # the document ids are only stored in the bitmap
+    assert postings._doc_ids is None and postings.bitmap is not None
+    assert list(postings) == [1, 3, 8] and list(postings.doc_ids) == [1, 3, 8] and len(postings) == 3
+    assert postings[8] == [1, 5, 9] and 4 not in postings
+    with pytest.raises(KeyError):
+        postings[4]
+    assert list(postings.items()) == [(1, [0, 4]), (3, [2]), (8, [1, 5, 9])]
+    # the decoded ids are kept
+    assert postings.doc_ids is postings.doc_ids
+    assert list(pkl.loads(pkl.dumps(postings)).items()) == list(postings.items())
+    assert compact_postings(OrderedDict([(1, 2), (3, 1), (8, 5)]), 2, with_bitmap=True).get(8) == 5
+
+    # a term in more than 1/32 of the documents takes less memory as a bitmap
+    dense = OrderedDict((doc_id, 1) for doc_id in range(0, 3200, 4))
+    assert index_memory({"dense": compact_postings(dense, 1, with_bitmap=True)}) < index_memory({"dense": compact_postings(dense, 1)})
+
+def test_use_bitmap():
+    assert use_bitmap(100, 1000)
+    assert not use_bitmap(10, 1000)
+    assert not use_bitmap(0, 0)
+
+@pytest.mark.parametrize(
+    "a_bitmap,b_bitmap",
+    [(True, True), (True, False), (False, True)],
+)
+def test_bitmap_merges(a_bitmap, b_bitmap):
+    random.seed(0)
+    a = sorted(random.sample(range(5000), 2000))
+    b = sorted(random.sample(range(5000), 300))
+    left = Bitmap.from_doc_ids(a) if a_bitmap else a
+    right = Bitmap.from_doc_ids(b) if b_bitmap else b
+    for merge, bitmap_merge, expected in (
+        (merge_and, bitmap_and, set(a) & set(b)),
+        (merge_or, bitmap_or, set(a) | set(b)),
+        (merge_nand, bitmap_andnot, set(a) - set(b)),
+    ):
+        assert list(bitmap_merge(left, right)) == sorted(expected)
+        assert list(merge(left, right)) == sorted(expected)
+
+def test_queries_with_bitmaps():
+    compact = compact_index(INVERTED_INDEX_1, bitmap_density=0.3)
+    assert any(postings.bitmap is not None for postings in compact.index.values())
+    assert any(postings.bitmap is None for postings in compact.index.values())
+    assert all(compact_index(INVERTED_INDEX_1, bitmap_density=None).index[term].bitmap is None for term in compact.index)
+
+    random.seed(0)
+    terms = list(compact.index) + ["lemu"]
+    for _ in range(200):
+        postfix_query = [random.choice(terms)]
+        for _ in range(random.randint(0, 5)):
+            postfix_query += [random.choice(terms), random.choice(["and", "or", "nand"])]
+        assert process_postfix_query(postfix_query, compact.index) == process_postfix_query(postfix_query, INVERTED_INDEX_1.index)
@@ -2,8 +2,11 @@ from typing import OrderedDict
 
 from bool_query import *
 
+import random
 import pytest
 
+from array import array
+
 TEST_INVERTED_INDEX_TYPE1: OrderedDict[str, OrderedDict[int, bool]] = {
     "cat": {1: True, 2: True, 3: True},
     "dog": {1:True, 3:True, 5:True},
@@ -30,6 +33,28 @@ def test_list_merging():
     assert boolean_operator_merge("and", [1, 2, 3], [1, 3, 5]) == [1, 3]
     assert boolean_operator_merge("nand", [1, 2, 3, 6], [1, 3, 5]) == [2, 6]
 
+def test_gallop():
+    a = [1, 3, 5, 7, 9, 11, 13]
+    assert gallop(a, 1, 0) == 0
+    assert gallop(a, 6, 0) == 3
+    assert gallop(a, 6, 3) == 3
+    assert gallop(a, 13, 2) == 6
+    assert gallop(a, 14, 0) == 7
+    assert gallop([], 1, 0) == 0
+
+@pytest.mark.parametrize(
+    "n,m",
+    [(5, 1000), (1000, 5), (0, 100), (100, 0), (300, 500)],
+)
+def test_galloping_merges(n, m):
+    random.seed(n * m)
+    a = sorted(random.sample(range(2000), n))
+    b = sorted(random.sample(range(2000), m))
+    assert merge_and(a, b) == sorted(set(a) & set(b))
+    assert merge_nand(a, b) == sorted(set(a) - set(b))
+    assert merge_and(array("I", a), array("I", b)) == sorted(set(a) & set(b))
+    assert merge_nand(array("I", a), array("I", b)) == sorted(set(a) - set(b))
+
 def test_process_postfix_query():
     # this is like (cat or (dog nand duck))
     assert process_postfix_query(['cat', 'dog', 'duck', "nand", 'or'], TEST_INVERTED_INDEX_TYPE1) == [1, 2, 3]
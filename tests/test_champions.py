@@ -0,0 +1,52 @@
+import random
+from dataclasses import replace
+
+from vectorial_query import get_document_weights, get_scores, rank_scores
+from champions import build_tiers, add_tiers, tiered_top_k, recall_report
+from mock_data import INVERTED_INDEX_2, random_frequency_index
+
+import pytest
+
+def test_build_tiers():
+    inverted_index = random_frequency_index(500, 40, seed=3)
+    document_weights = get_document_weights(inverted_index, "tf_idf_log_normalize")
+    tiers = build_tiers(inverted_index, document_weights, r=5, tier_factor=2)
+    norms = document_weights.norms
+    for term, postings in inverted_index.index.items():
+        term_tiers = tiers[term]
+        assert [len(tier) for tier in term_tiers[:-1]] == [5 * 2**idx for idx in range(len(term_tiers) - 1)]
+        assert sorted(doc_ID for tier in term_tiers for doc_ID in tier) == list(postings)
+        for tier in term_tiers:
+            assert list(tier) == sorted(tier)
+        weights = dict(zip(postings, document_weights.impacts[term]))
+        for better, worse in zip(term_tiers, term_tiers[1:]):
+            assert min(weights[doc_ID]/norms[doc_ID] for doc_ID in better) >= max(weights[doc_ID]/norms[doc_ID] for doc_ID in worse)
+
+def test_tiered_top_k():
+    inverted_index = random_frequency_index(500, 40, seed=3)
+    rng = random.Random(4)
+    queries = [[f"term{rng.randint(0, 40)}" for _ in range(rng.randint(1, 4))] for _ in range(20)]
+
+    # champion lists as long as the postings : exact ranking
+    add_tiers(inverted_index, ["tf_idf_log_normalize"], r=500)
+    for query in queries:
+        assert tiered_top_k(query, inverted_index, 10, "tf_idf", "tf_idf_log_normalize") == rank_scores(get_scores(query, inverted_index, "tf_idf", "tf_idf_log_normalize"), 10)
+
+    # short champion lists : lower tiers are read until k documents are found
+    add_tiers(inverted_index, ["tf_idf_log_normalize"], r=2, tier_factor=2)
+    for query in queries:
+        scores = get_scores(query, inverted_index, "tf_idf", "tf_idf_log_normalize")
+        counters = {}
+        results = tiered_top_k(query, inverted_index, 10, "tf_idf", "tf_idf_log_normalize", counters)
+        assert len(results) == min(10, len(scores))
+        for doc_ID, score in results:
+            assert score == scores[doc_ID]
+        assert counters["postings"] <= sum(len(inverted_index.index[term]) for term in set(query) if term in inverted_index.index)
+
+def test_recall_report():
+    inverted_index = replace(INVERTED_INDEX_2, weights=None)
+    queries = [["dumb", "test", "query"], ["scientific", "paper", "medium"], ["paper", "student"]]
+    report = recall_report(queries, inverted_index, rs=(1, 100), k=3)
+    assert [row["r"] for row in report] == [1, 100]
+    assert 0 <= report[0]["recall"] <= report[1]["recall"] == 1.
+    assert report[0]["postings_per_query"] <= report[1]["postings_per_query"]
@@ -0,0 +1,58 @@
+from config import PATH_STOP_WORDS
+from preprocess import build_inverted_index, save_index, load_index
+from compact_index import Postings, compact_postings, compact_index, is_compact, index_memory
+from bool_query import process_postfix_query
+from vectorial_query import get_scores
+from mock_data import COLLECTION, INVERTED_INDEX_1, INVERTED_INDEX_2
+
+import pytest
+
+@pytest.mark.parametrize(
+    "index_type",
+    [1, 2, 3],
+)
+def test_compact_index(index_type):
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=index_type, pos=False, tokenizer="regex")
+    compact = compact_index(inverted_index)
+    assert is_compact(compact) and not is_compact(inverted_index)
+    assert compact.mapping == inverted_index.mapping
+    assert dict(compact.stats.doc_stats) == inverted_index.stats.doc_stats
+    assert list(compact.index) == list(inverted_index.index)
+    for term, postings in inverted_index.index.items():
+        assert compact.index[term] == postings
+        assert list(compact.index[term].items()) == list(postings.items())
+    assert index_memory(compact.index) < index_memory(inverted_index.index)
+
+def test_postings():
+    postings = compact_postings({1: [0, 4], 3: [2], 8: [1, 5, 9]}, 3)
+    assert len(postings) == 3
+    assert list(postings) == [1, 3, 8]
+    assert postings[8] == [1, 5, 9]
+    assert 3 in postings and 4 not in postings and "lemu" not in postings
+    with pytest.raises(KeyError):
+        postings[4]
+
+    postings = compact_postings({1: 2, 3: 1}, 2)
+    assert postings.get(3, 0) == 1 and postings.get(2, 0) == 0
+    assert list(postings.values()) == [2, 1]
+
+def test_queries_on_compact_index():
+    compact_1, compact_2 = compact_index(INVERTED_INDEX_1), compact_index(INVERTED_INDEX_2)
+
+    for postfix_query in (["test", "query", "student", "or", "and"], ["paper", "query", "nand"], ["test"], ["lemu"]):
+        assert process_postfix_query(postfix_query, compact_1.index) == process_postfix_query(postfix_query, INVERTED_INDEX_1.index)
+
+    query = ["dumb", "test", "query", "paper"]
+    for wd in ("binary", "frequency", "tf_idf_normalize", "tf_idf_logarithmic", "tf_idf_log_normalize"):
+        assert get_scores(query, compact_2, "tf_idf", wd) == get_scores(query, INVERTED_INDEX_2, "tf_idf", wd)
+
+def test_save_and_load_compact_index(tmp_path):
+    path = str(tmp_path / "index.pkl")
+    save_index(path, INVERTED_INDEX_2)
+    loaded = load_index(path, compact=True)
+    assert is_compact(loaded)
+    assert dict(loaded.index) == dict(INVERTED_INDEX_2.index)
+
+    # compact postings can be pickled as they are
+    save_index(path, loaded)
+    assert is_compact(load_index(path))
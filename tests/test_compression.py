@@ -0,0 +1,53 @@
+from compression import (
+    CODECS, ENCODERS, DECODERS, delta_encode, delta_decode, vbyte_encode, gamma_encode,
+    encode_postings, decode_postings, compression_report
+)
+from disk_index import postings_to_dict
+from config import PATH_STOP_WORDS
+from preprocess import build_inverted_index
+from mock_data import COLLECTION
+
+import pytest
+
+INVERTED_INDEXES = {
+    index_type: build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=index_type, pos=False, tokenizer="regex")
+    for index_type in (1, 2, 3)
+}
+
+NUMBERS = [0, 1, 2, 5, 127, 128, 129, 16383, 16384, 2**21, 2**32 - 1]
+
+def test_delta():
+    values = [3, 4, 10, 200, 201]
+    assert delta_encode(values) == [3, 1, 6, 190, 1]
+    assert delta_decode(delta_encode(values)) == values
+    assert delta_encode([]) == []
+
+@pytest.mark.parametrize(
+    "codec",
+    CODECS,
+)
+def test_codecs(codec):
+    assert list(DECODERS[codec](ENCODERS[codec](NUMBERS))) == NUMBERS
+    assert list(DECODERS[codec](ENCODERS[codec]([]))) == []
+
+def test_codecs_sizes():
+    assert vbyte_encode([5]) == bytes([133])
+    assert vbyte_encode([824]) == bytes([6, 184])
+    # gamma codes of 1, 2 and 3 (0, 1 and 2 shifted by one) : 1 010 011, padded
+    assert gamma_encode([0, 1, 2]) == bytes([0b10100110])
+
+@pytest.mark.parametrize(
+    "index_type,codec",
+    [(index_type, codec) for index_type in (1, 2, 3) for codec in CODECS],
+)
+def test_postings_round_trip(index_type, codec):
+    for postings in INVERTED_INDEXES[index_type].index.values():
+        doc_ids, values = decode_postings(encode_postings(postings, index_type, codec), len(postings), index_type, codec)
+        assert postings_to_dict(doc_ids, values, index_type) == postings
+
+def test_compression_report():
+    report = compression_report(INVERTED_INDEXES[3].index, 3)
+    assert list(report) == list(CODECS)
+    assert report["vbyte"]["size"] < report["raw"]["size"]
+    assert report["gamma"]["bytes_per_posting"] < report["vbyte"]["bytes_per_posting"]
+    assert all(measures["postings_per_second"] > 0 for measures in report.values())
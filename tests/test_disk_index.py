@@ -0,0 +1,162 @@
+from config import PATH_STOP_WORDS
+from preprocess import build_inverted_index, save_index, load_index
+from spimi import build_disk_index_spimi
+from disk_index import DiskIndex, DiskPostings, TermWeights, is_disk_index, save_weights, meta_path, HEADER, MAGIC, FORMAT_VERSION
+from compression import CODECS
+from bool_query import process_postfix_query
+from vectorial_query import get_scores, precompute_weights
+from champions import add_tiers, tiered_top_k
+from impact_index import add_impact_ordered, score_at_a_time
+from mock_data import COLLECTION, INVERTED_INDEX_1, INVERTED_INDEX_2
+
+import pickle as pkl
+from dataclasses import replace
+
+import pytest
+
+@pytest.mark.parametrize(
+    "index_type,codec",
+    [(index_type, codec) for index_type in (1, 2, 3) for codec in CODECS],
+)
+def test_save_and_load_binary_index(index_type, codec, tmp_path):
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=index_type, pos=False, tokenizer="regex")
+    path = str(tmp_path / "index.bin")
+    save_index(path, inverted_index, "binary", codec)
+    assert is_disk_index(path)
+
+    disk_index = load_index(path)
+    assert isinstance(disk_index.index, DiskIndex)
+    assert disk_index.itype == index_type
+    assert disk_index.index.codec == codec
+    assert disk_index.mapping == inverted_index.mapping
+    assert disk_index.stats.nb_docs == inverted_index.stats.nb_docs
+    assert dict(disk_index.stats.doc_stats) == inverted_index.stats.doc_stats
+
+    assert len(disk_index.index) == len(inverted_index.index)
+    assert list(disk_index.index) == sorted(inverted_index.index)
+    for term, postings in inverted_index.index.items():
+        assert term in disk_index.index
+        assert disk_index.index[term] == postings
+        assert disk_index.index.document_frequency(term) == len(postings)
+    assert "lemu" not in disk_index.index
+    assert disk_index.index.document_frequency("lemu") == 0
+    with pytest.raises(KeyError):
+        disk_index.index["lemu"]
+
+@pytest.mark.parametrize(
+    "codec",
+    CODECS,
+)
+def test_disk_postings_are_decoded_lazily(codec, tmp_path):
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=3, pos=False, tokenizer="regex")
+    path = str(tmp_path / "index.bin")
+    save_index(path, inverted_index, "binary", codec)
+    disk_index = load_index(path)
+    for term, expected in inverted_index.index.items():
+        postings = disk_index.index[term]
+        assert isinstance(postings, DiskPostings)
+        assert len(postings) == len(expected) and postings._doc_ids is None
+        # a boolean query only decodes the document ids
+        assert list(postings.doc_ids) == list(expected)
+        assert postings._positions is None
+        doc_id = next(iter(expected))
+        assert postings[doc_id] == expected[doc_id]
+        assert postings._buffer is None
+        assert dict(postings.items()) == expected
+
+def test_spimi_to_binary_index(tmp_path):
+    path = str(tmp_path / "index.bin")
+    build_disk_index_spimi(COLLECTION, PATH_STOP_WORDS, path, type_index=2, pos=False, memory_budget=1e-6, tokenizer="regex")
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=2, pos=False, tokenizer="regex")
+    assert dict(load_index(path).index) == dict(inverted_index.index)
+
+def test_other_binary_index_versions_are_rejected(tmp_path):
+    path = str(tmp_path / "index.bin")
+    save_index(path, INVERTED_INDEX_2, "binary")
+    with open(path, "r+b") as f:
+        _, _, itype, codec, nb_terms = HEADER.unpack(f.read(HEADER.size))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION + 1, itype, codec, nb_terms))
+    with pytest.raises(Exception, match="unsupported binary index version"):
+        load_index(path)
+
+def test_pickle_index_still_loads(tmp_path):
+    path = str(tmp_path / "index.pkl")
+    save_index(path, INVERTED_INDEX_2)
+    assert not is_disk_index(path)
+    assert load_index(path) == INVERTED_INDEX_2
+
+@pytest.mark.parametrize(
+    "codec",
+    CODECS,
+)
+def test_queries_on_binary_index(codec, tmp_path):
+    path_1, path_2 = str(tmp_path / "index_1.bin"), str(tmp_path / "index_2.bin")
+    save_index(path_1, INVERTED_INDEX_1, "binary", codec)
+    save_index(path_2, replace(INVERTED_INDEX_2, weights=precompute_weights(INVERTED_INDEX_2, ["tf_idf_log_normalize"])), "binary", codec)
+
+    postfix_query = ["test", "query", "student", "or", "and"]
+    assert process_postfix_query(postfix_query, load_index(path_1).index) == process_postfix_query(postfix_query, INVERTED_INDEX_1.index)
+
+    query = ["dumb", "test", "query", "paper"]
+    assert get_scores(query, load_index(path_2), "tf_idf", "tf_idf_log_normalize") == get_scores(query, INVERTED_INDEX_2, "tf_idf", "tf_idf_log_normalize")
+
+def test_precomputed_weights_on_binary_index(tmp_path):
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=2, pos=False, tokenizer="regex")
+    inverted_index.weights = precompute_weights(inverted_index)
+    path = str(tmp_path / "index.bin")
+    save_index(path, inverted_index, "binary")
+    disk_index = load_index(path)
+    assert disk_index.weights == inverted_index.weights
+
+    # weights added once the index is written, eg by SPIMI
+    spimi_path = str(tmp_path / "spimi.bin")
+    build_disk_index_spimi(COLLECTION, PATH_STOP_WORDS, spimi_path, type_index=2, pos=False, memory_budget=1e-6, tokenizer="regex")
+    assert load_index(spimi_path).weights is None
+    save_weights(spimi_path, precompute_weights(load_index(spimi_path), ["binary"]))
+    assert load_index(spimi_path).weights == {"binary": inverted_index.weights["binary"]}
+
+def test_precomputed_weights_are_read_per_term(tmp_path):
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=2, pos=False, tokenizer="regex")
+    inverted_index.weights = precompute_weights(inverted_index, ["tf_idf_logarithmic"])
+    add_tiers(inverted_index, ["tf_idf_logarithmic"], 2)
+    add_impact_ordered(inverted_index, ["tf_idf_logarithmic"])
+    path = str(tmp_path / "index.bin")
+    save_index(path, inverted_index, "binary")
+
+    # the meta file only keeps the idf and the norms
+    with open(meta_path(path), "rb") as f:
+        summary = pkl.load(f)["weights"]["tf_idf_logarithmic"]
+    assert summary["idf"] == inverted_index.weights["tf_idf_logarithmic"].idf
+    assert summary["norms"] == inverted_index.weights["tf_idf_logarithmic"].norms
+    assert set(summary) == {"idf", "norms", "sections", "impact_levels"}
+
+    disk_index = load_index(path)
+    document_weights = disk_index.weights["tf_idf_logarithmic"]
+    assert isinstance(document_weights.impacts, TermWeights)
+    expected = inverted_index.weights["tf_idf_logarithmic"]
+    assert document_weights.impacts["paper"] == expected.impacts["paper"]
+    assert document_weights.max_impacts["paper"] == expected.max_impacts["paper"]
+    assert document_weights.tiers["paper"] == expected.tiers["paper"]
+    assert document_weights.impact_ordered.segments["paper"] == expected.impact_ordered.segments["paper"]
+    assert "unknown" not in document_weights.impacts
+
+    query = ["dumb", "test", "query", "paper"]
+    assert tiered_top_k(query, disk_index, 3, "tf_idf", "tf_idf_logarithmic") == tiered_top_k(query, inverted_index, 3, "tf_idf", "tf_idf_logarithmic")
+    assert score_at_a_time(query, disk_index, 3, "tf_idf", "tf_idf_logarithmic") == score_at_a_time(query, inverted_index, 3, "tf_idf", "tf_idf_logarithmic")
+
+def test_missing_weights_of_binary_index_raise(tmp_path):
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=2, pos=False, tokenizer="regex")
+    inverted_index.weights = precompute_weights(inverted_index, ["binary"])
+    path = str(tmp_path / "index.bin")
+    save_index(path, inverted_index, "binary")
+    disk_index = load_index(path)
+
+    query = ["dumb", "test", "query", "paper"]
+    assert get_scores(query, disk_index, "tf_idf", "binary") == get_scores(query, inverted_index, "tf_idf", "binary")
+    with pytest.raises(Exception, match="no document weights"):
+        get_scores(query, disk_index, "tf_idf", "tf_idf_logarithmic")
+    with pytest.raises(Exception, match="no tiers"):
+        tiered_top_k(query, disk_index, 3, "tf_idf", "binary")
+    with pytest.raises(Exception, match="no impact ordered postings"):
+        score_at_a_time(query, disk_index, 3, "tf_idf", "binary")
@@ -0,0 +1,57 @@
+import random
+from dataclasses import replace
+
+from vectorial_query import get_document_weights, get_scores, rank_scores
+from impact_index import build_impact_ordered, add_impact_ordered, score_at_a_time, budget_report
+from mock_data import INVERTED_INDEX_2, random_frequency_index
+
+import pytest
+
+def test_build_impact_ordered():
+    inverted_index = random_frequency_index(500, 40, seed=3)
+    document_weights = get_document_weights(inverted_index, "tf_idf_log_normalize")
+    impact_ordered = build_impact_ordered(inverted_index, document_weights, levels=16)
+    norms = document_weights.norms
+    for term, postings in inverted_index.index.items():
+        segments = impact_ordered.segments[term]
+        impacts = [impact for impact, _ in segments]
+        assert impacts == sorted(impacts, reverse=True) and len(set(impacts)) == len(impacts)
+        assert all(0 <= impact < 16 for impact in impacts)
+        assert sorted(doc_ID for _, doc_IDs in segments for doc_ID in doc_IDs) == list(postings)
+        weights = dict(zip(postings, document_weights.impacts[term]))
+        for impact, doc_IDs in segments:
+            assert list(doc_IDs) == sorted(doc_IDs)
+            for doc_ID in doc_IDs:
+                assert abs(weights[doc_ID]/norms[doc_ID] - impact * impact_ordered.scale) <= impact_ordered.scale
+
+def test_score_at_a_time():
+    inverted_index = random_frequency_index(500, 40, seed=3)
+    rng = random.Random(4)
+    queries = [[f"term{rng.randint(0, 40)}" for _ in range(rng.randint(1, 4))] for _ in range(20)]
+
+    # fine quantization and no budget : exact ranking
+    add_impact_ordered(inverted_index, ["tf_idf_log_normalize"], levels=2**20)
+    counters = {}
+    for query in queries:
+        expected = rank_scores(get_scores(query, inverted_index, "tf_idf", "tf_idf_log_normalize"), 10)
+        assert score_at_a_time(query, inverted_index, 10, "tf_idf", "tf_idf_log_normalize", counters=counters) == expected
+    assert counters.get("safe_stops", 0) > 0
+    assert "budget_stops" not in counters
+
+    # a budget bounds the postings processed by each query
+    for query in queries:
+        counters = {}
+        scores = get_scores(query, inverted_index, "tf_idf", "tf_idf_log_normalize")
+        results = score_at_a_time(query, inverted_index, 10, "tf_idf", "tf_idf_log_normalize", max_postings=25, counters=counters)
+        assert counters["postings"] <= 25
+        assert len(results) <= 10
+        for doc_ID, score in results:
+            assert score == scores[doc_ID]
+
+def test_budget_report():
+    inverted_index = replace(INVERTED_INDEX_2, weights=None)
+    queries = [["dumb", "test", "query"], ["scientific", "paper", "medium"], ["paper", "student"]]
+    report = budget_report(queries, inverted_index, budgets=(None, 1), k=3)
+    assert [row["budget"] for row in report] == [None, 1]
+    assert report[0]["recall"] == 1.
+    assert report[1]["postings_per_query"] <= 1
@@ -0,0 +1,37 @@
+from import_time import COLD_START_BUDGET, import_times, cold_start, heavy_imports, parse_import_times, format_report, run_python
+
+def test_parse_import_times():
+    report = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       120 |        120 |   _io",
+        "import time:      1500 |       1620 | preprocess",
+        "some other output",
+    ])
+    timings = parse_import_times(report)
+    assert [(timing.module, timing.self_us, timing.cumulative_us, timing.depth) for timing in timings] == [("_io", 120, 120, 1), ("preprocess", 1500, 1620, 0)]
+    assert format_report(timings, top=1).splitlines()[1].split() == ["1.6", "1.5", "preprocess"]
+
+def test_query_cli_imports_no_heavy_dependency():
+    timings = import_times("interface")
+    assert "interface" in [timing.module for timing in timings]
+    assert heavy_imports(timings) == []
+    assert heavy_imports(timings, ["interface", "numpy"]) == ["interface"]
+
+def test_query_cli_cold_start_within_budget():
+    duration = cold_start("interface")
+    assert duration < COLD_START_BUDGET, f"cold start of interface.py : {duration:.3f} s\n" + format_report(import_times("interface"))
+
+def test_cached_stems_answer_queries_without_nltk():
+    # the stems of a query found in the lemma cache (eg preloaded with the index) need no stemmer
+    script = "; ".join([
+        "import sys",
+        "sys.path.append('tests')",
+        "from mock_data import INVERTED_INDEX_2",
+        "from preprocess import LEMMA_CACHE",
+        "LEMMA_CACHE.stems.update({'dumb': 'dumb', 'tests': 'test', 'papers': 'paper'})",
+        "from interface import retrieve_docs_from_vectorial_query",
+        "print(retrieve_docs_from_vectorial_query('dumb tests about papers', INVERTED_INDEX_2, 3, False, 'tf_idf', 'tf_idf_log_normalize', 'regex'))",
+        "print('nltk' in sys.modules)",
+    ])
+    output = run_python(["-c", script]).stdout.splitlines()
+    assert output == ["['test1', 'test6', 'test3']", "False"]
@@ -1,5 +1,8 @@
+import pytest
+
 from preprocess import InvertedIndex
-from interface import retrieve_docs_from_bool_query
+from interface import retrieve_docs_from_bool_query, retrieve_docs_from_vectorial_query, VECTORIAL_ENGINES, QueryOptions, run_batch
+from mock_data import INVERTED_INDEX_2
 
 TEST_INVERTED_INDEX_TYPE1 = InvertedIndex(
     itype=1,
@@ -41,4 +44,54 @@ def test_bool_query_with_operator():
     assert retrieve_docs_from_bool_query("lemu and ( cat or dog )", TEST_INVERTED_INDEX_TYPE1, True) == []
 
     #  squid and ( cat or dog )
-    assert retrieve_docs_from_bool_query("squid and ( cat or dog )", TEST_INVERTED_INDEX_TYPE1, True) == ["Everything about animals", "Why cats love seafood", "Every animal but birds"]
\ No newline at end of file
+    assert retrieve_docs_from_bool_query("squid and ( cat or dog )", TEST_INVERTED_INDEX_TYPE1, True) == ["Everything about animals", "Why cats love seafood", "Every animal but birds"]
+
+def test_bool_query_with_not():
+    # this is like (squid and (not cat))
+    assert retrieve_docs_from_bool_query("squid not cats", TEST_INVERTED_INDEX_TYPE1, True) == ["Vingt mille lieues sous les mers"]
+
+    # this is like (not (cat or dog))
+    assert retrieve_docs_from_bool_query("not ( cats or dogs )", TEST_INVERTED_INDEX_TYPE1, True) == ["The trial - Kafka", "Vingt mille lieues sous les mers"]
+
+    # this is like ((not duck) or squid)
+    assert retrieve_docs_from_bool_query("not duck or squid", TEST_INVERTED_INDEX_TYPE1, True) == ["Everything about animals", "Why cats love seafood", "Every animal but birds", "The trial - Kafka", "Vingt mille lieues sous les mers"]
+
+@pytest.mark.parametrize(
+    "engine",
+    VECTORIAL_ENGINES,
+)
+def test_vectorial_query_engines(engine):
+    assert retrieve_docs_from_vectorial_query("dumb tests about papers", INVERTED_INDEX_2, 3, False, "tf_idf", "tf_idf_log_normalize", "regex", engine) == ["test1", "test6", "test3"]
+
+
+@pytest.mark.parametrize(
+    "workers",
+    [1, 2],
+)
+def test_batch_keeps_query_order(workers):
+    queries = ["dumb tests about papers", "paper", "unknown"] * 20
+    options = QueryOptions("vectorial", 3, False, "tf_idf", "tf_idf_log_normalize", "regex")
+    results = list(run_batch(queries, INVERTED_INDEX_2, options, workers, chunksize=4))
+    assert [result["query"] for result in results] == queries
+    for result in results:
+        assert result["documents"] == retrieve_docs_from_vectorial_query(result["query"], INVERTED_INDEX_2, 3, False, "tf_idf", "tf_idf_log_normalize", "regex")
+        assert len(result["scores"]) == len(result["documents"])
+        assert result["scores"] == sorted(result["scores"], reverse=True)
+        assert result["time_ms"] >= 0
+
+def test_batch_boolean_queries_and_errors():
+    options = QueryOptions("boolean", pos=False, tokenizer="regex")
+    results = list(run_batch(["cats dog squid", "( cats", "not duck"], TEST_INVERTED_INDEX_TYPE1, options, workers=2))
+    assert results[0]["documents"] == ["Everything about animals", "Every animal but birds"]
+    assert "scores" not in results[0]
+    # a malformed query is reported without stopping the batch
+    assert "error" in results[1] and "documents" not in results[1]
+    assert results[2]["documents"] == retrieve_docs_from_bool_query("not duck", TEST_INVERTED_INDEX_TYPE1, False, "regex")
+
+def test_batch_reports_empty_queries():
+    options = QueryOptions("boolean", pos=False, tokenizer="regex")
+    results = list(run_batch(["cats dog squid", "", "not duck"], TEST_INVERTED_INDEX_TYPE1, options))
+    # every line gets a result, in place
+    assert [result["query"] for result in results] == ["cats dog squid", "", "not duck"]
+    assert results[1]["error"] == "Exception: empty query"
+    assert results[2]["documents"] == retrieve_docs_from_bool_query("not duck", TEST_INVERTED_INDEX_TYPE1, False, "regex")
@@ -1,10 +1,13 @@
 from collections import OrderedDict
 
-from config import PATH_STOP_WORDS
-from preprocess import build_inverted_index, InvertedIndex
+from config import PATH_STOP_WORDS, PATH_DATA
+from preprocess import build_inverted_index, create_corpus_from_files, load_index, StatCollection, split_collection, tokenize_document, filter_function, lemmatize_document, LemmaCache, InvertedIndex
+from nltk.tokenize import word_tokenize
 from mock_data import COLLECTION, get_index
 
+import os
 import pickle
+import sys
 import pytest
 
 @pytest.mark.parametrize(
@@ -16,3 +19,127 @@ def test_build_dev_inverted_index(index_type):
     assert get_index(index_type).index == inverted_index.index
     assert get_index(index_type).itype == inverted_index.itype
     assert get_index(index_type).stats == inverted_index.stats
+
+@pytest.mark.parametrize(
+    "index_type",
+    [1, 2, 3],
+)
+def test_build_parallel_inverted_index(index_type):
+    serial_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=index_type)
+    parallel_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=index_type, workers=3)
+    assert list(serial_index.index.items()) == list(parallel_index.index.items())
+    assert serial_index.mapping == parallel_index.mapping
+    assert serial_index.stats == parallel_index.stats
+
+def test_split_collection():
+    shards = split_collection(COLLECTION, 3)
+    assert [len(shard) for shard in shards] == [3, 2, 2]
+    assert [key for shard in shards for key in shard] == list(COLLECTION.keys())
+    assert len(split_collection({"a": "b"}, 4)) == 1
+
+def test_lemma_cache(tmp_path):
+    cache = LemmaCache(max_size=2)
+    assert lemmatize_document(["cats", "cats", "dogs"], pos=False, cache=cache) == ["cat", "cat", "dog"]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # least recently used entries are evicted first
+    cache.stem("cats")
+    cache.stem("ducks")
+    assert list(cache.stems.keys()) == ["cats", "ducks"]
+
+    path = str(tmp_path / "index.pkl.lemmas")
+    cache.save(path)
+    loaded_cache = LemmaCache.load(path)
+    assert loaded_cache.stems == cache.stems
+    assert loaded_cache.stem("ducks") == "duck"
+    assert loaded_cache.hits == 1
+
+    # a cache returned by a worker process keeps its counters, so that they add up
+    merged = LemmaCache()
+    merged.update(pickle.loads(pickle.dumps(cache)))
+    assert (merged.hits, merged.misses) == (cache.hits, cache.misses)
+    assert merged.stems == cache.stems
+
+def test_lemma_cache_bounds_lemmas_and_stems_separately():
+    cache = LemmaCache(max_size=2)
+    cache.lemmas[("cats", "n")] = "cat"
+    # stems filling the cache do not evict the lemmas
+    for token in ("dogs", "ducks", "mice"):
+        cache.stem(token)
+    assert list(cache.stems.keys()) == ["ducks", "mice"]
+    assert cache.lemmatize("cats", "n") == "cat"
+    assert len(cache) == 3
+
+@pytest.mark.parametrize(
+    "pos",
+    [True, False],
+)
+def test_build_inverted_index_batches(pos):
+    # documents are POS tagged and lemmatized by batches, in each worker process
+    expected = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=3, pos=pos, tokenizer="regex", batch_size=1)
+    for batch_size, workers in ((2, 1), (3, 2)):
+        index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=3, pos=pos, tokenizer="regex", batch_size=batch_size, workers=workers)
+        assert index.index == expected.index
+        assert index.mapping == expected.mapping
+
+TOKENIZATION_SAMPLE = list(COLLECTION.values()) + [
+    "cats or ( dogs nand duck ) and squid",
+    "\"Cannot\" stop: we're gonna build the index (again), aren't we?",
+    "John's students' papers -- 3,000 of them -- weren't 'really' late...",
+    "e-mail me at foo@bar.com; it's 10:30 and I wanna go home.",
+]
+
+@pytest.mark.parametrize(
+    "document",
+    TOKENIZATION_SAMPLE,
+)
+def test_regex_tokenizer_parity(document):
+    # sentences are not split by the regex tokenizer, compare to nltk on a single sentence
+    nltk_tokens = word_tokenize(document.lower(), preserve_line=True)
+    regex_tokens = tokenize_document(document, tokenizer="regex")
+    assert [tok for tok in regex_tokens if not filter_function(tok)] == [tok for tok in nltk_tokens if not filter_function(tok)]
+
+@pytest.mark.skipif(not os.path.isdir(PATH_DATA), reason="the collection is not in data/collection")
+def test_regex_tokenizer_parity_on_collection_sample():
+    # the first 20 documents of each block of the collection
+    sample = create_corpus_from_files(PATH_DATA, dev=True, dev_iter=20)
+    nltk_index = build_inverted_index(sample, PATH_STOP_WORDS, type_index=3, pos=False, tokenizer="nltk")
+    regex_index = build_inverted_index(sample, PATH_STOP_WORDS, type_index=3, pos=False, tokenizer="regex")
+    # both indexes only hold the terms kept by filter_function
+    assert set(regex_index.index) == set(nltk_index.index)
+    for term, postings in nltk_index.index.items():
+        assert regex_index.index[term] == postings, term
+    assert regex_index.stats == nltk_index.stats
+
+def test_whitespace_tokenizer():
+    assert tokenize_document("Information  retrieval\nand web search", tokenizer="whitespace") == ["information", "retrieval", "and", "web", "search"]
+    with pytest.raises(Exception):
+        tokenize_document("information retrieval", tokenizer="spacy")
+
+@pytest.mark.parametrize(
+    "tokenizer",
+    ["regex", "whitespace"],
+)
+def test_build_inverted_index_tokenizers(tokenizer):
+    collection = COLLECTION if tokenizer == "regex" else OrderedDict((key, " ".join(word_tokenize(document))) for key, document in COLLECTION.items())
+    nltk_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=3)
+    fast_index = build_inverted_index(collection, PATH_STOP_WORDS, type_index=3, tokenizer=tokenizer)
+    assert list(fast_index.index.items()) == list(nltk_index.index.items())
+    assert fast_index.stats == nltk_index.stats
+
+def test_load_index_pickled_by_the_script(tmp_path, monkeypatch):
+    # preprocess.py pickles the index while it runs as __main__
+    inverted_index = get_index(2)
+    for cls in (InvertedIndex, StatCollection):
+        monkeypatch.setattr(cls, "__module__", "__main__")
+        monkeypatch.setattr(sys.modules["__main__"], cls.__name__, cls, raising=False)
+    path = str(tmp_path / "index.pkl")
+    with open(path, "wb") as f:
+        pickle.dump(inverted_index, f)
+    assert b"__main__" in open(path, "rb").read()
+    monkeypatch.undo()
+
+    # any other script can load it
+    loaded = load_index(path)
+    assert isinstance(loaded, InvertedIndex) and isinstance(loaded.stats, StatCollection)
+    assert loaded == inverted_index
@@ -0,0 +1,48 @@
+from config import PATH_STOP_WORDS
+from preprocess import LemmaCache
+from query_analyzer import QueryAnalyzer, get_query_analyzer, analyze_without_analyzer, benchmark_analysis
+from bool_query import LOGICAL_TOKENS_VALUES
+import bool_query as bq
+import vectorial_query as vq
+
+def test_analyze_matches_analysis_without_analyzer():
+    analyzer = QueryAnalyzer(PATH_STOP_WORDS, pos=False, tokenizer="regex")
+    for query in ("this is a test query", "scientific papers in the media", "dumb test query", "the and of"):
+        assert analyzer.analyze(query) == analyze_without_analyzer(query, False, "regex")
+    assert analyzer.analyze("dumb tests about papers") == ["dumb", "test", "paper"]
+
+def test_analyze_boolean_keeps_operators():
+    analyzer = QueryAnalyzer(pos=False, tokenizer="regex")
+    assert analyzer.analyze_boolean("cats or any dogs nand duck", LOGICAL_TOKENS_VALUES) == ["cat", "or", "dog", "nand", "duck"]
+    assert analyzer.analyze_boolean("not ( cats and the dogs )", LOGICAL_TOKENS_VALUES) == ["not", "(", "cat", "and", "dog", ")"]
+    # operators are stop words of the vectorial model
+    assert analyzer.analyze("cats or dogs") == ["cat", "dog"]
+
+def test_analysis_cache():
+    analyzer = QueryAnalyzer(pos=False, tokenizer="regex")
+    first = analyzer.analyze("scientific papers")
+    # the cached query is a copy, changing it does not change the cache
+    first.append("changed")
+    assert analyzer.analyze("scientific papers") == ["scientif", "paper"]
+    assert analyzer.cache.stats()["hits"] == 1 and analyzer.cache.stats()["misses"] == 1
+    # another tokenizer or operators make another entry
+    analyzer.analyze("scientific papers", tokenizer="whitespace")
+    analyzer.analyze_boolean("scientific papers", LOGICAL_TOKENS_VALUES)
+    assert len(analyzer.cache) == 3
+    # a given lemma cache bypasses the analysis cache
+    lemma_cache = LemmaCache()
+    assert analyzer.analyze("scientific papers", lemma_cache=lemma_cache) == ["scientif", "paper"]
+    assert len(lemma_cache) == 2 and len(analyzer.cache) == 3
+
+def test_query_models_share_the_analyzer():
+    analyzer = get_query_analyzer()
+    assert get_query_analyzer() is analyzer
+    assert vq.lemmatize_query("dumb tests about papers", pos=False, tokenizer="regex") == ["dumb", "test", "paper"]
+    assert bq.lemmatize_query("dumb or papers", pos=False, tokenizer="regex") == ["dumb", "or", "paper"]
+    assert ("dumb tests about papers", False, "regex", frozenset()) in analyzer.cache
+    assert ("dumb or papers", False, "regex", frozenset(LOGICAL_TOKENS_VALUES)) in analyzer.cache
+
+def test_benchmark_analysis():
+    report = benchmark_analysis(["dumb tests about papers", "scientific media"], pos=False, tokenizer="regex", rounds=1)
+    assert set(report) == {"without_analyzer", "cold_analyzer", "warm_analyzer"}
+    assert all(latency > 0 for latency in report.values())
@@ -0,0 +1,95 @@
+from array import array
+
+from bool_query import process_postfix_query
+from query_cache import QueryCache, nbytes
+from query_plan import canonical, parse_postfix, process_planned_query
+from preprocess import InvertedIndex
+from interface import retrieve_docs_from_bool_query
+
+import pytest
+
+TEST_INVERTED_INDEX_TYPE1 = {
+    "cat": {1: True, 2: True, 3: True},
+    "dog": {1:True, 3:True, 5:True},
+    "duck": {1:True, 5:True},
+    "squid": {1:True, 2:True, 3:True, 6:True},
+}
+
+class CountingIndex(dict):
+    """index counting the postings read"""
+    reads = 0
+
+    def __getitem__(self, term):
+        self.reads += 1
+        return super().__getitem__(term)
+
+def test_lru_eviction():
+    value = array("I", range(100))
+    cache = QueryCache(max_bytes=3 * nbytes(value))
+    for key in "abc":
+        cache.put(key, value)
+    assert cache.get("a") is value
+    cache.put("d", value)
+    assert "b" not in cache
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert cache.size == 3 * nbytes(value)
+    assert cache.evictions == 1
+    assert cache.get("b") is None
+    assert cache.hits == 1 and cache.misses == 1 and cache.hit_rate == 0.5
+
+    # too large to be cached
+    cache.put("e", array("I", range(1000)))
+    assert "e" not in cache and len(cache) == 3
+
+def test_version():
+    cache = QueryCache(version="1")
+    cache.put("a", 1)
+    cache.check_version("1")
+    assert "a" in cache
+    cache.check_version("2")
+    assert len(cache) == 0 and cache.size == 0 and cache.version == "2"
+
+def test_canonical():
+    assert canonical(parse_postfix(["cat", "dog", "and"])) == canonical(parse_postfix(["dog", "cat", "and"])) == "(and cat dog)"
+    assert canonical(parse_postfix(["cat", "dog", "or", "duck", "not", "and"])) == "(and (not duck) (or cat dog))"
+    assert canonical(parse_postfix(["cat", "dog", "nand"])) != canonical(parse_postfix(["dog", "cat", "nand"]))
+
+def test_cached_queries():
+    index = CountingIndex(TEST_INVERTED_INDEX_TYPE1)
+    cache = QueryCache()
+    postfix_query = ["squid", "cat", "dog", "or", "and"]
+    assert process_planned_query(postfix_query, index, cache=cache) == process_postfix_query(postfix_query, TEST_INVERTED_INDEX_TYPE1)
+    assert ("expression", "(or cat dog)") in cache and ("expression", "(and (or cat dog) squid)") in cache
+
+    # same query, operands in another order : no postings read
+    reads = index.reads
+    assert process_planned_query(["cat", "dog", "or", "squid", "and"], index, cache=cache) == [1, 2, 3]
+    assert index.reads == reads
+    assert cache.hits == 1
+
+    # a cached sub-expression is reused
+    assert process_planned_query(["dog", "cat", "or", "duck", "nand"], index, cache=cache) == [2, 3]
+    assert cache.hits == 2
+
+    # single term and negated queries
+    assert process_planned_query(["duck"], index, cache=cache) == [1, 5]
+    assert process_planned_query(["duck"], index, cache=cache) == [1, 5]
+    assert process_planned_query(["duck", "not"], index, [1, 2, 3, 4, 5, 6], cache=cache) == [2, 3, 4, 6]
+
+def test_retrieve_with_cache(monkeypatch):
+    inverted_index = InvertedIndex(1, CountingIndex(TEST_INVERTED_INDEX_TYPE1), {doc_id: f"doc {doc_id}" for doc_id in range(1, 7)}, None)
+    lemmatized = []
+    monkeypatch.setattr("interface.bool_query_to_postfix", lambda query, pos, tokenizer: lemmatized.append(query) or query.split())
+
+    cache = QueryCache()
+    assert retrieve_docs_from_bool_query("cat dog and", inverted_index, False, cache=cache) == ["doc 1", "doc 3"]
+    reads = inverted_index.index.reads
+    assert retrieve_docs_from_bool_query("cat dog and", inverted_index, False, cache=cache) == ["doc 1", "doc 3"]
+    assert lemmatized == ["cat dog and"]
+    assert inverted_index.index.reads == reads
+
+    # a new index invalidates the cache
+    other_index = InvertedIndex(1, CountingIndex(TEST_INVERTED_INDEX_TYPE1), inverted_index.mapping, None)
+    assert retrieve_docs_from_bool_query("cat dog and", other_index, False, cache=cache) == ["doc 1", "doc 3"]
+    assert lemmatized == ["cat dog and", "cat dog and"]
+    assert other_index.index.reads > 0
@@ -0,0 +1,140 @@
+from bool_query import LOGICAL_TOKENS, process_postfix_query
+from query_plan import Term, Operation, parse_postfix, estimate, plan, evaluate, process_planned_query, explain
+from compact_index import compact_index
+from mock_data import INVERTED_INDEX_1
+
+import random
+import pytest
+
+TEST_INVERTED_INDEX_TYPE1 = {
+    "cat": {1: True, 2: True, 3: True},
+    "dog": {1:True, 3:True, 5:True},
+    "duck": {1:True, 5:True},
+    "squid": {1:True, 2:True, 3:True, 6:True},
+    "whale": {7:True},
+}
+
+AND, OR, NAND, NOT = LOGICAL_TOKENS.AND, LOGICAL_TOKENS.OR, LOGICAL_TOKENS.NAND, LOGICAL_TOKENS.NOT
+
+ALL_DOC_IDS = [1, 2, 3, 4, 5, 6, 7]
+
+def test_parse_postfix():
+    # cat and dog and duck
+    assert parse_postfix(["cat", "dog", "and", "duck", "and"]) == Operation(AND, (Term("cat"), Term("dog"), Term("duck")))
+    # cat or (dog or duck) and squid
+    assert parse_postfix(["cat", "dog", "duck", "or", "squid", "and", "or"]) == Operation(OR, (
+        Term("cat"),
+        Operation(AND, (Operation(OR, (Term("dog"), Term("duck"))), Term("squid"))),
+    ))
+    # nand is not associative
+    assert parse_postfix(["cat", "dog", "nand", "duck", "nand"]) == Operation(NAND, (Operation(NAND, (Term("cat"), Term("dog"))), Term("duck")))
+
+    # not not cat and not dog
+    assert parse_postfix(["cat", "not", "not", "dog", "not", "and"]) == Operation(AND, (Term("cat"), Operation(NOT, (Term("dog"),))))
+
+    with pytest.raises(Exception):
+        parse_postfix(["cat", "dog", "lemu", "and"])
+    with pytest.raises(IndexError):
+        parse_postfix(["cat", "and"])
+
+def test_plan():
+    query = parse_postfix(["squid", "cat", "and", "duck", "and", "lemu", "dog", "or", "or"])
+    assert estimate(query, TEST_INVERTED_INDEX_TYPE1) == 2 + 0 + 3
+    assert plan(query, TEST_INVERTED_INDEX_TYPE1) == Operation(OR, (
+        Term("lemu"),
+        Operation(AND, (Term("duck"), Term("cat"), Term("squid"))),
+        Term("dog"),
+    ))
+
+def test_short_circuit():
+    # whale and cat is empty : squid is never read
+    query = plan(parse_postfix(["squid", "cat", "and", "whale", "and"]), TEST_INVERTED_INDEX_TYPE1)
+    trace = {}
+    assert list(evaluate(query, TEST_INVERTED_INDEX_TYPE1, trace)[0]) == []
+    assert [id(operand) in trace for operand in query.operands] == [True, True, False]
+    assert [len(trace[id(operand)][0]) for operand in query.operands[:2]] == [1, 3]
+
+    # the right side of a nand is only read if its left side has documents
+    query = parse_postfix(["lemu", "cat", "nand"])
+    trace = {}
+    assert list(evaluate(query, TEST_INVERTED_INDEX_TYPE1, trace)[0]) == []
+    assert id(query.operands[1]) not in trace
+
+    # the complemented operands of an and come last, and are not read if the others give no documents
+    query = plan(parse_postfix(["cat", "not", "whale", "and", "duck", "and"]), TEST_INVERTED_INDEX_TYPE1)
+    assert query == Operation(AND, (Term("whale"), Term("duck"), Operation(NOT, (Term("cat"),))))
+    trace = {}
+    assert evaluate(query, TEST_INVERTED_INDEX_TYPE1, trace) == ([], False)
+    assert id(query.operands[2]) not in trace
+
+def test_explain():
+    assert explain(["squid", "cat", "and", "whale", "and"], TEST_INVERTED_INDEX_TYPE1).split("\n") == [
+        "AND (estimated 1, actual 0)",
+        "  whale (estimated 1, actual 1)",
+        "  cat (estimated 3, actual 3)",
+        "  squid (estimated 4, not evaluated)",
+    ]
+
+def test_explain_not():
+    assert explain(["cat", "not", "dog", "not", "or"], TEST_INVERTED_INDEX_TYPE1).split("\n") == [
+        "OR (estimated all but 3, actual all but 2)",
+        "  NOT (estimated all but 3, actual all but 3)",
+        "    cat (estimated 3, actual 3)",
+        "  NOT (estimated all but 3, actual all but 3)",
+        "    dog (estimated 3, actual 3)",
+    ]
+
+def test_not():
+    for postfix_query, expected in (
+        (["cat", "dog", "not", "and"], [2]),
+        (["dog", "not", "cat", "and"], [2]),
+        (["cat", "not", "dog", "not", "or"], [2, 4, 5, 6, 7]),
+        (["cat", "not", "dog", "not", "and"], [4, 6, 7]),
+        (["duck", "cat", "not", "or"], [1, 4, 5, 6, 7]),
+        (["squid", "cat", "not", "nand"], [1, 2, 3]),
+        (["cat", "not"], [4, 5, 6, 7]),
+        (["lemu", "not"], ALL_DOC_IDS),
+        (["cat", "not", "not"], [1, 2, 3]),
+    ):
+        assert process_postfix_query(postfix_query, TEST_INVERTED_INDEX_TYPE1, ALL_DOC_IDS) == expected
+        assert process_planned_query(postfix_query, TEST_INVERTED_INDEX_TYPE1, ALL_DOC_IDS) == expected
+
+    # the documents of the collection are only needed for a negated query
+    assert process_planned_query(["cat", "dog", "not", "and"], TEST_INVERTED_INDEX_TYPE1) == [2]
+    with pytest.raises(Exception):
+        process_planned_query(["cat", "not"], TEST_INVERTED_INDEX_TYPE1)
+
+def random_postfix_query(terms):
+    postfix_query = [random.choice(terms)]
+    for _ in range(random.randint(0, 5)):
+        postfix_query += [random.choice(terms), random.choice(["and", "or", "nand"])]
+        if random.random() < 0.3:
+            postfix_query.append("not")
+    return postfix_query
+
+def test_planned_query_matches_postfix_query():
+    random.seed(0)
+    for inverted_index, all_doc_ids in (
+        (TEST_INVERTED_INDEX_TYPE1, ALL_DOC_IDS),
+        (INVERTED_INDEX_1.index, list(INVERTED_INDEX_1.mapping)),
+        (compact_index(INVERTED_INDEX_1).index, list(INVERTED_INDEX_1.mapping)),
+        (compact_index(INVERTED_INDEX_1, bitmap_density=0.3).index, list(INVERTED_INDEX_1.mapping)),
+    ):
+        terms = list(inverted_index) + ["lemu"]
+        for _ in range(300):
+            postfix_query = random_postfix_query(terms)
+            expected = sorted(set(all_doc_ids) & set(eval_with_sets(postfix_query, inverted_index, all_doc_ids)))
+            assert process_postfix_query(postfix_query, inverted_index, all_doc_ids) == expected
+            assert process_planned_query(postfix_query, inverted_index, all_doc_ids) == expected
+
+def eval_with_sets(postfix_query, inverted_index, all_doc_ids):
+    stack = []
+    for token in postfix_query:
+        if token == "not":
+            stack.append(set(all_doc_ids) - stack.pop())
+        elif token in ("and", "or", "nand"):
+            right, left = stack.pop(), stack.pop()
+            stack.append(left & right if token == "and" else left | right if token == "or" else left - right)
+        else:
+            stack.append(set(inverted_index[token]) if token in inverted_index else set())
+    return stack.pop()
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from server import QueryServer
+from client import SearchClient, ServerError
+from interface import retrieve_docs_from_bool_query, retrieve_docs_from_vectorial_query
+from mock_data import INVERTED_INDEX_2
+
+import pytest
+
+@pytest.fixture
+def query_server():
+    # the server runs its event loop in a thread, listening on a free loopback port
+    loop = asyncio.new_event_loop()
+    query_server = QueryServer(INVERTED_INDEX_2, pos=False, tokenizer="regex")
+    loop.run_until_complete(query_server.start("127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield query_server
+    asyncio.run_coroutine_threadsafe(query_server.close(), loop).result(timeout=10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=10)
+    loop.close()
+
+def test_queries(query_server):
+    client = SearchClient("127.0.0.1", query_server.port)
+    assert client.health() == {"status": "ok", "version": INVERTED_INDEX_2.version, "itype": 2}
+
+    # the same documents as interface.py, on a single connection
+    for query in ("dumb tests", "papers or students", "students not dumb"):
+        assert client.boolean(query) == retrieve_docs_from_bool_query(query, INVERTED_INDEX_2, False, "regex")
+    for engine in ("exhaustive", "maxscore", "numpy"):
+        assert client.vectorial("dumb tests about papers", number=3, engine=engine, weight_document="tf_idf_log_normalize") == \
+            retrieve_docs_from_vectorial_query("dumb tests about papers", INVERTED_INDEX_2, 3, False, "tf_idf", "tf_idf_log_normalize", "regex", engine)
+    client.close()
+
+def test_concurrent_clients(query_server):
+    expected = retrieve_docs_from_vectorial_query("dumb tests about papers", INVERTED_INDEX_2, 5, False, "tf_idf", "tf_idf_log_normalize", "regex")
+
+    def run_queries(_):
+        client = SearchClient("127.0.0.1", query_server.port)
+        results = [client.vectorial("dumb tests about papers", number=5, weight_document="tf_idf_log_normalize") for _ in range(10)]
+        client.close()
+        return results
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for results in executor.map(run_queries, range(8)):
+            assert results == [expected] * 10
+
+def test_errors(query_server):
+    client = SearchClient("127.0.0.1", query_server.port)
+    with pytest.raises(ServerError, match="404"):
+        client.request("GET", "/unknown")
+    with pytest.raises(ServerError, match="400"):
+        client.request("POST", "/boolean", {"not a query": "cats"})
+    with pytest.raises(ServerError, match="400"):
+        client.vectorial("cats", engine="unknown")
+    with pytest.raises(ServerError, match="500"):
+        # a failing query is reported to the client
+        client.vectorial("cats", number="ten")
+    # the connection is still usable after errors
+    assert client.health()["status"] == "ok"
+    client.close()
@@ -0,0 +1,41 @@
+from config import PATH_STOP_WORDS
+from preprocess import build_inverted_index
+from spimi import build_inverted_index_spimi, merge_runs, write_run
+from mock_data import COLLECTION
+
+from collections import OrderedDict
+
+import pytest
+
+@pytest.mark.parametrize(
+    "index_type",
+    [1, 2, 3],
+)
+@pytest.mark.parametrize(
+    "memory_budget",
+    # a tiny budget spills every document in its own run
+    [1e-6, 512],
+)
+def test_spimi_same_as_in_memory(index_type, memory_budget):
+    in_memory_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=index_type, pos=False, tokenizer="regex")
+    spimi_index = build_inverted_index_spimi(COLLECTION, PATH_STOP_WORDS, type_index=index_type, pos=False, memory_budget=memory_budget, tokenizer="regex")
+    assert list(spimi_index.index.keys()) == sorted(in_memory_index.index.keys())
+    assert dict(spimi_index.index) == dict(in_memory_index.index)
+    assert spimi_index.mapping == in_memory_index.mapping
+    assert spimi_index.stats == in_memory_index.stats
+
+def test_merge_runs(tmp_path):
+    runs = [
+        OrderedDict([("dog", OrderedDict([(0, 1)])), ("cat", OrderedDict([(1, 2)]))]),
+        OrderedDict([("cat", OrderedDict([(2, 1)])), ("duck", OrderedDict([(3, 1)]))]),
+        OrderedDict([("cat", OrderedDict([(4, 3)]))]),
+    ]
+    run_paths = []
+    for idx, run in enumerate(runs):
+        run_paths.append(str(tmp_path / f"run_{idx}"))
+        write_run(run, run_paths[-1])
+    assert list(merge_runs(run_paths)) == [
+        ("cat", OrderedDict([(1, 2), (2, 1), (4, 3)])),
+        ("dog", OrderedDict([(0, 1)])),
+        ("duck", OrderedDict([(3, 1)])),
+    ]
@@ -0,0 +1,42 @@
+import random
+
+from compact_index import compact_index
+from vectorial_query import WD_SCHEMES, get_scores, rank_scores
+from top_k import top_k_scores, benchmark_top_k
+from mock_data import INVERTED_INDEX_2, random_frequency_index
+
+import pytest
+
+@pytest.mark.parametrize(
+    "wd,wq",
+    [(wd, wq) for wd in WD_SCHEMES for wq in ("binary", "tf", "tf_idf")],
+)
+def test_top_k_matches_exhaustive_ranking(wd, wq):
+    inverted_index = random_frequency_index(300, 60, seed=0)
+    rng = random.Random(1)
+    for _ in range(30):
+        query = [f"term{rng.randint(0, 70)}" for _ in range(rng.randint(1, 5))]
+        scores = get_scores(query, inverted_index, wq, wd)
+        for k in (1, 3, 10, 1000):
+            assert top_k_scores(query, inverted_index, k, wq, wd) == rank_scores(scores, k)
+
+def test_top_k_on_fixtures():
+    query = ["dumb", "test", "query", "paper", "unknown"]
+    for k in (1, 2, 10):
+        expected = rank_scores(get_scores(query, INVERTED_INDEX_2, "tf_idf", "tf_idf_log_normalize"), k)
+        assert top_k_scores(query, INVERTED_INDEX_2, k, "tf_idf", "tf_idf_log_normalize") == expected
+        assert top_k_scores(query, compact_index(INVERTED_INDEX_2), k, "tf_idf", "tf_idf_log_normalize") == expected
+    assert top_k_scores(["unknown"], INVERTED_INDEX_2, 10, "tf_idf", "tf_idf_log_normalize") == []
+    assert top_k_scores(query, INVERTED_INDEX_2, 0, "tf_idf", "tf_idf_log_normalize") == []
+
+def test_top_k_prunes_postings():
+    inverted_index = random_frequency_index(2000, 200, seed=2)
+    # a rare term with common ones : the common terms become non-essential
+    query = ["term150", "term0", "term1", "term2"]
+    counters = {}
+    top_k_scores(query, inverted_index, 10, "tf_idf", "tf_idf_log_normalize", counters)
+    assert counters["postings"] < sum(len(inverted_index.index[term]) for term in query)
+
+    report = benchmark_top_k([query], inverted_index, ks=(10, 100))
+    assert [(row["k"], row["engine"]) for row in report] == [(10, "exhaustive"), (10, "maxscore"), (100, "exhaustive"), (100, "maxscore")]
+    assert report[1]["postings_per_query"] < report[0]["postings_per_query"]
@@ -0,0 +1,35 @@
+from config import PATH_STOP_WORDS
+from preprocess import build_inverted_index
+from compact_index import compact_index
+from vectorial_query import WD_SCHEMES, get_scores, rank_scores
+from vectorial_numpy import get_scores_array, top_k_scores
+from mock_data import COLLECTION, INVERTED_INDEX_2
+
+import pytest
+
+QUERIES = [
+    ["dumb", "test", "query"],
+    ["scientific", "paper", "medium"],
+    ["paper", "paper", "student", "unknown"],
+    ["unknown"],
+]
+
+@pytest.mark.parametrize(
+    "wd,wq",
+    [(wd, wq) for wd in WD_SCHEMES for wq in ("binary", "tf", "tf_idf")],
+)
+def test_same_scores_as_get_scores(wd, wq):
+    for query in QUERIES:
+        scores = get_scores(query, INVERTED_INDEX_2, wq, wd)
+        doc_ids, scores_array = get_scores_array(query, INVERTED_INDEX_2, wq, wd)
+        assert dict(zip(doc_ids.tolist(), scores_array.tolist())) == scores
+        for k in (1, 2, 3, 10):
+            assert top_k_scores(query, INVERTED_INDEX_2, k, wq, wd) == rank_scores(scores, k)
+
+def test_same_rankings_on_built_indexes():
+    inverted_index = build_inverted_index(COLLECTION, PATH_STOP_WORDS, type_index=2, pos=False, tokenizer="regex")
+    for index in (inverted_index, compact_index(inverted_index)):
+        for term in index.index:
+            query = [term, "dumb", "paper"]
+            expected = rank_scores(get_scores(query, index, "tf_idf", "tf_idf_log_normalize"), 5)
+            assert top_k_scores(query, index, 5, "tf_idf", "tf_idf_log_normalize") == expected
@@ -1,4 +1,7 @@
+import math
 import pytest
+from collections import Counter
+from dataclasses import replace
 import vectorial_query as vq 
 from mock_data import INVERTED_INDEX_2
 
@@ -15,3 +18,48 @@ def test_get_scores():
     test_query_2 = vq.lemmatize_query("dumb test query")
     scores = vq.get_scores(test_query_2, INVERTED_INDEX_2, "tf_idf", "tf_idf_log_normalize")
     assert scores[0] > scores[4]
+
+def brute_force_scores(query, inverted_index, wd):
+    # cosine between the tf-idf query and the full document vectors, term by term
+    index = inverted_index.index
+    stats = inverted_index.stats
+    idf = {term: math.log(stats.nb_docs/len(postings)) for term, postings in index.items()}
+    vectors = {}
+    for term, postings in index.items():
+        for doc_ID, tf in postings.items():
+            vectors.setdefault(doc_ID, {})[term] = vq.document_weight(wd, tf, idf[term], stats.doc_stats[doc_ID])
+    words = Counter(query)
+    query_vector = {term: words[term]*idf.get(term, 0) for term in words}
+    query_norm = math.sqrt(sum(weight**2 for weight in query_vector.values()))
+    scores = {}
+    for doc_ID, vector in vectors.items():
+        if any(term in vector for term in query_vector):
+            norm = math.sqrt(sum(weight**2 for weight in vector.values()))
+            scores[doc_ID] = sum(weight*vector.get(term, 0) for term, weight in query_vector.items())/(query_norm*norm)
+    return scores
+
+@pytest.mark.parametrize("wd", vq.WD_SCHEMES)
+def test_get_scores_precomputed(wd):
+    inverted_index = replace(INVERTED_INDEX_2, weights=None)
+    query = ["scientific", "paper", "medium", "paper", "unknown"]
+    expected = brute_force_scores(query, inverted_index, wd)
+    scores = vq.get_scores(query, inverted_index, "tf_idf", wd)
+    assert scores.keys() == expected.keys()
+    for doc_ID in expected:
+        assert scores[doc_ID] == pytest.approx(expected[doc_ID])
+    # the weights are computed once and kept in the index
+    assert list(inverted_index.weights.keys()) == [wd]
+    assert vq.get_scores(query, inverted_index, "tf_idf", wd) == scores
+
+def test_precompute_weights():
+    inverted_index = replace(INVERTED_INDEX_2, weights=None)
+    weights = vq.precompute_weights(inverted_index)
+    assert list(weights.keys()) == list(vq.WD_SCHEMES)
+    binary = weights["binary"]
+    for term, postings in inverted_index.index.items():
+        assert len(binary.impacts[term]) == len(postings)
+        assert binary.idf[term] == vq.get_idf(term, inverted_index.index, inverted_index.stats.nb_docs)
+    assert binary.norms[0] == pytest.approx(math.sqrt(inverted_index.stats.doc_stats[0]["unique"]))
+    # any other scheme falls back to tf_idf_log_normalize
+    inverted_index.weights = weights
+    assert vq.get_document_weights(inverted_index, "tf_idf") is weights["tf_idf_log_normalize"]